@@ -0,0 +1,241 @@
+"""Versioned cache of the rarely changing model instances.
+
+An instance is stored in CORE_MODEL_CACHE under its model, pk and version.
+The version of an instance is a random token replaced when the instance is
+saved or deleted, so the previous entries are never read again. A process
+wide LRU keep the last instances in front of the cache backend, its entries
+are trusted for CORE_MODEL_CACHE_CHECK_INTERVAL seconds before their
+version is checked again and dropped after CORE_MODEL_CACHE_LOCAL_TIMEOUT
+seconds.
+
+The versions bumped by a process are only seen by the others through
+CORE_MODEL_CACHE, it must be shared by the processes. The instances are not
+stored in a local memory cache, the LRU entries of a process then expire
+after CORE_MODEL_CACHE_LOCAL_TIMEOUT seconds whatever the other processes
+change."""
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import router, transaction
+from django.db.models import prefetch_related_objects
+from django.db.models.signals import post_delete, post_save
+
+KEY_PREFIX = "core-model"
+
+
+class ModelCache:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.models = set()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        # (model, pk): (version, instance, last check time, load time)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_cache(self):
+        return caches[getattr(settings, "CORE_MODEL_CACHE", "default")]
+
+    def get_timeout(self):
+        return getattr(settings, "CORE_MODEL_CACHE_TIMEOUT", 60 * 60)
+
+    def get_check_interval(self):
+        return getattr(settings, "CORE_MODEL_CACHE_CHECK_INTERVAL", 1.0)
+
+    def get_local_timeout(self):
+        return getattr(settings, "CORE_MODEL_CACHE_LOCAL_TIMEOUT", 60)
+
+    def register(self, *models):
+        """Cache the instances of the models and bump their version when
+        they are saved (soft delete included) or deleted."""
+        for model in models:
+            self.models.add(model)
+            uid = f"{KEY_PREFIX}:{model._meta.label_lower}"
+            post_save.connect(self._invalidate_instance, model, False, uid)
+            post_delete.connect(self._invalidate_instance, model, False, uid)
+
+    def _invalidate_instance(self, sender, instance, **kwargs):
+        self.invalidate(sender, [instance.pk])
+
+    def version_key(self, model, pk):
+        return f"{KEY_PREFIX}:{model._meta.label_lower}:{pk}:version"
+
+    def instance_key(self, model, pk, version):
+        return f"{KEY_PREFIX}:{model._meta.label_lower}:{pk}:{version}"
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.local_hits = self.shared_hits = self.misses = 0
+
+    def get(self, model, pk):
+        instance = self.get_many(model, [pk]).get(pk)
+        if instance is None:
+            raise model.DoesNotExist(
+                f"{model._meta.object_name} matching query does not exist."
+            )
+        return instance
+
+    def get_many(self, model, pks):
+        """Return a dict of the instances of the model by pk, the missing
+        ones are read with one query and cached."""
+        pks = set(pks)
+        result = {}
+        now = time.monotonic()
+        check_interval = self.get_check_interval()
+        local_timeout = self.get_local_timeout()
+        with self._lock:
+            for pk in pks:
+                entry = self._entries.get((model, pk))
+                if entry is None:
+                    continue
+                if now - entry[3] >= local_timeout:
+                    del self._entries[model, pk]
+                elif now - entry[2] < check_interval:
+                    self._entries.move_to_end((model, pk))
+                    result[pk] = entry[1]
+        self.local_hits += len(result)
+        pks -= result.keys()
+        if pks:
+            result.update(self._get_shared(model, pks, now))
+        return {pk: copy.copy(instance) for pk, instance in result.items()}
+
+    def _get_shared(self, model, pks, now):
+        cache = self.get_cache()
+        version_keys = {self.version_key(model, pk): pk for pk in pks}
+        versions = {
+            version_keys[key]: version
+            for key, version in cache.get_many(version_keys).items()
+        }
+        for pk in pks - versions.keys():
+            # never cached or evicted, start a new version
+            cache.add(self.version_key(model, pk), uuid.uuid4().hex, None)
+            versions[pk] = cache.get(self.version_key(model, pk))
+
+        result = {}
+        with self._lock:
+            for pk in pks:
+                entry = self._entries.get((model, pk))
+                if entry is not None and entry[0] == versions[pk]:
+                    # still valid, checked again after the check interval
+                    self._entries[model, pk] = (*entry[:2], now, entry[3])
+                    self._entries.move_to_end((model, pk))
+                    result[pk] = entry[1]
+        self.local_hits += len(result)
+        checked = set(result)
+        pks = pks - result.keys()
+        # the instances of a local memory cache would outlive the changes
+        # made by the other processes
+        shared_tier = not isinstance(cache, LocMemCache)
+
+        instance_keys = {
+            self.instance_key(model, pk, versions[pk]): pk for pk in pks
+        }
+        shared = cache.get_many(instance_keys) if shared_tier else {}
+        self.shared_hits += len(shared)
+        for key, instance in shared.items():
+            result[instance_keys[key]] = instance
+        pks = pks - result.keys()
+
+        if pks:
+            self.misses += len(pks)
+            instances = model._base_manager.in_bulk(pks)
+            if shared_tier:
+                cache.set_many(
+                    {
+                        self.instance_key(model, pk, versions[pk]): instance
+                        for pk, instance in instances.items()
+                    },
+                    self.get_timeout(),
+                )
+            result.update(instances)
+        self._put(
+            model,
+            {pk: (versions[pk], result[pk]) for pk in result.keys() - checked},
+        )
+        return result
+
+    def _put(self, model, entries):
+        now = time.monotonic()
+        with self._lock:
+            for pk, (version, instance) in entries.items():
+                self._entries[model, pk] = (version, instance, now, now)
+                self._entries.move_to_end((model, pk))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, model, pks):
+        """Bump the version of the instances, again after the commit so
+        a concurrent read can't cache the previous data."""
+
+        def bump():
+            with self._lock:
+                for pk in pks:
+                    self._entries.pop((model, pk), None)
+            self.get_cache().set_many(
+                {self.version_key(model, pk): uuid.uuid4().hex for pk in pks},
+                None,
+            )
+
+        pks = list(pks)
+        bump()
+        using = router.db_for_write(model)
+        if transaction.get_connection(using).in_atomic_block:
+            transaction.on_commit(bump, using=using)
+
+
+model_cache = ModelCache()
+
+
+def resolve_related(instances, *lookups):
+    """Set the related objects of the instances from the model cache.
+
+    A lookup is a foreign key name, or a path through foreign keys and
+    many relations ending with a foreign key, e.g. "order_lines__item".
+    The many relations are prefetched when they aren't already."""
+    for lookup in lookups:
+        objs = [obj for obj in instances if obj is not None]
+        *path, name = lookup.split("__")
+        for part in path:
+            if not objs:
+                break
+            field = objs[0]._meta.get_field(part)
+            if field.many_to_one or field.one_to_one:
+                objs = [getattr(obj, part) for obj in objs]
+            else:
+                prefetch_related_objects(objs, part)
+                objs = [
+                    related
+                    for obj in objs
+                    for related in getattr(obj, part).all()
+                ]
+        if not objs:
+            continue
+        field = objs[0]._meta.get_field(name)
+        missing = [obj for obj in objs if not field.is_cached(obj)]
+        if field.related_model not in model_cache.models:
+            prefetch_related_objects(missing, name)
+            continue
+        related = model_cache.get_many(
+            field.related_model,
+            {getattr(obj, field.attname) for obj in missing} - {None},
+        )
+        for obj in missing:
+            value = related.get(getattr(obj, field.attname))
+            if value is not None:
+                field.set_cached_value(obj, value)
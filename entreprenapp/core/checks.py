@@ -0,0 +1,39 @@
+"""System checks of the settings."""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+
+
+def check_shared_caches(*names):
+    """Return a warning for each cache setting, given as (name, default
+    alias), whose cache is local to the process: the entries invalidated
+    by a process would still be read by the others."""
+    warnings = []
+    for name, default in names:
+        alias = getattr(settings, name, default)
+        if isinstance(caches[alias], LocMemCache):
+            warnings.append(
+                Warning(
+                    f"{name} is the local memory cache {alias!r}, it isn't "
+                    "shared by the processes.",
+                    hint=(
+                        "Set REDIS_CACHE_URL or configure a shared cache in "
+                        "CACHES."
+                    ),
+                    id="core.W001",
+                )
+            )
+    return warnings
+
+
+@register(Tags.caches, deploy=True)
+def check_core_caches(app_configs, **kwargs):
+    return check_shared_caches(
+        ("CORE_MODEL_CACHE", "default"),
+        # the counts of the lists are invalidated by the writes of any worker
+        ("CORE_LIST_COUNT_CACHE", "default"),
+        # the discuss app has no app config, its chat metrics are added up
+        # by every worker
+        ("CHAT_METRICS_CACHE", "default"),
+    )
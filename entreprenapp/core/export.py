@@ -0,0 +1,227 @@
+"""Streaming CSV and XLSX export of the list views.
+
+The rows are read with QuerySet.iterator, a server side cursor where the
+database has them, and written to the response chunk by chunk, so the
+memory used by an export doesn't depend on its number of rows.
+
+The XLSX workbook is written with zipfile, one sheet of inline strings
+and numbers without styles, the dates are written as ISO strings."""
+import csv
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.text import capfirst, slugify
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": (
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    ),
+}
+
+# a spreadsheet runs a cell starting with one of them as a formula
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+# the control characters XML 1.0 doesn't allow
+_ILLEGAL_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_XLSX_FILES = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/'
+        'content-types">'
+        '<Default Extension="rels" ContentType="application/'
+        'vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType='
+        '"application/vnd.openxmlformats-officedocument.spreadsheetml.'
+        'worksheet+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/'
+        '2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/'
+        '2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        "</Relationships>"
+    ),
+}
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/'
+    '2006/main" xmlns:r="http://schemas.openxmlformats.org/'
+    'officeDocument/2006/relationships">'
+    '<sheets><sheet name="{}" sheetId="1" r:id="rId1"/></sheets>'
+    "</workbook>"
+)
+
+
+def get_chunk_size():
+    return getattr(settings, "CORE_EXPORT_CHUNK_SIZE", 2000)
+
+
+def field_label(model, name):
+    """Return the header of a field name, a lookup like saler__name or an
+    annotation."""
+    labels = []
+    opts = model._meta
+    for part in name.split("__"):
+        try:
+            field = opts.get_field(part)
+        except FieldDoesNotExist:
+            labels.append(part.replace("_", " "))
+            break
+        labels.append(str(getattr(field, "verbose_name", part)))
+        if not field.is_relation:
+            break
+        opts = field.related_model._meta
+    return capfirst(" ".join(labels))
+
+
+def to_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        value = (
+            timezone.localtime(value) if timezone.is_aware(value) else value
+        )
+        return value.isoformat(sep=" ", timespec="seconds")
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_cell(value):
+    text = to_text(value)
+    if isinstance(value, str) and text.startswith(_FORMULA_PREFIXES):
+        return f"'{text}"
+    return text
+
+
+class _Echo:
+    """File object returning what is written, see csv.writer.writerow"""
+
+    def write(self, data):
+        return data
+
+
+class ZipBuffer:
+    """Unseekable file object that keep the written bytes until read, to
+    stream a zip archive."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def read(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_csv(header, rows, chunk_size=None):
+    """Yield the header and the rows as CSV, chunk_size rows at a time."""
+    chunk_size = chunk_size or get_chunk_size()
+    writer = csv.writer(_Echo())
+    lines = [writer.writerow(header)]
+    for row in rows:
+        lines.append(writer.writerow([_csv_cell(value) for value in row]))
+        if len(lines) >= chunk_size:
+            yield "".join(lines)
+            lines = []
+    yield "".join(lines)
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return "<c/>"
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f"<c><v>{value}</v></c>"
+    text = escape(_ILLEGAL_XML.sub("", to_text(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(row):
+    return f"<row>{''.join(_xlsx_cell(value) for value in row)}</row>"
+
+
+def stream_xlsx(header, rows, sheet_name="Sheet1", chunk_size=None):
+    """Yield a workbook of one sheet with the header and the rows,
+    chunk_size rows at a time."""
+    chunk_size = chunk_size or get_chunk_size()
+    buffer = ZipBuffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_FILES.items():
+            archive.writestr(name, content)
+        # the sheet name can't have []:*?/\ nor more than 31 characters
+        sheet_name = re.sub(r"[\[\]:*?/\\]", " ", sheet_name)[:31]
+        archive.writestr(
+            "xl/workbook.xml",
+            _WORKBOOK.format(escape(sheet_name, {'"': "&quot;"})),
+        )
+        # the size of the sheet is unknown until the last row
+        with archive.open(
+            "xl/worksheets/sheet1.xml", "w", force_zip64=True
+        ) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/'
+                b'spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(header).encode())
+            for index, row in enumerate(rows, 1):
+                sheet.write(_xlsx_row(row).encode())
+                if index % chunk_size == 0:
+                    yield buffer.read()
+            sheet.write(b"</sheetData></worksheet>")
+    yield buffer.read()
+
+
+def export_response(queryset, fields, export_format, chunk_size=None):
+    """Return a streaming response of the fields of the queryset rows in
+    export_format ("csv" or "xlsx")."""
+    chunk_size = chunk_size or get_chunk_size()
+    model = queryset.model
+    header = [field_label(model, name) for name in fields]
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+    name = str(model._meta.verbose_name_plural)
+    if export_format == "xlsx":
+        content = stream_xlsx(header, rows, capfirst(name), chunk_size)
+    else:
+        content = stream_csv(header, rows, chunk_size)
+    response = StreamingHttpResponse(
+        content, content_type=CONTENT_TYPES[export_format]
+    )
+    file_name = f"{slugify(name)}-{timezone.localdate():%Y-%m-%d}"
+    response[
+        "Content-Disposition"
+    ] = f"attachment; filename={file_name}.{export_format}"
+    return response
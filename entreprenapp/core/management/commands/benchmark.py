@@ -0,0 +1,305 @@
+import asyncio
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+import django
+from discuss.consumer import ChatConsumer
+from discuss.metrics import chat_metrics
+from discuss.models import ChatMessage, Room
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from sales import pdf
+from sales.bulk import convert_estimates
+from sales.models import Customer, Estimate, Invoice, Item, Saler
+
+from ...profiling import profile_queries
+
+USER_EMAIL = "benchmark@example.com"
+FANOUT_ROOM = "benchmark-fanout"
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _send(text_data=None, bytes_data=None, close=False):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the list, detail, pdf, create and update views of the sales "
+        "documents, the conversion of estimates into invoices and the chat "
+        "fan-out on the current database, write the results as JSON to "
+        "compare them across commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=10,
+            help="Number of timed runs of each case (default: 10).",
+        )
+        parser.add_argument(
+            "--only",
+            nargs="+",
+            help="Name of the cases to run, all by default.",
+        )
+        parser.add_argument(
+            "--fanout-size",
+            type=int,
+            default=100,
+            help="Number of consumers of the chat fan-out (default: 100).",
+        )
+        parser.add_argument(
+            "--convert-size",
+            type=int,
+            default=100,
+            help="Number of estimates turned into invoices (default: 100).",
+        )
+        parser.add_argument("--output", help="Write the results to a file.")
+        parser.add_argument(
+            "--compare", help="Results file of a previous run to compare to."
+        )
+
+    def handle(self, *args, **options):
+        invoice = Invoice.objects.filter(is_active=True).last()
+        estimate = Estimate.objects.filter(is_active=True).last()
+        if invoice is None or estimate is None:
+            raise CommandError("No documents, run seed_data first")
+        self.client = Client()
+        self.client.force_login(self.get_user())
+        self.fanout_size = options["fanout_size"]
+        self.convert_size = options["convert_size"]
+        cases = self.get_cases(invoice, estimate)
+        if options["only"]:
+            unknown = set(options["only"]) - cases.keys()
+            if unknown:
+                raise CommandError(f"Unknown case(s): {', '.join(unknown)}")
+            cases = {name: cases[name] for name in options["only"]}
+
+        previous = {}
+        if options["compare"]:
+            with open(options["compare"]) as previous_file:
+                previous = json.load(previous_file)["results"]
+        results = {}
+        self.stdout.write(
+            f"{'case':<22}{'median ms':>11}{'p95 ms':>10}{'min ms':>10}"
+            f"{'queries':>9}{'change':>9}"
+        )
+        # DEBUG would keep every query and profile the requests
+        with override_settings(DEBUG=False, CORE_QUERY_PROFILING=False):
+            for name, case in cases.items():
+                results[name] = result = self.measure(case, options["repeat"])
+                change = ""
+                if name in previous:
+                    before = previous[name]["median_ms"]
+                    change = f"{(result['median_ms'] - before) / before:+.0%}"
+                self.stdout.write(
+                    f"{name:<22}{result['median_ms']:>11.2f}"
+                    f"{result['p95_ms']:>10.2f}{result['min_ms']:>10.2f}"
+                    f"{result['queries']:>9}{change:>9}"
+                )
+        chat_metrics.reset([FANOUT_ROOM])
+
+        if options["output"]:
+            report = {
+                "commit": git_commit(),
+                "date": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "rows": {
+                    model._meta.label_lower: model.objects.count()
+                    for model in (
+                        Saler,
+                        Customer,
+                        Item,
+                        Estimate,
+                        Invoice,
+                        ChatMessage,
+                    )
+                },
+                "repeat": options["repeat"],
+                "results": results,
+            }
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(
+                self.style.SUCCESS(f"Results written to {options['output']}")
+            )
+
+    def get_user(self):
+        user, created = get_user_model().objects.get_or_create(
+            email=USER_EMAIL
+        )
+        if created:
+            user.set_unusable_password()
+            user.save()
+        return user
+
+    def measure(self, case, repeat):
+        """Run the case once to warm the caches then repeat times, return
+        the timings in ms and the number of queries of the last run."""
+        case()
+        timings = []
+        for _ in range(repeat):
+            with profile_queries() as profile:
+                start = time.perf_counter()
+                case()
+                timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return {
+            "runs": repeat,
+            "min_ms": round(timings[0], 3),
+            "median_ms": round(statistics.median(timings), 3),
+            "p95_ms": round(timings[int(0.95 * (repeat - 1))], 3),
+            "mean_ms": round(statistics.mean(timings), 3),
+            "queries": profile.count,
+        }
+
+    def get(self, url, data=None):
+        def case():
+            response = self.client.get(url, data)
+            if response.status_code != 200:
+                raise CommandError(f"GET {url}: {response.status_code}")
+
+        return case
+
+    def post(self, url, data):
+        def case():
+            # the changes are rolled back, every run writes the same data
+            with transaction.atomic():
+                response = self.client.post(url, data)
+                transaction.set_rollback(True)
+            if response.status_code != 302:
+                raise CommandError(f"POST {url}: {response.status_code}")
+
+        return case
+
+    def document_data(self, document):
+        data = {
+            "saler": document.saler_id,
+            "customer": document.customer_id,
+            "date": document.date.isoformat(),
+        }
+        if isinstance(document, Invoice):
+            data["is_paid"] = document.is_paid
+        else:
+            data["validity_date"] = document.validity_date.isoformat()
+        return data
+
+    def formset_data(self, order_lines, initial=False):
+        data = {
+            "form-TOTAL_FORMS": len(order_lines),
+            "form-INITIAL_FORMS": len(order_lines) if initial else 0,
+            "form-MIN_NUM_FORMS": 1,
+        }
+        for index, order_line in enumerate(order_lines):
+            data[f"form-{index}-item"] = order_line.item_id
+            data[f"form-{index}-quantity"] = order_line.quantity
+            if initial:
+                data[f"form-{index}-id"] = order_line.pk
+        return data
+
+    def get_cases(self, invoice, estimate):
+        order_lines = list(estimate.order_lines.all())
+        customer = Customer.objects.filter(is_active=True).first()
+        update_url = reverse("sales:estimate_update", args=[estimate.pk])
+        return {
+            "invoice_list": self.get(reverse("sales:invoice_list")),
+            "invoice_list_last": self.get(
+                reverse("sales:invoice_list"), {"page": "last"}
+            ),
+            "estimate_list": self.get(reverse("sales:estimate_list")),
+            "customer_list": self.get(reverse("sales:customer_list")),
+            "customer_search": self.get(
+                reverse("sales:customer_list"),
+                {"q": customer.name.split()[0] if customer else "a"},
+            ),
+            "invoice_detail": self.get(
+                reverse("sales:invoice_detail", args=[invoice.pk])
+            ),
+            "estimate_detail": self.get(
+                reverse("sales:estimate_detail", args=[estimate.pk])
+            ),
+            "invoice_pdf": lambda: pdf.render_pdf(invoice, in_process=True),
+            "estimate_create_page": self.get(reverse("sales:estimate_create")),
+            "estimate_create": self.post(
+                reverse("sales:estimate_create"),
+                {
+                    **self.document_data(estimate),
+                    **self.formset_data(order_lines),
+                },
+            ),
+            "estimate_update_page": self.get(update_url),
+            "estimate_update": self.post(
+                update_url,
+                {
+                    **self.document_data(estimate),
+                    **self.formset_data(order_lines, initial=True),
+                },
+            ),
+            "estimate_convert": self.convert(),
+            "chat_fanout": self.chat_fanout(),
+        }
+
+    def convert(self):
+        """Turn the convert_size last estimates into invoices"""
+        pks = list(
+            Estimate.objects.filter(is_active=True)
+            .order_by("-pk")
+            .values_list("pk", flat=True)[: self.convert_size]
+        )
+
+        def case():
+            # rolled back like the POST cases
+            with transaction.atomic():
+                convert_estimates(Estimate.objects.filter(pk__in=pks))
+                transaction.set_rollback(True)
+
+        return case
+
+    def chat_fanout(self):
+        """Deliver a message to fanout_size consumers of a room"""
+        chat_message = ChatMessage(
+            room=Room(name=FANOUT_ROOM),
+            author=get_user_model()(first_name="Bob", last_name="Zac"),
+            message="Hello people " * 10,
+            date_time=timezone.now(),
+        )
+        consumers = []
+        for _ in range(self.fanout_size):
+            consumer = ChatConsumer()
+            consumer.room_name = FANOUT_ROOM
+            consumer.send = _send
+            consumers.append(consumer)
+
+        async def broadcast():
+            frame = json.dumps(chat_message.to_json(), separators=(",", ":"))
+            event = {
+                "type": "chat_message",
+                "text": frame,
+                "size": len(frame.encode()),
+                "sent_at": time.time(),
+            }
+            for consumer in consumers:
+                await consumer.chat_message(event)
+
+        return lambda: asyncio.run(broadcast())
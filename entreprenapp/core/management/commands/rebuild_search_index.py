@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ... import search
+from ...models import SearchEntry
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search index of every searchable model."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        for model in search.registry:
+            with transaction.atomic():
+                SearchEntry.objects.filter(
+                    model=model._meta.label_lower
+                ).delete()
+                count = search.reindex(
+                    model._base_manager.all(), options["batch_size"]
+                )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{count} {model._meta.verbose_name_plural} indexed"
+                )
+            )
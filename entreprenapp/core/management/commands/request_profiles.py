@@ -0,0 +1,78 @@
+from io import StringIO
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...profiling import delete_profile, list_profiles, load_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "List the stored request profiles, or summarize the functions of "
+        "one of them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "profile_id", nargs="?", help="Id of the profile to summarize."
+        )
+        parser.add_argument(
+            "--sort",
+            default="cumulative",
+            help="pstats sort key of the functions (default: cumulative).",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=30,
+            help="Number of functions shown (default: 30).",
+        )
+        parser.add_argument(
+            "--clear", action="store_true", help="Remove every profile."
+        )
+
+    def handle(self, *args, **options):
+        profiles = list_profiles()
+        if options["clear"]:
+            for profile in profiles:
+                delete_profile(profile["id"])
+            self.stdout.write(
+                self.style.SUCCESS(f"{len(profiles)} profiles removed")
+            )
+            return
+        if options["profile_id"]:
+            self.summarize(profiles, options)
+            return
+        self.stdout.write(
+            f"{'id':<32}{'status':>7}{'wall ms':>10}{'cpu ms':>10}"
+            f"{'queries':>9}{'db ms':>9}  url"
+        )
+        for profile in profiles:
+            self.stdout.write(
+                f"{profile['id']:<32}{profile['status']:>7}"
+                f"{profile['wall_time'] * 1000:>10.1f}"
+                f"{profile['cpu_time'] * 1000:>10.1f}"
+                f"{profile.get('queries', '-'):>9}"
+                f"{profile.get('db_time', 0) * 1000:>9.1f}"
+                f"  {profile['method']} {profile['url']}"
+            )
+
+    def summarize(self, profiles, options):
+        info = next(
+            (p for p in profiles if p["id"] == options["profile_id"]), None
+        )
+        if info is None:
+            raise CommandError(f"Unknown profile {options['profile_id']}")
+        self.stdout.write(
+            f"{info['method']} {info['url']} by {info['user']} on "
+            f"{info['date']}: {info['status']}, "
+            f"{info['wall_time'] * 1000:.1f}ms wall, "
+            f"{info['cpu_time'] * 1000:.1f}ms cpu"
+        )
+        output = StringIO()
+        stats = load_stats(info["id"], stream=output).strip_dirs()
+        try:
+            stats.sort_stats(options["sort"])
+        except KeyError:
+            raise CommandError(f"Unknown sort key {options['sort']}")
+        stats.print_stats(options["limit"])
+        self.stdout.write(output.getvalue())
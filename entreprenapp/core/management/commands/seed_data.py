@@ -0,0 +1,63 @@
+import random
+import time
+
+from discuss.seed import seed_chat
+from django.core.management.base import BaseCommand, CommandError
+from sales.seed import seed_sales
+
+
+class Command(BaseCommand):
+    help = (
+        "Create synthetic salers, customers, items, estimates, invoices "
+        "and chat history with bulk inserts."
+    )
+
+    def add_arguments(self, parser):
+        for name, default, help_text in (
+            ("salers", 10, "Number of salers."),
+            ("customers", 1000, "Number of customers."),
+            ("items", 200, "Number of items."),
+            ("estimates", 1000, "Number of estimates."),
+            ("invoices", 1000, "Number of invoices."),
+            ("order-lines", 5, "Number of order lines per document."),
+            ("rooms", 5, "Number of chat rooms."),
+            ("messages", 10000, "Number of chat messages."),
+            ("users", 20, "Number of chat users."),
+            ("batch-size", 1000, "Number of rows per bulk insert."),
+        ):
+            parser.add_argument(
+                f"--{name}", type=int, default=default, help=help_text
+            )
+        parser.add_argument(
+            "--seed", type=int, help="Seed of the random data generator."
+        )
+
+    def handle(self, *args, **options):
+        if min(options["order_lines"], options["batch_size"]) < 1:
+            raise CommandError("--order-lines and --batch-size must be >= 1")
+        rng = random.Random(options["seed"])
+        start = time.perf_counter()
+        created = seed_sales(
+            salers=options["salers"],
+            customers=options["customers"],
+            items=options["items"],
+            estimates=options["estimates"],
+            invoices=options["invoices"],
+            order_lines=options["order_lines"],
+            batch_size=options["batch_size"],
+            rng=rng,
+        )
+        created.update(
+            seed_chat(
+                rooms=options["rooms"],
+                messages=options["messages"],
+                users=options["users"],
+                batch_size=options["batch_size"],
+                rng=rng,
+            )
+        )
+        for model, count in created.items():
+            self.stdout.write(f"{count} {model._meta.verbose_name_plural}")
+        self.stdout.write(
+            self.style.SUCCESS(f"Seeded in {time.perf_counter() - start:.1f}s")
+        )
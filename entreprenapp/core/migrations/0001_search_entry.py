@@ -0,0 +1,108 @@
+# Generated by Django 4.1.13 on 2026-10-18 13:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+# frozen copy of the DDL of the core.search backends
+INSTALL_SQL = {
+    "fts5": [
+        "CREATE VIRTUAL TABLE core_searchentry_fts USING fts5("
+        "body, content='core_searchentry', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        "CREATE TRIGGER core_searchentry_ai AFTER INSERT ON core_searchentry "
+        "BEGIN INSERT INTO core_searchentry_fts(rowid, body) "
+        "VALUES (new.id, new.body); END",
+        "CREATE TRIGGER core_searchentry_ad AFTER DELETE ON core_searchentry "
+        "BEGIN INSERT INTO core_searchentry_fts(core_searchentry_fts, rowid, "
+        "body) VALUES ('delete', old.id, old.body); END",
+        "CREATE TRIGGER core_searchentry_au AFTER UPDATE ON core_searchentry "
+        "BEGIN INSERT INTO core_searchentry_fts(core_searchentry_fts, rowid, "
+        "body) VALUES ('delete', old.id, old.body); "
+        "INSERT INTO core_searchentry_fts(rowid, body) "
+        "VALUES (new.id, new.body); END",
+        "INSERT INTO core_searchentry_fts(core_searchentry_fts) "
+        "VALUES ('rebuild')",
+    ],
+    "tsvector": [
+        "ALTER TABLE core_searchentry ADD COLUMN body_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED",
+        "CREATE INDEX core_searchentry_vector_idx "
+        "ON core_searchentry USING GIN (body_vector)",
+    ],
+}
+
+UNINSTALL_SQL = {
+    "fts5": [
+        "DROP TRIGGER IF EXISTS core_searchentry_ai",
+        "DROP TRIGGER IF EXISTS core_searchentry_ad",
+        "DROP TRIGGER IF EXISTS core_searchentry_au",
+        "DROP TABLE IF EXISTS core_searchentry_fts",
+    ],
+    "tsvector": [
+        "DROP INDEX IF EXISTS core_searchentry_vector_idx",
+        "ALTER TABLE core_searchentry DROP COLUMN IF EXISTS body_vector",
+    ],
+}
+
+VENDOR_BACKENDS = {"sqlite": "fts5", "postgresql": "tsvector"}
+
+
+def get_backend(connection):
+    backends = getattr(settings, "SEARCH_BACKENDS", {})
+    return backends.get(
+        connection.alias, VENDOR_BACKENDS.get(connection.vendor, "database")
+    )
+
+
+def install_search_backend(apps, schema_editor):
+    for sql in INSTALL_SQL.get(get_backend(schema_editor.connection), []):
+        schema_editor.execute(sql)
+
+
+def uninstall_search_backend(apps, schema_editor):
+    for sql in UNINSTALL_SQL.get(get_backend(schema_editor.connection), []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "model",
+                    models.CharField(max_length=100, verbose_name="model"),
+                ),
+                (
+                    "object_id",
+                    models.PositiveBigIntegerField(verbose_name="object id"),
+                ),
+                ("body", models.TextField(verbose_name="body")),
+            ],
+            options={
+                "verbose_name": "Search entry",
+                "verbose_name_plural": "Search entries",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="searchentry",
+            constraint=models.UniqueConstraint(
+                fields=("model", "object_id"), name="core_search_entry_unique"
+            ),
+        ),
+        migrations.RunPython(install_search_backend, uninstall_search_backend),
+    ]
@@ -39,3 +39,23 @@ class Core(models.Model):
 
     class Meta:
         abstract = True
+
+
+class SearchEntry(models.Model):
+    """Indexed text of an instance of a searchable model, see core.search"""
+
+    model = models.CharField(_("model"), max_length=100)
+    object_id = models.PositiveBigIntegerField(_("object id"))
+    body = models.TextField(_("body"))
+
+    def __str__(self):
+        return f"{self.model} {self.object_id}"
+
+    class Meta:
+        verbose_name = _("Search entry")
+        verbose_name_plural = _("Search entries")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["model", "object_id"], name="core_search_entry_unique"
+            )
+        ]
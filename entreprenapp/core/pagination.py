@@ -0,0 +1,238 @@
+"""Keyset pagination of the list views.
+
+A page is read after (or before) the ordering key of the last (or first)
+row of the page the user comes from, with the index matching the model
+ordering, instead of an OFFSET growing with the page number. The pages
+near the current one are read from its key with a small offset, the last
+page is read backwards from the end.
+
+The number of pages comes from a count cached for CORE_LIST_COUNT_TIMEOUT
+seconds. The cached counts of a registered model (see register) are
+dropped when one of its instances is saved or deleted, a bulk change
+calls invalidate_counts or shows up after the timeout."""
+import base64
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+
+KEY_PREFIX = "core-list-count"
+
+
+def get_cache():
+    return caches[getattr(settings, "CORE_LIST_COUNT_CACHE", "default")]
+
+
+def _version_key(model):
+    return f"{KEY_PREFIX}:{model._meta.label_lower}:version"
+
+
+def invalidate_counts(model):
+    get_cache().set(_version_key(model), uuid.uuid4().hex, None)
+
+
+def _invalidate_counts(sender, **kwargs):
+    invalidate_counts(sender)
+
+
+def register(*models):
+    """Drop the cached counts of the models when one of their instances is
+    saved or deleted, in every process."""
+    for model in models:
+        uid = f"{KEY_PREFIX}:{model._meta.label_lower}"
+        post_save.connect(_invalidate_counts, model, False, uid)
+        post_delete.connect(_invalidate_counts, model, False, uid)
+
+
+def cached_count(queryset):
+    """Return the count of the queryset, cached per model version and
+    SQL query."""
+    model = queryset.model
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    cache = get_cache()
+    cache.add(_version_key(model), uuid.uuid4().hex, None)
+    version = cache.get(_version_key(model))
+    digest = hashlib.md5(
+        f"{queryset.db}:{sql}:{params!r}".encode(), usedforsecurity=False
+    ).hexdigest()
+    key = f"{KEY_PREFIX}:{model._meta.label_lower}:{version}:{digest}"
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, getattr(settings, "CORE_LIST_COUNT_TIMEOUT", 60))
+    return count
+
+
+def get_ordering(queryset):
+    """Return the ordering of the queryset as (field name, descending)
+    tuples ended by the primary key, or None when it isn't made of
+    local fields only."""
+    opts = queryset.model._meta
+    ordering = []
+    for name in queryset.query.order_by or opts.ordering:
+        if not isinstance(name, str) or "__" in name or name == "?":
+            return None
+        descending = name.startswith("-")
+        name = name.lstrip("-")
+        try:
+            field = opts.pk if name == "pk" else opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if not field.concrete or field.is_relation:
+            return None
+        ordering.append((field.attname, descending))
+    if opts.pk.attname not in [name for name, _ in ordering]:
+        descending = ordering[-1][1] if ordering else False
+        ordering.append((opts.pk.attname, descending))
+    return ordering
+
+
+def encode_cursor(anchor, after, values):
+    data = json.dumps(
+        [anchor, after, values],
+        default=lambda value: (
+            value.isoformat() if hasattr(value, "isoformat") else str(value)
+        ),
+    )
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the (anchor page number, after, key values) of a cursor,
+    raise ValueError when the cursor is not valid."""
+    try:
+        anchor, after, values = json.loads(base64.urlsafe_b64decode(cursor))
+    except (TypeError, ValueError) as error:
+        raise ValueError("Invalid cursor") from error
+    if not isinstance(anchor, int) or not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return anchor, bool(after), values
+
+
+def key_filter(ordering, values, after=True):
+    """Return the Q of the rows after (or before) the key values."""
+    if len(values) != len(ordering):
+        raise ValueError("Invalid cursor")
+    condition = Q()
+    for index, (name, descending) in enumerate(ordering):
+        lookup = "lt" if descending == after else "gt"
+        condition |= Q(
+            *(Q(**{n: v}) for (n, _), v in zip(ordering, values[:index])),
+            **{f"{name}__{lookup}": values[index]},
+        )
+    return condition
+
+
+class KeysetPage(Page):
+    def __init__(self, object_list, number, paginator, has_next, has_previous):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def _cursor(self, obj, after):
+        values = [getattr(obj, name) for name, _ in self.paginator.ordering]
+        if None in values:
+            # a null can't be compared, the page is read with an offset
+            return None
+        return encode_cursor(self.number, after, values)
+
+    @cached_property
+    def next_cursor(self):
+        if self.object_list and self.has_next():
+            return self._cursor(self.object_list[-1], True)
+
+    @cached_property
+    def previous_cursor(self):
+        if self.object_list and self.has_previous():
+            return self._cursor(self.object_list[0], False)
+
+
+class KeysetPaginator(Paginator):
+    """Paginator reading the pages from the ordering key of a page given
+    by a cursor (see KeysetPage.next_cursor and previous_cursor)."""
+
+    def __init__(self, object_list, per_page, ordering, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.ordering = ordering
+
+    @cached_property
+    def count(self):
+        return cached_count(self.object_list)
+
+    def page(self, number, cursor=None):
+        number = self.validate_number(number)
+        queryset = self.object_list
+        limit = self.per_page
+        offset = 0
+        backwards = False
+        anchor, after, values = cursor or (None, None, None)
+        if cursor is not None and after and number > anchor:
+            queryset = queryset.filter(key_filter(self.ordering, values))
+            offset = (number - anchor - 1) * self.per_page
+        elif cursor is not None and not after and number < anchor:
+            queryset = queryset.filter(
+                key_filter(self.ordering, values, after=False)
+            )
+            offset = (anchor - number - 1) * self.per_page
+            backwards = True
+        elif number > 1 and number == self.num_pages:
+            limit = self.count - (number - 1) * self.per_page
+            backwards = True
+        else:
+            offset = (number - 1) * self.per_page
+        if backwards:
+            queryset = queryset.order_by(
+                *(name if desc else f"-{name}" for name, desc in self.ordering)
+            )
+        # one more row tells if there is a page after this one
+        stop = offset + limit + 1
+        object_list = list(queryset[offset:stop])
+        more = len(object_list) > limit
+        object_list = object_list[:limit]
+        if not object_list and number > 1:
+            raise EmptyPage(_("That page contains no results"))
+        if backwards:
+            object_list.reverse()
+            has_next = cursor is not None or number < self.num_pages
+            has_previous = more
+        else:
+            has_next = more
+            has_previous = number > 1
+        if number > self.num_pages:
+            # the cached count is behind
+            self.num_pages = number
+        return KeysetPage(object_list, number, self, has_next, has_previous)
+
+    def validate_number(self, number):
+        # the cached count can be behind, a page after the last one is
+        # only missing when it has no rows
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(_("That page number is not an integer"))
+        if number < 1:
+            raise EmptyPage(_("That page number is less than 1"))
+        return number
@@ -0,0 +1,248 @@
+"""SQL and CPU profiling of the requests.
+
+QueryProfile records the queries run on every database while it is
+active: their number, their time and their fingerprint, the SQL with the
+literals replaced by "?". A fingerprint repeated by a request is the sign
+of an N+1, e.g. a related object read for every row of a list.
+
+In DEBUG or with CORE_QUERY_PROFILING, QueryProfilingMiddleware profiles
+every request, adds a Server-Timing header and logs a warning when a
+request goes over CORE_QUERY_BUDGET. QueryBudgetMixin does the same check
+in the tests.
+
+CPUProfilingMiddleware runs a request of a superuser under cProfile when
+it has the profile parameter (?profile=1) or the X-Profile header. The
+stats are stored in CORE_PROFILE_DIR with the URL and the timings of the
+request, see the request_profiles command."""
+import cProfile
+import json
+import logging
+import pstats
+import re
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGET = {"queries": 30, "time": 0.2, "similar": 5}
+
+_FINGERPRINT_PATTERNS = (
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"%s"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(...)"),
+    (re.compile(r"\s+"), " "),
+)
+
+
+def fingerprint(sql):
+    """Return the SQL with its literals and parameters replaced by "?"
+    and the lists of values by "(...)"."""
+    for pattern, replacement in _FINGERPRINT_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def get_budget():
+    return {**DEFAULT_BUDGET, **getattr(settings, "CORE_QUERY_BUDGET", {})}
+
+
+class QueryProfile:
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.fingerprints = Counter()
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+            self.statements[sql, repr(params)] += 1
+
+    def similar(self, threshold=2):
+        """Return the (fingerprint, count) run at least threshold times,
+        most repeated first."""
+        return [
+            (sql, count)
+            for sql, count in self.fingerprints.most_common()
+            if count >= threshold
+        ]
+
+    def duplicates(self):
+        """Return the (sql, count) run more than once with the same
+        parameters, most repeated first."""
+        return [
+            (sql, count)
+            for (sql, _), count in self.statements.most_common()
+            if count > 1
+        ]
+
+    def over_budget(self, queries=None, time=None, similar=None):
+        """Return the descriptions of the limits exceeded by the profile."""
+        errors = []
+        if queries is not None and self.count > queries:
+            errors.append(f"{self.count} queries (budget {queries})")
+        if time is not None and self.time > time:
+            errors.append(
+                f"{self.time * 1000:.1f}ms in the database "
+                f"(budget {time * 1000:.1f}ms)"
+            )
+        if similar is not None:
+            errors.extend(
+                f"{count} similar queries (budget {similar}): {sql}"
+                for sql, count in self.similar(similar + 1)
+            )
+        return errors
+
+    def server_timing(self):
+        return f'db;dur={self.time * 1000:.1f};desc="{self.count} queries"'
+
+
+@contextmanager
+def profile_queries(using=None):
+    """Profile the queries run on the databases (all by default) inside
+    the block."""
+    profile = QueryProfile()
+    with ExitStack() as stack:
+        for alias in using or connections:
+            stack.enter_context(connections[alias].execute_wrapper(profile))
+        yield profile
+
+
+class QueryProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not (
+            settings.DEBUG or getattr(settings, "CORE_QUERY_PROFILING", False)
+        ):
+            return self.get_response(request)
+        with profile_queries() as profile:
+            request.query_profile = profile
+            response = self.get_response(request)
+        # the response can be read by the tests
+        response.query_profile = profile
+        timing = profile.server_timing()
+        if response.has_header("Server-Timing"):
+            timing = f"{response['Server-Timing']}, {timing}"
+        response["Server-Timing"] = timing
+        errors = profile.over_budget(**get_budget())
+        if errors:
+            logger.warning(
+                "%s %s is over the query budget:\n%s",
+                request.method,
+                request.path,
+                "\n".join(errors),
+            )
+        return response
+
+
+class QueryBudgetMixin:
+    """TestCase mixin checking the queries of a block against a budget."""
+
+    @contextmanager
+    def assertQueryBudget(self, queries=None, time=None, similar=None):
+        with profile_queries() as profile:
+            yield profile
+        errors = profile.over_budget(queries, time, similar)
+        if errors:
+            self.fail("Over the query budget:\n" + "\n".join(errors))
+
+
+def get_profile_dir():
+    return Path(
+        getattr(settings, "CORE_PROFILE_DIR", settings.BASE_DIR / "profiles")
+    )
+
+
+def store_profile(profiler, info):
+    """Write the stats of the profiler and their info, remove the oldest
+    profiles over CORE_PROFILE_MAX_FILES. Return the profile id."""
+    directory = get_profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    now = timezone.now()
+    profile_id = f"{now:%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:6]}"
+    profiler.dump_stats(directory / f"{profile_id}.prof")
+    info = {"id": profile_id, "date": now.isoformat(), **info}
+    (directory / f"{profile_id}.json").write_text(json.dumps(info))
+    max_files = getattr(settings, "CORE_PROFILE_MAX_FILES", 100)
+    for old in list_profiles()[max_files:]:
+        delete_profile(old["id"])
+    return profile_id
+
+
+def list_profiles():
+    """Return the info of the stored profiles, newest first."""
+    directory = get_profile_dir()
+    if not directory.is_dir():
+        return []
+    return [
+        json.loads(path.read_text())
+        for path in sorted(directory.glob("*.json"), reverse=True)
+    ]
+
+
+def load_stats(profile_id, stream=None):
+    """Return the pstats.Stats of a profile, raise FileNotFoundError when
+    it doesn't exist."""
+    path = get_profile_dir() / f"{Path(profile_id).name}.prof"
+    if not path.is_file():
+        raise FileNotFoundError(path)
+    return pstats.Stats(str(path), stream=stream)
+
+
+def delete_profile(profile_id):
+    for suffix in (".prof", ".json"):
+        (get_profile_dir() / f"{profile_id}{suffix}").unlink(missing_ok=True)
+
+
+class CPUProfilingMiddleware:
+    """Must be after AuthenticationMiddleware"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def is_requested(self, request):
+        flag = request.GET.get("profile") or request.headers.get("X-Profile")
+        return flag in ("1", "true") and request.user.is_superuser
+
+    def __call__(self, request):
+        if not self.is_requested(request):
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        # the views can skip their caches and process pools
+        request.cpu_profile = profiler
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        info = {
+            "method": request.method,
+            "url": request.get_full_path(),
+            "status": response.status_code,
+            "user": request.user.get_username(),
+            "wall_time": time.perf_counter() - wall_start,
+            "cpu_time": time.process_time() - cpu_start,
+        }
+        query_profile = getattr(request, "query_profile", None)
+        if query_profile is not None:
+            info["queries"] = query_profile.count
+            info["db_time"] = query_profile.time
+        response["X-Profile-Id"] = store_profile(profiler, info)
+        return response
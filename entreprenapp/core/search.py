@@ -0,0 +1,250 @@
+"""Full text search of the registered models.
+
+The text of every instance of a registered model is stored in SearchEntry
+and indexed by the database:
+
+* ``"fts5"`` (SQLite): an external content FTS5 table kept in sync with
+  SearchEntry by triggers, ranked with bm25.
+* ``"tsvector"`` (PostgreSQL): a generated tsvector column with a GIN
+  index, ranked with ts_rank.
+* ``"database"``: a plain ``LIKE`` on the body, without ranking.
+
+The backend of a database is chosen from its vendor and can be set with
+the SEARCH_BACKENDS setting. The entries are updated by the post_save and
+post_delete signals of the registered models."""
+import re
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Case, Q, When
+from django.db.models.signals import post_delete, post_save
+
+from .cache import resolve_related
+from .models import SearchEntry
+
+# the terms after the first MAX_TERMS ones are ignored
+MAX_TERMS = 8
+
+registry = {}
+
+
+class SearchBackend:
+    install_sql = ()
+    uninstall_sql = ()
+
+    def install(self, schema_editor):
+        for sql in self.install_sql:
+            schema_editor.execute(sql)
+
+    def uninstall(self, schema_editor):
+        for sql in self.uninstall_sql:
+            schema_editor.execute(sql)
+
+    def search(self, using, label, terms, limit):
+        """Return the object ids of the label entries matching every term,
+        best match first."""
+        raise NotImplementedError
+
+
+class FTS5Backend(SearchBackend):
+    install_sql = (
+        "CREATE VIRTUAL TABLE core_searchentry_fts USING fts5("
+        "body, content='core_searchentry', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        "CREATE TRIGGER core_searchentry_ai AFTER INSERT ON core_searchentry "
+        "BEGIN INSERT INTO core_searchentry_fts(rowid, body) "
+        "VALUES (new.id, new.body); END",
+        "CREATE TRIGGER core_searchentry_ad AFTER DELETE ON core_searchentry "
+        "BEGIN INSERT INTO core_searchentry_fts(core_searchentry_fts, rowid, "
+        "body) VALUES ('delete', old.id, old.body); END",
+        "CREATE TRIGGER core_searchentry_au AFTER UPDATE ON core_searchentry "
+        "BEGIN INSERT INTO core_searchentry_fts(core_searchentry_fts, rowid, "
+        "body) VALUES ('delete', old.id, old.body); "
+        "INSERT INTO core_searchentry_fts(rowid, body) "
+        "VALUES (new.id, new.body); END",
+        # index the existing entries
+        "INSERT INTO core_searchentry_fts(core_searchentry_fts) "
+        "VALUES ('rebuild')",
+    )
+    uninstall_sql = (
+        "DROP TRIGGER IF EXISTS core_searchentry_ai",
+        "DROP TRIGGER IF EXISTS core_searchentry_ad",
+        "DROP TRIGGER IF EXISTS core_searchentry_au",
+        "DROP TABLE IF EXISTS core_searchentry_fts",
+    )
+
+    def search(self, using, label, terms, limit):
+        match = " ".join(f'"{term}"*' for term in terms)
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                "SELECT entry.object_id FROM core_searchentry_fts "
+                "JOIN core_searchentry entry "
+                "ON entry.id = core_searchentry_fts.rowid "
+                "WHERE core_searchentry_fts MATCH %s AND entry.model = %s "
+                "ORDER BY core_searchentry_fts.rank LIMIT %s",
+                [match, label, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class TSVectorBackend(SearchBackend):
+    install_sql = (
+        "ALTER TABLE core_searchentry ADD COLUMN body_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED",
+        "CREATE INDEX core_searchentry_vector_idx "
+        "ON core_searchentry USING GIN (body_vector)",
+    )
+    uninstall_sql = (
+        "DROP INDEX IF EXISTS core_searchentry_vector_idx",
+        "ALTER TABLE core_searchentry DROP COLUMN IF EXISTS body_vector",
+    )
+
+    def search(self, using, label, terms, limit):
+        query = " & ".join(f"{term}:*" for term in terms)
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                "SELECT object_id FROM core_searchentry "
+                "WHERE model = %s AND body_vector @@ to_tsquery('simple', %s) "
+                "ORDER BY ts_rank(body_vector, to_tsquery('simple', %s)) DESC "
+                "LIMIT %s",
+                [label, query, query, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class DatabaseBackend(SearchBackend):
+    def search(self, using, label, terms, limit):
+        lookups = Q()
+        for term in terms:
+            lookups &= Q(body__icontains=term)
+        entries = SearchEntry.objects.using(using).filter(lookups, model=label)
+        return list(entries.values_list("object_id", flat=True)[:limit])
+
+
+BACKENDS = {
+    "fts5": FTS5Backend(),
+    "tsvector": TSVectorBackend(),
+    "database": DatabaseBackend(),
+}
+
+VENDOR_BACKENDS = {"sqlite": "fts5", "postgresql": "tsvector"}
+
+
+def get_backend(using):
+    backends = getattr(settings, "SEARCH_BACKENDS", {})
+    vendor = connections[using].vendor
+    return BACKENDS[
+        backends.get(using, VENDOR_BACKENDS.get(vendor, "database"))
+    ]
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def register(model, fields, related=()):
+    """Index the instances of the model. A field is an attribute path
+    such as "saler__name" or a function of the instance, related are
+    the foreign keys to resolve from the model cache before indexing."""
+    registry[model] = (fields, related)
+    uid = f"core-search:{_label(model)}"
+    post_save.connect(_update_instance, model, False, uid)
+    post_delete.connect(_delete_instance, model, False, uid)
+
+
+def is_registered(model):
+    return model in registry
+
+
+def _value(instance, field):
+    if callable(field):
+        return field(instance)
+    value = instance
+    for name in field.split("__"):
+        value = getattr(value, name, None)
+        if value is None:
+            return ""
+    return value
+
+
+def get_text(instance):
+    fields, _ = registry[type(instance)]
+    return " ".join(str(_value(instance, field)) for field in fields)
+
+
+def update_index(instances):
+    """Write the entries of instances of the same registered model."""
+    instances = list(instances)
+    if not instances:
+        return
+    model = type(instances[0])
+    label = _label(model)
+    resolve_related(instances, *registry[model][1])
+    using = router.db_for_write(SearchEntry)
+    with transaction.atomic(using=using):
+        SearchEntry.objects.using(using).filter(
+            model=label, object_id__in=[obj.pk for obj in instances]
+        ).delete()
+        SearchEntry.objects.using(using).bulk_create(
+            SearchEntry(model=label, object_id=obj.pk, body=get_text(obj))
+            for obj in instances
+        )
+
+
+def reindex(queryset, batch_size=500):
+    """Index every instance of the queryset, return their number."""
+    count = 0
+    batch = []
+    for instance in queryset.iterator(chunk_size=batch_size):
+        batch.append(instance)
+        if len(batch) == batch_size:
+            update_index(batch)
+            count += len(batch)
+            batch = []
+    update_index(batch)
+    return count + len(batch)
+
+
+def _update_instance(sender, instance, **kwargs):
+    update_index([instance])
+
+
+def _delete_instance(sender, instance, **kwargs):
+    SearchEntry.objects.filter(
+        model=_label(sender), object_id=instance.pk
+    ).delete()
+
+
+def get_terms(query):
+    return re.findall(r"\w+", query.lower())[:MAX_TERMS]
+
+
+def search(queryset, query, limit=None):
+    """Filter the queryset on the instances matching the query, best match
+    first. At most SEARCH_MAX_RESULTS instances are returned.
+
+    The entries of the instances excluded by the queryset, e.g. the soft
+    deleted ones, don't count in the limit: twice as many entries are read
+    until enough instances are kept or every match was read."""
+    terms = get_terms(query)
+    if not terms:
+        return queryset.none()
+    if limit is None:
+        limit = getattr(settings, "SEARCH_MAX_RESULTS", 500)
+    using = router.db_for_read(SearchEntry)
+    backend = get_backend(using)
+    label = _label(queryset.model)
+    fetched = limit
+    while True:
+        ids = backend.search(using, label, terms, fetched)
+        kept = set(
+            queryset.filter(pk__in=ids).order_by().values_list("pk", flat=True)
+        )
+        if len(kept) >= limit or len(ids) < fetched:
+            break
+        fetched *= 2
+    ids = [pk for pk in ids if pk in kept][:limit]
+    if not ids:
+        return queryset.none()
+    rank = Case(*(When(pk=pk, then=index) for index, pk in enumerate(ids)))
+    return queryset.filter(pk__in=ids).order_by(rank)
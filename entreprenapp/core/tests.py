@@ -0,0 +1,729 @@
+import base64
+import csv
+import io
+import json
+import os
+import tempfile
+import zipfile
+from datetime import date
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from discuss.models import ChatMessage, Room
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from sales import search as sales_search
+from sales.models import Customer, Estimate, Invoice, Item, OrderLine, Saler
+
+from . import checks, export, search
+from .cache import model_cache, resolve_related
+from .models import SearchEntry
+from .profiling import (
+    QueryBudgetMixin,
+    fingerprint,
+    list_profiles,
+    profile_queries,
+)
+from .utils import AssetCache
+
+
+class AssetCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+        os.makedirs(os.path.join(self.media_root, "saler/logo"))
+        for name in ("a.png", "b.png", "c.png"):
+            self.write(f"saler/logo/{name}", b"png " + name.encode())
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write(self, name, data, mtime=None):
+        path = os.path.join(self.media_root, name)
+        with open(path, "wb") as media_file:
+            media_file.write(data)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def test_resolve(self):
+        """Local files are resolved once and small assets are inlined"""
+        asset_cache = AssetCache()
+        stylesheet = asset_cache.resolve("static/css/pdf.css")
+        self.assertTrue(stylesheet.startswith("data:text/css;base64,"))
+        self.assertEqual(
+            asset_cache.resolve("/static/css/pdf.css").split(",")[1],
+            stylesheet.split(",")[1],
+        )
+        logo = asset_cache.resolve("/media/saler/logo/a.png")
+        self.assertEqual(base64.b64decode(logo.split(",")[1]), b"png a.png")
+        asset_cache.resolve("/media/saler/logo/a.png")
+        self.assertEqual((asset_cache.hits, asset_cache.misses), (1, 3))
+
+        # too big to be inlined
+        asset_cache = AssetCache(inline_max_size=4)
+        self.assertEqual(
+            asset_cache.resolve("media/saler/logo/a.png"),
+            os.path.join(
+                os.path.realpath(self.media_root), "saler/logo/a.png"
+            ),
+        )
+        self.assertEqual(
+            asset_cache.resolve("https://example.com/logo.png"),
+            "https://example.com/logo.png",
+        )
+        with self.assertRaises(Exception):
+            asset_cache.resolve("media/saler/logo/missing.png")
+
+    def test_invalidation(self):
+        """An entry is dropped when the mtime of the file change"""
+        asset_cache = AssetCache(check_interval=0)
+        self.write("saler/logo/a.png", b"old", mtime=1_000_000)
+        old = asset_cache.resolve("media/saler/logo/a.png")
+        self.write("saler/logo/a.png", b"new", mtime=2_000_000)
+        new = asset_cache.resolve("media/saler/logo/a.png")
+        self.assertNotEqual(old, new)
+        self.assertEqual(base64.b64decode(new.split(",")[1]), b"new")
+
+        # the mtime is not checked before the end of the check interval
+        asset_cache.check_interval = 60
+        self.write("saler/logo/a.png", b"newer", mtime=3_000_000)
+        self.assertEqual(asset_cache.resolve("media/saler/logo/a.png"), new)
+
+    def test_bounded(self):
+        """The least recently used entries are evicted"""
+        asset_cache = AssetCache(max_entries=2)
+        for name in ("a.png", "b.png", "a.png", "c.png"):
+            asset_cache.resolve(f"media/saler/logo/{name}")
+        self.assertEqual(len(asset_cache), 2)
+        self.assertIsNone(asset_cache.get("media/saler/logo/b.png"))
+        self.assertIsNotNone(asset_cache.get("media/saler/logo/a.png"))
+
+        asset_cache = AssetCache(max_bytes=50)
+        for name in ("a.png", "b.png", "c.png"):
+            asset_cache.resolve(f"media/saler/logo/{name}")
+        self.assertEqual(len(asset_cache), 1)
+
+
+@override_settings(CORE_MODEL_CACHE_CHECK_INTERVAL=60)
+class ModelCacheTests(TestCase):
+    def setUp(self):
+        model_cache.clear()
+        self.addCleanup(model_cache.clear)
+        self.saler = Saler.objects.create(
+            name="computer corporation", adress="15 Maltings", city="London"
+        )
+        self.customer = Customer.objects.create(
+            name="riot", adress="44 Maltings", city="London"
+        )
+        self.item = Item.objects.create(
+            label="Ulysse", price_duty_free=25, tax=10
+        )
+
+    def test_get(self):
+        with self.assertNumQueries(1):
+            saler = model_cache.get(Saler, self.saler.pk)
+        with self.assertNumQueries(0):
+            cached_saler = model_cache.get(Saler, self.saler.pk)
+        self.assertEqual(cached_saler, saler)
+        # every caller get its own copy
+        cached_saler.name = "changed"
+        self.assertEqual(
+            model_cache.get(Saler, self.saler.pk).name, saler.name
+        )
+        self.assertEqual(model_cache.stats()["misses"], 1)
+        self.assertEqual(model_cache.stats()["local_hits"], 2)
+        with self.assertRaises(Saler.DoesNotExist):
+            model_cache.get(Saler, 0)
+
+    def test_shared_tier(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": (
+                        "django.core.cache.backends.filebased.FileBasedCache"
+                    ),
+                    "LOCATION": directory,
+                }
+            }
+        ):
+            model_cache.get(Saler, self.saler.pk)
+            # another process only share the cache backend
+            model_cache._entries.clear()
+            with self.assertNumQueries(0):
+                model_cache.get(Saler, self.saler.pk)
+        self.assertEqual(model_cache.stats()["shared_hits"], 1)
+
+    def test_local_memory_cache(self):
+        """The instances aren't kept in a local memory cache and the local
+        entries expire, the changes of another process show up"""
+        model_cache.get(Saler, self.saler.pk)
+        model_cache._entries.clear()
+        with self.assertNumQueries(1):
+            model_cache.get(Saler, self.saler.pk)
+        # saved by another process, the local version isn't bumped
+        Saler.objects.filter(pk=self.saler.pk).update(name="riot")
+        self.assertEqual(
+            model_cache.get(Saler, self.saler.pk).name, self.saler.name
+        )
+        with override_settings(CORE_MODEL_CACHE_LOCAL_TIMEOUT=0):
+            model_cache.get(Saler, self.saler.pk)
+        self.assertEqual(model_cache.get(Saler, self.saler.pk).name, "riot")
+
+    def test_invalidation(self):
+        """The version is bumped on save, soft delete and counter updates"""
+        model_cache.get(Saler, self.saler.pk)
+        model_cache._entries.clear()
+        self.saler.name = "riot corporation"
+        self.saler.is_active = False
+        self.saler.save()
+        saler = model_cache.get(Saler, self.saler.pk)
+        self.assertEqual(saler.name, "riot corporation")
+        self.assertFalse(saler.is_active)
+
+        invoice = Invoice.objects.create(
+            saler=self.saler,
+            customer=self.customer,
+            date=date.today(),
+            is_paid=False,
+        )
+        saler = model_cache.get(Saler, self.saler.pk)
+        self.assertEqual(saler.invoice_number, invoice.invoice_saler_number)
+
+    def test_resolve_related(self):
+        invoice = Invoice.objects.create(
+            saler=self.saler,
+            customer=self.customer,
+            date=date.today(),
+            is_paid=False,
+        )
+        invoice.order_lines.set(
+            [OrderLine.objects.create(item=self.item) for _ in range(3)]
+        )
+        lookups = ("saler", "customer", "order_lines__item")
+        resolve_related([Invoice.objects.get(pk=invoice.pk)], *lookups)
+        invoice = Invoice.objects.get(pk=invoice.pk)
+        # only the order lines are read
+        with self.assertNumQueries(1):
+            resolve_related([invoice], *lookups)
+            self.assertEqual(invoice.saler.name, self.saler.name)
+            self.assertEqual(invoice.customer.name, self.customer.name)
+            for order_line in invoice.order_lines.all():
+                self.assertEqual(order_line.item.label, self.item.label)
+
+
+class CacheChecksTests(SimpleTestCase):
+    def test_shared_caches(self):
+        """The deploy checks warn about the caches local to a process"""
+        warnings = checks.check_core_caches(None)
+        self.assertEqual(
+            [warning.msg.split()[0] for warning in warnings],
+            [
+                "CORE_MODEL_CACHE",
+                "CORE_LIST_COUNT_CACHE",
+                "CHAT_METRICS_CACHE",
+            ],
+        )
+        self.assertEqual({warning.id for warning in warnings}, {"core.W001"})
+        with override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.dummy.DummyCache"
+                }
+            }
+        ):
+            self.assertEqual(checks.check_core_caches(None), [])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.saler = Saler.objects.create(
+            name="computer corporation", adress="15 Maltings", city="London"
+        )
+        self.customers = [
+            Customer.objects.create(
+                name=name, adress="44 Maltings Farm", city=city
+            )
+            for name, city in (
+                ("Riot games", "Paris"),
+                ("Riot Paris", "Paris"),
+                ("Blizzard", "Irvine"),
+            )
+        ]
+        self.invoices = [
+            Invoice.objects.create(
+                saler=self.saler,
+                customer=customer,
+                date=date.today(),
+                is_paid=False,
+            )
+            for customer in self.customers
+        ]
+        user = get_user_model().objects.create_user(
+            email="user@test.com", password="password123"
+        )
+        self.client.force_login(user)
+
+    def search(self, model, query):
+        return list(search.search(model.objects.all(), query))
+
+    def test_search(self):
+        riot_games, riot_paris, blizzard = self.customers
+        # every term must match, prefixes included
+        self.assertEqual(self.search(Customer, "riot gam"), [riot_games])
+        # best match first
+        self.assertEqual(self.search(Customer, "paris")[0], riot_paris)
+        self.assertEqual(self.search(Customer, "*?"), [])
+        self.assertEqual(
+            self.search(
+                Invoice, f"{self.invoices[2].invoice_saler_number:08}"
+            ),
+            [self.invoices[2]],
+        )
+        self.assertEqual(self.search(Invoice, "blizzard"), [self.invoices[2]])
+
+    def test_excluded_matches(self):
+        # the inactive matches come first, by id and by rank
+        for index in range(5):
+            Customer.objects.create(
+                name=f"Zyxwq dead {index}",
+                adress="Zyxwq",
+                city="Zyxwq",
+                is_active=False,
+            )
+        alive = [
+            Customer.objects.create(
+                name=f"Zyxwq alive {index}",
+                adress="44 Maltings Farm",
+                city="London",
+            )
+            for index in range(2)
+        ]
+        for backend in ("fts5", "database"):
+            with self.settings(SEARCH_BACKENDS={"default": backend}):
+                self.assertEqual(
+                    set(
+                        search.search(
+                            Customer.objects.filter(is_active=True),
+                            "zyxwq",
+                            limit=2,
+                        )
+                    ),
+                    set(alive),
+                )
+                self.assertEqual(
+                    len(search.search(Customer.objects, "zyxwq", limit=2)), 2
+                )
+
+    @override_settings(SEARCH_BACKENDS={"default": "database"})
+    def test_database_backend(self):
+        self.assertEqual(
+            self.search(Customer, "riot gam"), [self.customers[0]]
+        )
+
+    def test_index_is_updated(self):
+        blizzard = self.customers[2]
+        # the documents are only indexed again when the name changes
+        with mock.patch.object(
+            sales_search, "reindex_documents"
+        ) as reindex_documents, self.captureOnCommitCallbacks(execute=True):
+            blizzard.city = "Santa Monica"
+            blizzard.save()
+        reindex_documents.assert_not_called()
+        blizzard.name = "Activision"
+        with self.captureOnCommitCallbacks(execute=True):
+            blizzard.save()
+        self.assertEqual(self.search(Customer, "blizzard"), [])
+        self.assertEqual(
+            self.search(Invoice, "activision"), [self.invoices[2]]
+        )
+        blizzard.delete()
+        self.assertEqual(self.search(Customer, "activision"), [])
+        self.assertFalse(
+            SearchEntry.objects.filter(
+                model="sales.customer", object_id=blizzard.pk
+            ).exists()
+        )
+
+    def test_list_view(self):
+        response = self.client.get(
+            reverse("sales:customer_list"), {"q": "riot"}
+        )
+        self.assertEqual(
+            list(response.context["object_list"]), self.customers[:2]
+        )
+        self.assertEqual(response.context["search_query"], "riot")
+        self.assertContains(response, 'value="riot"')
+
+    def test_rebuild_command(self):
+        SearchEntry.objects.all().delete()
+        out = StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        self.assertIn("3 Customers indexed", out.getvalue())
+        self.assertEqual(
+            self.search(Customer, "blizzard"), [self.customers[2]]
+        )
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        saler = Saler.objects.create(
+            name="computer corporation", adress="15 Maltings", city="London"
+        )
+        customer = Customer.objects.create(
+            name="riot", adress="44 Maltings", city="London"
+        )
+        # 4 pages of 15 invoices
+        self.invoices = [
+            Invoice.objects.create(
+                saler=saler,
+                customer=customer,
+                date=date.today(),
+                is_paid=False,
+            )
+            for _ in range(50)
+        ]
+        user = get_user_model().objects.create_user(
+            email="user@test.com", password="password123"
+        )
+        self.client.force_login(user)
+        self.url = reverse("sales:invoice_list")
+
+    def get_page(self, page, cursor=None):
+        params = {"page": page}
+        if cursor:
+            params["cursor"] = cursor
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.context["page_obj"]
+
+    def pks(self, page):
+        return [invoice.pk for invoice in page.object_list]
+
+    def test_next_and_previous_pages(self):
+        expected = [invoice.pk for invoice in Invoice.objects.all()]
+        page = self.get_page(1)
+        self.assertFalse(page.has_previous())
+        pks = self.pks(page)
+        while page.has_next():
+            page = self.get_page(page.next_page_number(), page.next_cursor)
+            pks += self.pks(page)
+        self.assertEqual(page.number, 4)
+        self.assertEqual(pks, expected)
+
+        pks = self.pks(page)
+        while page.has_previous():
+            page = self.get_page(
+                page.previous_page_number(), page.previous_cursor
+            )
+            pks = self.pks(page) + pks
+        self.assertEqual(page.number, 1)
+        self.assertEqual(pks, expected)
+
+    def test_page_range(self):
+        expected = [invoice.pk for invoice in Invoice.objects.all()]
+        first = self.get_page(1)
+        self.assertEqual(
+            self.pks(self.get_page(3, first.next_cursor)), expected[30:45]
+        )
+        last = self.get_page("last")
+        self.assertEqual(last.number, 4)
+        self.assertFalse(last.has_next())
+        self.assertEqual(self.pks(last), expected[45:])
+        self.assertEqual(
+            self.pks(self.get_page(2, last.previous_cursor)), expected[15:30]
+        )
+        # without cursor
+        self.assertEqual(self.pks(self.get_page(2)), expected[15:30])
+
+    def test_cached_count(self):
+        # session, user, count, page
+        with self.assertNumQueries(4):
+            self.get_page(1)
+        with self.assertNumQueries(3):
+            self.get_page(1)
+        self.invoices[0].delete()
+        self.assertEqual(self.get_page(1).paginator.count, 49)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"page": 2, "cursor": "abc"})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(self.url, {"page": 5})
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryProfilingTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.customers = [
+            Customer.objects.create(
+                name=f"riot {index}", adress="44 Maltings", city="London"
+            )
+            for index in range(3)
+        ]
+        user = get_user_model().objects.create_user(
+            email="user@test.com", password="password123"
+        )
+        self.client.force_login(user)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint(
+                "SELECT * FROM t1 WHERE name = 'it''s'  AND id IN (%s, %s)"
+                " LIMIT 21"
+            ),
+            "SELECT * FROM t1 WHERE name = ? AND id IN (...) LIMIT ?",
+        )
+
+    def test_profile(self):
+        with profile_queries() as profile:
+            for customer in self.customers:
+                Customer.objects.get(pk=customer.pk)
+            Customer.objects.get(pk=self.customers[0].pk)
+        self.assertEqual(profile.count, 4)
+        self.assertEqual(len(profile.similar()), 1)
+        self.assertEqual(profile.similar()[0][1], 4)
+        self.assertEqual(profile.duplicates()[0][1], 2)
+        self.assertEqual(
+            profile.over_budget(queries=3, similar=2),
+            [
+                "4 queries (budget 3)",
+                f"4 similar queries (budget 2): {profile.similar()[0][0]}",
+            ],
+        )
+
+    def test_budget(self):
+        with self.assertQueryBudget(queries=1):
+            Customer.objects.count()
+        with self.assertRaisesMessage(AssertionError, "similar queries"):
+            with self.assertQueryBudget(similar=2):
+                for customer in self.customers:
+                    Customer.objects.get(pk=customer.pk)
+
+    @override_settings(
+        CORE_QUERY_PROFILING=True,
+        CORE_QUERY_BUDGET={"queries": 2, "time": 10},
+    )
+    def test_middleware(self):
+        with self.assertLogs("core.profiling", "WARNING") as logs:
+            response = self.client.get(reverse("sales:customer_list"))
+        self.assertIn("GET /sales/customer/list/", logs.output[0])
+        self.assertIn("queries (budget 2)", logs.output[0])
+        profile = response.query_profile
+        self.assertGreater(profile.count, 2)
+        self.assertRegex(
+            response["Server-Timing"],
+            rf'^db;dur=[\d.]+;desc="{profile.count} queries"$',
+        )
+
+    @override_settings(CORE_QUERY_PROFILING=False)
+    def test_middleware_disabled(self):
+        response = self.client.get(reverse("sales:customer_list"))
+        self.assertFalse(response.has_header("Server-Timing"))
+
+
+class CPUProfilingTests(TestCase):
+    def setUp(self):
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profile_dir.cleanup)
+        settings = override_settings(
+            CORE_PROFILE_DIR=Path(self.profile_dir.name),
+            CORE_PROFILE_MAX_FILES=2,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.url = reverse("sales:customer_list")
+
+    def test_only_superusers(self):
+        user = get_user_model().objects.create_user(
+            email="user@test.com", password="password123"
+        )
+        self.client.force_login(user)
+        response = self.client.get(self.url, {"profile": "1"})
+        self.assertFalse(response.has_header("X-Profile-Id"))
+        self.assertEqual(list_profiles(), [])
+
+    def test_profile_and_command(self):
+        admin = get_user_model().objects.create_superuser(
+            email="admin@test.com", password="strongpass123"
+        )
+        self.client.force_login(admin)
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header("X-Profile-Id"))
+        profile_ids = [
+            self.client.get(self.url, {"profile": "1"})["X-Profile-Id"],
+            self.client.get(self.url, HTTP_X_PROFILE="1")["X-Profile-Id"],
+            self.client.get(self.url, HTTP_X_PROFILE="1")["X-Profile-Id"],
+        ]
+        # the oldest profile is removed
+        profiles = list_profiles()
+        self.assertEqual(
+            [profile["id"] for profile in profiles], profile_ids[:0:-1]
+        )
+        self.assertEqual(profiles[0]["url"], self.url)
+        self.assertEqual(profiles[0]["status"], 200)
+        self.assertGreater(profiles[0]["wall_time"], 0)
+
+        out = StringIO()
+        call_command("request_profiles", stdout=out)
+        self.assertIn(profile_ids[2], out.getvalue())
+        self.assertNotIn(profile_ids[0], out.getvalue())
+        out = StringIO()
+        call_command("request_profiles", profile_ids[2], limit=5, stdout=out)
+        self.assertIn(f"GET {self.url} by admin@test.com", out.getvalue())
+        self.assertIn("cumulative", out.getvalue())
+        call_command("request_profiles", clear=True, stdout=StringIO())
+        self.assertEqual(list_profiles(), [])
+
+
+class SeedDataTests(TestCase):
+    def test_seed_data_and_benchmark(self):
+        """seed_data creates the rows, benchmark runs on them"""
+        call_command(
+            "seed_data",
+            salers=2,
+            customers=5,
+            items=4,
+            estimates=3,
+            invoices=4,
+            order_lines=2,
+            rooms=2,
+            messages=7,
+            users=3,
+            batch_size=2,
+            seed=1,
+            stdout=StringIO(),
+        )
+        self.assertEqual(Saler.objects.count(), 2)
+        self.assertEqual(Customer.objects.count(), 5)
+        self.assertEqual(Item.objects.count(), 4)
+        self.assertEqual(Estimate.objects.count(), 3)
+        self.assertEqual(Invoice.objects.count(), 4)
+        self.assertEqual(OrderLine.objects.count(), 14)
+        self.assertEqual(Room.objects.count(), 2)
+        self.assertEqual(ChatMessage.objects.count(), 7)
+        # the customers can be searched
+        customer = Customer.objects.first()
+        self.assertIn(customer, search.search(Customer.objects, customer.name))
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            call_command(
+                "benchmark",
+                repeat=1,
+                only=["invoice_list", "estimate_update"],
+                fanout_size=2,
+                output=output,
+                stdout=StringIO(),
+            )
+            with open(output) as output_file:
+                report = json.load(output_file)
+            out = StringIO()
+            call_command(
+                "benchmark",
+                repeat=1,
+                only=["chat_fanout"],
+                fanout_size=2,
+                compare=output,
+                stdout=out,
+            )
+        self.assertEqual(report["rows"]["sales.invoice"], 4)
+        self.assertEqual(
+            set(report["results"]), {"invoice_list", "estimate_update"}
+        )
+        self.assertGreater(report["results"]["invoice_list"]["queries"], 0)
+        self.assertIn("chat_fanout", out.getvalue())
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.customers = [
+            Customer.objects.create(
+                name=name,
+                adress="44 Maltings",
+                city="London",
+                is_active=active,
+            )
+            for name, active in (
+                ("riot", True),
+                ("=cmd|' /C calc'!A0", True),
+                ("closed", False),
+            )
+        ]
+        self.user = get_user_model().objects.create_user(
+            email="user@test.com", password="password123"
+        )
+        self.client.force_login(self.user)
+        self.url = reverse("sales:customer_list")
+
+    def read_csv(self, response):
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        content = "".join(
+            chunk.decode() for chunk in response.streaming_content
+        )
+        return list(csv.reader(io.StringIO(content)))
+
+    def test_csv(self):
+        """The export has the rows of the list, not only its page"""
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {"export": "csv"})
+            rows = self.read_csv(response)
+        self.assertIn("customers-", response["Content-Disposition"])
+        self.assertEqual(rows[0][:3], ["ID", "Name", "Adress"])
+        # the formulas are exported as text
+        self.assertEqual(
+            sorted(row[1] for row in rows[1:]),
+            ["'=cmd|' /C calc'!A0", "riot"],
+        )
+        response = self.client.get(self.url, {"export": "csv", "q": "riot"})
+        self.assertEqual(len(self.read_csv(response)), 2)
+
+        self.user.is_superuser = True
+        self.user.save()
+        response = self.client.get(self.url, {"export": "csv"})
+        self.assertEqual(len(self.read_csv(response)), 4)
+
+    def test_annotations(self):
+        """The computed totals of the items come from the database"""
+        Item.objects.create(label="Ulysse", price_duty_free=25, tax=10)
+        response = self.client.get(
+            reverse("sales:item_list"), {"export": "csv"}
+        )
+        header, row = self.read_csv(response)
+        self.assertEqual(header[-2:], ["Tax amount", "Price including tax"])
+        self.assertEqual(float(row[-2]), 2.5)
+        self.assertEqual(float(row[-1]), 27.5)
+
+    def test_xlsx(self):
+        response = self.client.get(self.url, {"export": "xlsx"})
+        archive = zipfile.ZipFile(
+            io.BytesIO(b"".join(response.streaming_content))
+        )
+        self.assertIsNone(archive.testzip())
+        sheet = archive.read("xl/worksheets/sheet1.xml").decode()
+        self.assertEqual(sheet.count("<row>"), 3)
+        self.assertIn("riot", sheet)
+        # an inline string is never a formula
+        self.assertIn(
+            "<t xml:space=\"preserve\">=cmd|' /C calc'!A0</t>", sheet
+        )
+        self.assertNotIn("closed", sheet)
+        self.assertIn(
+            'name="Customers"', archive.read("xl/workbook.xml").decode()
+        )
+
+    def test_chunks(self):
+        """The rows are streamed chunk_size at a time"""
+        rows = ([index, f"name {index}"] for index in range(10))
+        chunks = list(export.stream_csv(["id", "name"], rows, chunk_size=4))
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(chunks[0].startswith("id,name\r\n0,name 0"))
+        rows = ([index, None, True, date(2022, 10, 1)] for index in range(10))
+        chunks = list(export.stream_xlsx(["a", "b", "c", "d"], rows, "<&>", 4))
+        self.assertGreater(len(chunks), 1)
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+        sheet = archive.read("xl/worksheets/sheet1.xml").decode()
+        self.assertIn('<c><v>9</v></c><c/><c t="b"><v>1</v></c>', sheet)
+        self.assertIn("2022-10-01", sheet)
@@ -1,36 +1,158 @@
+import base64
+import mimetypes
 import os
+import stat
+import threading
+import time
+from collections import OrderedDict
 
 from django.conf import settings
 from django.contrib.staticfiles import finders
 
 
+def resolve_uri(uri):
+    """Return the absolute path of a static or media URI,
+    or None when the URI is not a static or media file."""
+    name = uri.lstrip("/")
+    static_url = settings.STATIC_URL.lstrip("/")  # Typically static/
+    media_url = settings.MEDIA_URL.lstrip("/")  # Typically media/
+    if media_url and name.startswith(media_url):
+        path = os.path.join(settings.MEDIA_ROOT, name.removeprefix(media_url))
+        return os.path.realpath(path)
+    if static_url and name.startswith(static_url):
+        name = name.removeprefix(static_url)
+        result = finders.find(name)
+        if isinstance(result, (list, tuple)):
+            result = result[0] if result else None
+        if not result:
+            result = os.path.join(settings.STATIC_ROOT, name)
+        return os.path.realpath(result)
+    return None
+
+
+class AssetCache:
+    """Process wide LRU cache of the static and media files used by the PDF.
+
+    An entry keep the resolved path of an URI and, for the small images and
+    stylesheets, a data URI of their content so xhtml2pdf doesn't read them
+    from the disk again. The mtime of a file is checked at most every
+    check_interval seconds and the entry is dropped when it changed."""
+
+    def __init__(
+        self,
+        max_entries=128,
+        max_bytes=8 * 1024 * 1024,
+        inline_max_size=512 * 1024,
+        check_interval=5,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.inline_max_size = inline_max_size
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def get(self, uri):
+        """Return the cached value of the URI or None."""
+        with self._lock:
+            entry = self._entries.get(uri)
+            if entry is None:
+                return None
+            self._entries.move_to_end(uri)
+        path, mtime, value, checked_at = entry
+        now = time.monotonic()
+        if now - checked_at < self.check_interval:
+            return value
+        try:
+            current_mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            current_mtime = None
+        with self._lock:
+            if current_mtime != mtime:
+                self._discard(uri)
+                return None
+            if uri in self._entries:
+                self._entries[uri] = (path, mtime, value, now)
+        return value
+
+    def resolve(self, uri):
+        """Return the data URI or the path of a static or media URI,
+        and the URI itself when it isn't a local file."""
+        value = self.get(uri)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        path = resolve_uri(uri)
+        if path is None:
+            return uri
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            file_stat = None
+        # make sure that file exists
+        if file_stat is None or not stat.S_ISREG(file_stat.st_mode):
+            raise Exception(
+                f"media URI must start with {settings.STATIC_URL} "
+                f"or {settings.MEDIA_URL}"
+            )
+        value = path
+        if file_stat.st_size <= self.inline_max_size:
+            value = self._data_uri(path) or path
+        self._put(uri, path, file_stat.st_mtime_ns, value)
+        return value
+
+    def preload(self, *uris):
+        for uri in uris:
+            self.resolve(uri)
+
+    def _data_uri(self, path):
+        mime_type = mimetypes.guess_type(path)[0]
+        if mime_type != "text/css" and not (
+            mime_type and mime_type.startswith("image/")
+        ):
+            return None
+        with open(path, "rb") as asset:
+            data = asset.read()
+        # relative urls of a stylesheet must be resolved from its path
+        if mime_type == "text/css" and b"url(" in data:
+            return None
+        return f"data:{mime_type};base64,{base64.b64encode(data).decode()}"
+
+    def _put(self, uri, path, mtime, value):
+        with self._lock:
+            self._discard(uri)
+            self._entries[uri] = (path, mtime, value, time.monotonic())
+            self._size += len(value)
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or self._size > self.max_bytes
+            ):
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, uri):
+        entry = self._entries.pop(uri, None)
+        if entry is not None:
+            self._size -= len(entry[2])
+
+
+asset_cache = AssetCache()
+
+
 def link_callback(uri, rel):
     """
     Convert HTML URIs to absolute system paths so xhtml2pdf can access those
     resources
     """
-    result = finders.find(uri[8:])
-    if result:
-        if not isinstance(result, (list, tuple)):
-            result = [result]
-        result = list(os.path.realpath(path) for path in result)
-        path = result[0]
-    else:
-        sUrl = settings.STATIC_URL  # Typically /static/
-        sRoot = settings.STATIC_ROOT  # Typically /home/userX/project_static/
-        mUrl = settings.MEDIA_URL  # Typically /media/
-        mRoot = (
-            settings.MEDIA_ROOT
-        )  # Typically /home/userX/project_static/media/
-
-        if uri.startswith(mUrl):
-            path = os.path.join(mRoot, uri.replace(mUrl, ""))
-        elif uri.startswith(sUrl):
-            path = os.path.join(sRoot, uri.replace(sUrl, ""))
-        else:
-            return uri
-
-    # make sure that file exists
-    if not os.path.isfile(path):
-        raise Exception(f"media URI must start with {sUrl} or {mUrl}")
-    return path
+    return asset_cache.resolve(uri)
@@ -1,12 +1,19 @@
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
 from django.http import Http404, HttpResponseRedirect
 from django.shortcuts import render
 from django.utils import timezone
+from django.utils.translation import gettext as _
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from django.views.generic.list import ListView
 
+from . import export, search
+from .cache import resolve_related
+from .pagination import KeysetPaginator, decode_cursor, get_ordering
+
 
 class CustomContextDataMixin:
     def get_context_data(self, **kwargs):
@@ -49,9 +56,46 @@ class CoreDeleteView(LoginRequiredMixin, CustomContextDataMixin, DeleteView):
 
 class CoreListView(LoginRequiredMixin, ListView):
     """A custom list view that show instance to user admin
-    and only show instance that is active for other user."""
+    and only show instance that is active for other user.
+
+    select_related, prefetch_related and annotations declare what the
+    template need so a page is served with a constant number of queries.
+    The q parameter filters the instances of a searchable model.
+
+    With keyset_pagination the pages are read from the key of the model
+    ordering given by the cursor parameter and the number of pages comes
+    from a cached count (see core.pagination, the model is registered with
+    pagination.register), so a page costs the same whatever its number.
+    The search results keep the offset pagination.
+
+    The export parameter (csv or xlsx) streams the export_fields of every
+    instance of the list, a field can be a lookup like saler__name or one
+    of export_annotations."""
 
     paginate_by = 15
+    select_related = None
+    prefetch_related = None
+    annotations = None
+    keyset_pagination = False
+    export_fields = None
+    export_annotations = None
+    export_formats = ("csv", "xlsx")
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get("export")
+        if self.export_fields and export_format in self.export_formats:
+            return export.export_response(
+                self.get_export_queryset(), self.export_fields, export_format
+            )
+        return super().get(request, *args, **kwargs)
+
+    def get_export_queryset(self):
+        # the rows are read with values_list, no related objects needed
+        queryset = self.get_queryset().select_related(None)
+        queryset = queryset.prefetch_related(None)
+        if self.export_annotations:
+            queryset = queryset.annotate(**self.export_annotations)
+        return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -59,10 +103,52 @@ class CoreListView(LoginRequiredMixin, ListView):
             number=context["page_obj"].number, on_each_side=4, on_ends=0
         )
         context["elied_page_range"] = elided_page_range
+        context["searchable"] = search.is_registered(self.model)
+        context["search_query"] = self.get_search_query()
+        context["export_formats"] = (
+            self.export_formats if self.export_fields else ()
+        )
         return context
 
+    def paginate_queryset(self, queryset, page_size):
+        ordering = None
+        if self.keyset_pagination:
+            ordering = get_ordering(queryset)
+        if ordering is None:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, page_size, ordering)
+        page = (
+            self.kwargs.get(self.page_kwarg)
+            or self.request.GET.get(self.page_kwarg)
+            or 1
+        )
+        try:
+            number = paginator.num_pages if page == "last" else page
+            cursor = self.request.GET.get("cursor")
+            page = paginator.page(
+                number, decode_cursor(cursor) if cursor else None
+            )
+        except (InvalidPage, ValidationError, ValueError) as error:
+            raise Http404(
+                _("Invalid page (%(page_number)s): %(message)s")
+                % {"page_number": page, "message": str(error)}
+            )
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_search_query(self):
+        return self.request.GET.get("q", "").strip()
+
     def get_queryset(self):
         query_set = super().get_queryset()
+        if self.select_related:
+            query_set = query_set.select_related(*self.select_related)
+        if self.prefetch_related:
+            query_set = query_set.prefetch_related(*self.prefetch_related)
+        if self.annotations:
+            query_set = query_set.annotate(**self.annotations)
+        query = self.get_search_query()
+        if query and search.is_registered(self.model):
+            query_set = search.search(query_set, query)
         if self.request.user.is_superuser:
             return query_set
         return query_set.filter(is_active=True)
@@ -70,16 +156,25 @@ class CoreListView(LoginRequiredMixin, ListView):
 
 class CoreDetailView(LoginRequiredMixin, DetailView):
     """A custom detail view that only show inactive instance to admin user
-    and return 404 for inactive instance"""
+    and return 404 for inactive instance.
+
+    The related objects of cached_related are read from the model cache."""
+
+    cached_related = None
+
+    def get_object(self, queryset=None):
+        obj = super().get_object(queryset)
+        if self.cached_related:
+            resolve_related([obj], *self.cached_related)
+        return obj
 
     def get(self, request, *args, **kwargs):
         self.object = self.get_object()
-        if not self.object.is_active:
-            if self.request.user.is_superuser:
-                return super().get(request)
-            else:
-                raise Http404()
-        return super().get(request)
+        if not self.object.is_active and not self.request.user.is_superuser:
+            raise Http404()
+        # DetailView.get would read the object again
+        context = self.get_context_data(object=self.object)
+        return self.render_to_response(context)
 
 
 def custom_404(request, exception):
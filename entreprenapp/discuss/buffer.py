@@ -0,0 +1,86 @@
+import asyncio
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+
+class ChatMessageBuffer:
+    """Write behind buffer of the chat messages received by a consumer.
+
+    The messages are saved with a bulk insert when batch_size messages are
+    pending, flush_interval seconds after the first pending message and
+    when the consumer disconnect. A message is only dropped from the buffer
+    once its insert succeeded, a failed insert is retried. When the database
+    falls behind and max_pending messages are waiting, add() waits for a
+    successful flush before accepting the next message."""
+
+    def __init__(self, batch_size=None, flush_interval=None, max_pending=None):
+        self.batch_size = batch_size or getattr(
+            settings, "CHAT_MESSAGE_BATCH_SIZE", 50
+        )
+        self.flush_interval = flush_interval or getattr(
+            settings, "CHAT_MESSAGE_FLUSH_INTERVAL", 1.0
+        )
+        self.max_pending = max_pending or getattr(
+            settings, "CHAT_MESSAGE_MAX_PENDING", 500
+        )
+        self.pending = []
+        self._lock = asyncio.Lock()
+        self._timer = None
+
+    async def add(self, message):
+        """Add an unsaved ChatMessage to the buffer."""
+        self.pending.append(message)
+        if len(self.pending) >= self.batch_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        # back pressure
+        while len(self.pending) >= self.max_pending:
+            if not await self.flush():
+                await asyncio.sleep(self.flush_interval)
+
+    async def flush(self):
+        """Save the pending messages, return False when the insert failed."""
+        async with self._lock:
+            if self._timer is not None:
+                if self._timer is not asyncio.current_task():
+                    self._timer.cancel()
+                self._timer = None
+            batch = list(self.pending)
+            if not batch:
+                return True
+            try:
+                await database_sync_to_async(ChatMessage.objects.bulk_create)(
+                    batch
+                )
+            except DatabaseError:
+                logger.exception("Could not save %d chat messages", len(batch))
+                self._timer = asyncio.create_task(self._flush_later())
+                return False
+            count = len(batch)
+            del self.pending[:count]
+            if self.pending:
+                self._timer = asyncio.create_task(self._flush_later())
+            return True
+
+    async def close(self, attempts=3):
+        """Flush every pending message, retrying a failed insert."""
+        for _ in range(attempts):
+            while self.pending and await self.flush():
+                pass
+            if not self.pending:
+                return True
+            await asyncio.sleep(self.flush_interval)
+        logger.error("%d chat messages were not saved", len(self.pending))
+        return False
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
@@ -1,10 +1,13 @@
 import json
+import time
 
 from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from django.shortcuts import get_object_or_404
 from django.utils import timezone
 
+from .buffer import ChatMessageBuffer
+from .metrics import chat_metrics
 from .models import ChatMessage, Room
 
 
@@ -13,47 +16,70 @@ class ChatConsumer(AsyncWebsocketConsumer):
         self.room_name = self.scope["url_route"]["kwargs"]["room_name"]
         self.room_group_name = "chat_%s" % self.room_name
         self.user = self.scope["user"]
+        # Resolve the room once for every message of the connection
+        self.room = await database_sync_to_async(
+            Room.objects.filter(name=self.room_name).first
+        )()
+        if self.room is None:
+            await self.close()
+            return
+        self.message_buffer = ChatMessageBuffer()
 
         # Join room group
         await self.channel_layer.group_add(
             self.room_group_name, self.channel_name
         )
         await self.accept()
+        chat_metrics.connected(self.room_name)
+        await self.flush_metrics()
 
     async def disconnect(self, close_code):
+        if self.room is None:
+            return
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name, self.channel_name
         )
+        chat_metrics.disconnected(self.room_name)
+        await self.flush_metrics(force=True)
+        # Store the pending messages
+        await self.message_buffer.close()
 
     # Receive message from WebSocket
     async def receive(self, text_data):
         text_data_json = json.loads(text_data)
-        message = text_data_json["message"]
-        now = timezone.now()
+        chat_message = ChatMessage(
+            room=self.room,
+            author=self.user,
+            message=text_data_json["message"],
+            date_time=timezone.now(),
+        )
+        # The frame is serialized once here for every member of the group
+        frame = json.dumps(chat_message.to_json(), separators=(",", ":"))
 
         # Send message to room group
         await self.channel_layer.group_send(
             self.room_group_name,
             {
                 "type": "chat_message",
-                "message": message,
-                "author_id": self.user.id,
-                "author_full_name": self.user.get_full_name(),
-                "date_time": now.isoformat(),
+                "text": frame,
+                "size": len(frame.encode()),
+                "sent_at": time.time(),
             },
         )
-        # Store the message on the database
-        room = sync_to_async(get_object_or_404)(
-            Room, name=self.room_group_name[5:]
-        )
-        chat_message = sync_to_async(ChatMessage.objects.create)(
-            room=await room, author=self.user, message=message, date_time=now
-        )
-
-        await chat_message
+        chat_metrics.message_sent(self.room_name)
+        # Store the message on the database with the next batch
+        await self.message_buffer.add(chat_message)
 
     # Receive message from room group
     async def chat_message(self, event):
-        # Send the data to WebSocket
-        await self.send(text_data=json.dumps({**event}))
+        # Send the ready made frame to WebSocket
+        await self.send(text_data=event["text"])
+        chat_metrics.message_delivered(
+            self.room_name, event["size"], time.time() - event["sent_at"]
+        )
+        await self.flush_metrics()
+
+    async def flush_metrics(self, force=False):
+        if force or chat_metrics.flush_due():
+            await sync_to_async(chat_metrics.flush)()
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...consumer import ChatConsumer
+from ...metrics import chat_metrics
+from ...models import ChatMessage, Room
+
+ROOM_NAME = "benchmark"
+
+
+async def _send(text_data=None, bytes_data=None, close=False):
+    pass
+
+
+def legacy_event(chat_message):
+    """Group message sent before the frames were serialized by the sender"""
+    return {
+        "type": "chat_message",
+        "message": chat_message.message,
+        "author_id": chat_message.author_id,
+        "author_full_name": chat_message.author.get_full_name(),
+        "date_time": chat_message.date_time.isoformat(),
+        "sent_at": time.time(),
+    }
+
+
+async def legacy_chat_message(consumer, event):
+    event = {**event}
+    sent_at = event.pop("sent_at")
+    text_data = json.dumps(event)
+    await consumer.send(text_data=text_data)
+    chat_metrics.message_delivered(
+        consumer.room_name, len(text_data.encode()), time.time() - sent_at
+    )
+    await consumer.flush_metrics()
+
+
+def preserialized_event(chat_message):
+    frame = json.dumps(chat_message.to_json(), separators=(",", ":"))
+    return {
+        "type": "chat_message",
+        "text": frame,
+        "size": len(frame.encode()),
+        "sent_at": time.time(),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the CPU cost of a chat message broadcast, by room size, "
+        "with and without the frame serialized by the sender."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            nargs="+",
+            type=int,
+            default=[1, 10, 100, 500],
+            help="Number of consumers in the room.",
+        )
+        parser.add_argument(
+            "--messages",
+            type=int,
+            default=200,
+            help="Number of messages broadcast for each size.",
+        )
+
+    def handle(self, *args, **options):
+        chat_message = ChatMessage(
+            room=Room(name=ROOM_NAME),
+            author=get_user_model()(first_name="Bob", last_name="Zac"),
+            message="Hello people " * 10,
+            date_time=timezone.now(),
+        )
+        self.stdout.write(
+            f"{'room size':>10}{'legacy µs':>14}{'pre-serialized µs':>20}"
+            f"{'speedup':>10}"
+        )
+        for size in options["sizes"]:
+            legacy = self.measure(
+                size,
+                options["messages"],
+                lambda: legacy_event(chat_message),
+                legacy_chat_message,
+            )
+            preserialized = self.measure(
+                size,
+                options["messages"],
+                lambda: preserialized_event(chat_message),
+                ChatConsumer.chat_message,
+            )
+            self.stdout.write(
+                f"{size:>10}{legacy:>14.1f}{preserialized:>20.1f}"
+                f"{legacy / preserialized:>9.1f}x"
+            )
+        chat_metrics.reset([ROOM_NAME])
+
+    def measure(self, size, messages, make_event, handler):
+        """Return the CPU time of a broadcast in microseconds."""
+        consumers = []
+        for _ in range(size):
+            consumer = ChatConsumer()
+            consumer.room_name = ROOM_NAME
+            consumer.send = _send
+            consumers.append(consumer)
+
+        async def broadcast():
+            for _ in range(messages):
+                event = make_event()
+                for consumer in consumers:
+                    await handler(consumer, event)
+
+        start = time.process_time()
+        asyncio.run(broadcast())
+        return (time.process_time() - start) / messages * 1_000_000
@@ -0,0 +1,52 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...metrics import chat_metrics
+from ...models import Room
+
+
+class Command(BaseCommand):
+    help = "Show the connections, message rate and latency of the rooms."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "rooms", nargs="*", help="Name of the rooms, all by default."
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Output the metrics as JSON."
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Reset the metrics of the rooms.",
+        )
+
+    def handle(self, *args, **options):
+        room_names = list(Room.objects.values_list("name", flat=True))
+        if options["rooms"]:
+            unknown = set(options["rooms"]) - set(room_names)
+            if unknown:
+                raise CommandError(f"Unknown room(s): {', '.join(unknown)}")
+            room_names = options["rooms"]
+        if options["reset"]:
+            chat_metrics.reset(room_names)
+            self.stdout.write(self.style.SUCCESS("Metrics reset"))
+            return
+        metrics = chat_metrics.snapshot(room_names)
+        if options["json"]:
+            self.stdout.write(json.dumps(metrics, indent=2))
+            return
+        self.stdout.write(
+            f"{'room':<20}{'conn.':>8}{'msg':>10}{'msg/s':>8}"
+            f"{'fan-out':>9}{'bytes':>12}{'avg ms':>9}{'p95 ms':>9}"
+        )
+        for room_name, room in metrics.items():
+            latency = room["latency"]
+            self.stdout.write(
+                f"{room_name:<20}{room['connections']:>8}"
+                f"{room['messages']:>10}{room['messages_per_second']:>8}"
+                f"{room['fan_out']:>9}{room['bytes']:>12}"
+                f"{str(latency['average_ms'] or '-'):>9}"
+                f"{str(latency['p95_ms'] or '-'):>9}"
+            )
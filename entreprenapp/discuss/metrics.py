@@ -0,0 +1,174 @@
+"""Per room metrics of the chat.
+
+The consumers count the connections, the messages sent to a room group,
+the messages delivered to the websockets, their size and their delivery
+latency. The counters are kept in memory and added every flush_interval
+seconds to CHAT_METRICS_CACHE, which must be shared by the workers (e.g. a
+redis cache) to get the metrics of the whole deployment."""
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+
+# upper bounds of the delivery latency histogram, in milliseconds
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, None)
+
+COUNTERS = ("connections", "messages", "deliveries", "bytes", "latency_ms")
+
+KEY_PREFIX = "discuss-metrics"
+
+
+def _bucket(latency_ms):
+    for index, bound in enumerate(LATENCY_BUCKETS):
+        if bound is None or latency_ms <= bound:
+            return index
+
+
+def _percentile(buckets, ratio):
+    total = sum(buckets)
+    if not total:
+        return None
+    cumulated = 0
+    for bound, count in zip(LATENCY_BUCKETS, buckets):
+        cumulated += count
+        if cumulated >= ratio * total:
+            return bound if bound is not None else "inf"
+
+
+class ChatMetrics:
+    def __init__(self, flush_interval=None):
+        self.flush_interval = flush_interval
+        self._counters = defaultdict(int)
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    def get_cache(self):
+        return caches[getattr(settings, "CHAT_METRICS_CACHE", "default")]
+
+    def get_flush_interval(self):
+        if self.flush_interval is not None:
+            return self.flush_interval
+        return getattr(settings, "CHAT_METRICS_FLUSH_INTERVAL", 5.0)
+
+    def key(self, room_name, name):
+        return f"{KEY_PREFIX}:{room_name}:{name}"
+
+    def _add(self, room_name, name, value):
+        with self._lock:
+            self._counters[room_name, name] += value
+
+    def connected(self, room_name):
+        self._add(room_name, "connections", 1)
+
+    def disconnected(self, room_name):
+        self._add(room_name, "connections", -1)
+
+    def message_sent(self, room_name):
+        self._add(room_name, "messages", 1)
+        minute = int(time.time() // 60)
+        self._add(room_name, f"minute:{minute}", 1)
+
+    def message_delivered(self, room_name, size, latency):
+        """Count a message of size bytes delivered latency seconds after
+        it has been sent."""
+        latency_ms = max(latency * 1000, 0)
+        with self._lock:
+            self._counters[room_name, "deliveries"] += 1
+            self._counters[room_name, "bytes"] += size
+            self._counters[room_name, "latency_ms"] += round(latency_ms)
+            bucket = f"latency:{_bucket(latency_ms)}"
+            self._counters[room_name, bucket] += 1
+
+    def flush_due(self):
+        return time.monotonic() - self._flushed_at >= self.get_flush_interval()
+
+    def flush(self):
+        """Add the counters of the process to the cache."""
+        with self._lock:
+            counters = self._counters
+            self._counters = defaultdict(int)
+            self._flushed_at = time.monotonic()
+        cache = self.get_cache()
+        for (room_name, name), value in counters.items():
+            if not value:
+                continue
+            key = self.key(room_name, name)
+            # the per minute counters are only used for the rate
+            timeout = 180 if name.startswith("minute:") else None
+            cache.add(key, 0, timeout)
+            try:
+                cache.incr(key, value)
+            except ValueError:
+                # expired between add and incr
+                cache.set(key, value, timeout)
+
+    def _keys(self, room_name, minutes):
+        names = COUNTERS + tuple(f"minute:{minute}" for minute in minutes)
+        names += tuple(f"latency:{i}" for i in range(len(LATENCY_BUCKETS)))
+        return {name: self.key(room_name, name) for name in names}
+
+    def snapshot(self, room_names):
+        """Return the metrics of the rooms read from the cache."""
+        previous_minute = int(time.time() // 60) - 1
+        keys = {
+            room_name: self._keys(room_name, [previous_minute])
+            for room_name in room_names
+        }
+        values = self.get_cache().get_many(
+            [key for room_keys in keys.values() for key in room_keys.values()]
+        )
+        metrics = {}
+        for room_name, room_keys in keys.items():
+            room_values = {
+                name: values.get(key, 0) for name, key in room_keys.items()
+            }
+            metrics[room_name] = self._room_metrics(
+                room_values, previous_minute
+            )
+        return metrics
+
+    def _room_metrics(self, values, previous_minute):
+        messages = values["messages"]
+        deliveries = values["deliveries"]
+        buckets = [values[f"latency:{i}"] for i in range(len(LATENCY_BUCKETS))]
+        average = None
+        if deliveries:
+            average = round(values["latency_ms"] / deliveries, 2)
+        return {
+            "connections": values["connections"],
+            "messages": messages,
+            "messages_per_second": round(
+                values[f"minute:{previous_minute}"] / 60, 3
+            ),
+            "deliveries": deliveries,
+            "fan_out": round(deliveries / messages, 2) if messages else 0,
+            "bytes": values["bytes"],
+            "latency": {
+                "average_ms": average,
+                "p50_ms": _percentile(buckets, 0.5),
+                "p95_ms": _percentile(buckets, 0.95),
+                "buckets": {
+                    str(bound or "inf"): count
+                    for bound, count in zip(LATENCY_BUCKETS, buckets)
+                },
+            },
+        }
+
+    def reset(self, room_names=()):
+        """Drop the counters of the process and the metrics of the rooms."""
+        with self._lock:
+            self._counters = defaultdict(int)
+        current_minute = int(time.time() // 60)
+        minutes = (current_minute - 1, current_minute)
+        self.get_cache().delete_many(
+            [
+                key
+                for room_name in room_names
+                for key in self._keys(room_name, minutes).values()
+            ]
+        )
+
+
+chat_metrics = ChatMetrics()
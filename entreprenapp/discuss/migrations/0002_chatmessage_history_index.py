@@ -0,0 +1,28 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("discuss", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="chatmessage",
+            options={
+                "ordering": ["date_time", "id"],
+                "verbose_name": "Message",
+                "verbose_name_plural": "Messages",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(
+                fields=["room", "date_time", "id"],
+                name="discuss_message_history_idx",
+            ),
+        ),
+    ]
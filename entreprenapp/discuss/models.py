@@ -32,6 +32,21 @@ class ChatMessage(models.Model):
             f"R:{self.room} U:{self.author.get_full_name()} D:{self.date_time}"
         )
 
+    def to_json(self):
+        return {
+            "message": self.message,
+            "author_id": self.author_id,
+            "author_full_name": self.author.get_full_name(),
+            "date_time": self.date_time.isoformat(),
+        }
+
     class Meta:
         verbose_name = "Message"
         verbose_name_plural = "Messages"
+        ordering = ["date_time", "id"]
+        indexes = [
+            models.Index(
+                fields=["room", "date_time", "id"],
+                name="discuss_message_history_idx",
+            )
+        ]
@@ -0,0 +1,64 @@
+"""Synthetic chat rooms, users and message history, written with bulk
+inserts (see the seed_data command)."""
+import random
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from .models import ChatMessage, Room
+
+FIRST_NAMES = ("Ada", "Alan", "Grace", "Linus", "Margaret", "Ken", "Barbara")
+LAST_NAMES = ("Lovelace", "Turing", "Hopper", "Torvalds", "Hamilton")
+
+
+def seed_chat(rooms=5, messages=10000, users=20, batch_size=1000, rng=None):
+    """Create the rooms and users then the messages, spread over the last
+    30 days. Return the number of rows created by model."""
+    rng = rng or random.Random()
+    # the rooms and users of different runs don't collide
+    run = uuid.uuid4().hex[:8]
+    # every seeded user has the same unusable password
+    password = make_password(None)
+    User = get_user_model()
+    authors = User.objects.bulk_create(
+        (
+            User(
+                email=f"seed-{run}-{index}@example.com",
+                first_name=rng.choice(FIRST_NAMES),
+                last_name=rng.choice(LAST_NAMES),
+                password=password,
+            )
+            for index in range(users)
+        ),
+        batch_size=batch_size,
+    )
+    room_list = Room.objects.bulk_create(
+        Room(name=f"seed-{run}-{index}") for index in range(rooms)
+    )
+    created = {User: users, Room: rooms, ChatMessage: 0}
+    if not (authors and room_list):
+        return created
+    start = timezone.now() - timedelta(days=30)
+    step = timedelta(days=30) / max(messages, 1)
+    batch = []
+    for index in range(messages):
+        batch.append(
+            ChatMessage(
+                room=room_list[index % rooms],
+                author=rng.choice(authors),
+                message=" ".join(
+                    rng.choice(("hello", "invoice", "ok", "thanks", "see"))
+                    for _ in range(rng.randint(1, 20))
+                ),
+                date_time=start + step * index,
+            )
+        )
+        if len(batch) == batch_size:
+            ChatMessage.objects.bulk_create(batch)
+            batch = []
+    ChatMessage.objects.bulk_create(batch)
+    created[ChatMessage] = messages
+    return created
@@ -1,8 +1,26 @@
+import asyncio
+import json
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
 from django.utils import timezone
 
+from . import consumer
+from .buffer import ChatMessageBuffer
+from .metrics import chat_metrics
 from .models import ChatMessage, Room
+from .routing import websocket_urlpatterns
+from .views import encode_cursor
 
 
 class DiscussModelTests(TestCase):
@@ -46,3 +64,279 @@ class DiscussModelTests(TestCase):
                 f"D:{chat_message_data['date_time']}"
             ),
         )
+
+
+@override_settings(
+    CHANNEL_LAYERS={
+        "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}
+    },
+    CHAT_MESSAGE_BATCH_SIZE=3,
+    CHAT_MESSAGE_FLUSH_INTERVAL=0.05,
+)
+class ChatConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            first_name="Bob",
+            last_name="Zac",
+            email="user@test.com",
+            password="strongsecret123",
+        )
+        self.room = Room.objects.create(name="general")
+        self.application = URLRouter(websocket_urlpatterns)
+
+    async def connect(self, room_name="general"):
+        communicator = WebsocketCommunicator(
+            self.application, f"/ws/chat/{room_name}/"
+        )
+        communicator.scope["user"] = self.user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def send_messages(self, communicator, count):
+        for index in range(count):
+            await communicator.send_json_to({"message": f"message {index}"})
+            response = await communicator.receive_json_from()
+            self.assertEqual(response["message"], f"message {index}")
+
+    def count_messages(self):
+        return database_sync_to_async(
+            ChatMessage.objects.filter(room=self.room).count
+        )()
+
+    async def wait_for_messages(self, count, timeout=1.0):
+        # the message is broadcast before it is added to the buffer, the
+        # echo can be received before the insert
+        deadline = time.monotonic() + timeout
+        while await self.count_messages() < count:
+            if time.monotonic() > deadline:
+                break
+            await asyncio.sleep(0.01)
+        return await self.count_messages()
+
+    async def test_unknown_room(self):
+        _, connected = await self.connect("unknown")
+        self.assertFalse(connected)
+
+    async def test_batched_messages(self):
+        """Messages are saved by batch, after a delay and on disconnect"""
+        communicator, connected = await self.connect()
+        self.assertTrue(connected)
+
+        await self.send_messages(communicator, 2)
+        self.assertEqual(await self.count_messages(), 0)
+        # the batch size is reached
+        await self.send_messages(communicator, 1)
+        self.assertEqual(await self.wait_for_messages(3), 3)
+        # the flush interval is reached
+        await self.send_messages(communicator, 1)
+        await asyncio.sleep(0.2)
+        self.assertEqual(await self.count_messages(), 4)
+
+        await self.send_messages(communicator, 2)
+        await communicator.disconnect()
+        self.assertEqual(await self.count_messages(), 6)
+
+    async def test_metrics(self):
+        """Connections, messages and deliveries are counted per room"""
+        await database_sync_to_async(chat_metrics.reset)(["general"])
+        sender, _ = await self.connect()
+        receiver, _ = await self.connect()
+        await self.send_messages(sender, 1)
+        response = await receiver.receive_json_from()
+        self.assertNotIn("sent_at", response)
+        await database_sync_to_async(chat_metrics.flush)()
+        metrics = chat_metrics.snapshot(["general"])["general"]
+        self.assertEqual(metrics["connections"], 2)
+        self.assertEqual(metrics["messages"], 1)
+        self.assertEqual(metrics["deliveries"], 2)
+        self.assertEqual(metrics["fan_out"], 2)
+        self.assertGreater(metrics["bytes"], 0)
+        self.assertEqual(sum(metrics["latency"]["buckets"].values()), 2)
+
+        await sender.disconnect()
+        await receiver.disconnect()
+        metrics = chat_metrics.snapshot(["general"])["general"]
+        self.assertEqual(metrics["connections"], 0)
+
+    async def test_broadcast_is_serialized_once(self):
+        sender, _ = await self.connect()
+        receivers = [(await self.connect())[0] for _ in range(3)]
+        with mock.patch.object(consumer, "json", wraps=json) as json_mock:
+            await self.send_messages(sender, 1)
+            for receiver in receivers:
+                response = await receiver.receive_json_from()
+                self.assertEqual(response["message"], "message 0")
+                self.assertEqual(response["author_full_name"], "Bob Zac")
+        self.assertEqual(json_mock.dumps.call_count, 1)
+        for communicator in [sender, *receivers]:
+            await communicator.disconnect()
+
+    async def test_failed_insert_is_retried(self):
+        """Messages are kept until they are saved"""
+        buffer = ChatMessageBuffer(
+            batch_size=2, flush_interval=0.01, max_pending=4
+        )
+        messages = [
+            ChatMessage(
+                room=self.room,
+                author=self.user,
+                message=f"message {index}",
+                date_time=timezone.now(),
+            )
+            for index in range(2)
+        ]
+        bulk_create = ChatMessage.objects.bulk_create
+        failures = [DatabaseError]
+
+        def failing_bulk_create(objs):
+            if failures:
+                raise failures.pop()
+            return bulk_create(objs)
+
+        with mock.patch.object(
+            ChatMessage.objects, "bulk_create", side_effect=failing_bulk_create
+        ):
+            with self.assertLogs("discuss.buffer", "ERROR"):
+                await buffer.add(messages[0])
+                await buffer.add(messages[1])
+            self.assertEqual(len(buffer.pending), 2)
+            self.assertTrue(await buffer.close())
+        self.assertEqual(buffer.pending, [])
+        self.assertEqual(await self.count_messages(), 2)
+
+
+@override_settings(CHAT_HISTORY_PAGE_SIZE=5)
+class RoomChatHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            first_name="Bob",
+            last_name="Zac",
+            email="user@test.com",
+            password="strongsecret123",
+        )
+        cls.room = Room.objects.create(name="general")
+        other_room = Room.objects.create(name="sales")
+        now = timezone.now()
+        # some messages share the same date to check the id tie breaker
+        ChatMessage.objects.bulk_create(
+            [
+                ChatMessage(
+                    room=cls.room,
+                    author=cls.user,
+                    message=f"message {index}",
+                    date_time=now + timedelta(seconds=index // 3),
+                )
+                for index in range(12)
+            ]
+            + [
+                ChatMessage(
+                    room=other_room,
+                    author=cls.user,
+                    message="other room",
+                    date_time=now,
+                )
+            ]
+        )
+        cls.messages = list(ChatMessage.objects.filter(room=cls.room))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_login_required(self):
+        self.client.logout()
+        for name in ("discuss:room", "discuss:room_history"):
+            response = self.client.get(reverse(name, args=["general"]))
+            self.assertEqual(response.status_code, 302)
+
+    def test_room_render_the_last_messages(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                reverse("discuss:room", args=["general"])
+            )
+        self.assertEqual(response.context["chat_messages"], self.messages[-5:])
+        self.assertEqual(
+            response.context["history_cursor"],
+            encode_cursor(self.messages[-5]),
+        )
+        self.assertContains(response, "Bob Zac", count=5)
+
+    def test_history_pages(self):
+        """Every message is loaded once, in order, page after page"""
+        url = reverse("discuss:room_history", args=["general"])
+        cursor = encode_cursor(self.messages[-5])
+        loaded = []
+        while cursor:
+            response = self.client.get(url, {"before": cursor})
+            data = response.json()
+            loaded = [message["message"] for message in data["messages"]] + (
+                loaded
+            )
+            cursor = data["next_cursor"]
+        self.assertEqual(
+            loaded, [message.message for message in self.messages[:-5]]
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get(
+            reverse("discuss:room_history", args=["general"]),
+            {"before": "yesterday"},
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ChatMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            first_name="Bob",
+            last_name="Zac",
+            email="user@test.com",
+            password="strongsecret123",
+        )
+        Room.objects.create(name="general")
+
+    def setUp(self):
+        chat_metrics.reset(["general"])
+        chat_metrics.connected("general")
+        chat_metrics.message_sent("general")
+        chat_metrics.message_delivered("general", 100, 0.02)
+        chat_metrics.flush()
+        self.addCleanup(chat_metrics.reset, ["general"])
+
+    def test_metrics_view_is_restricted_to_staff(self):
+        url = reverse("discuss:metrics")
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url)
+        metrics = response.json()["rooms"]["general"]
+        self.assertEqual(metrics["connections"], 1)
+        self.assertEqual(metrics["bytes"], 100)
+        self.assertEqual(metrics["latency"]["average_ms"], 20)
+        self.assertEqual(metrics["latency"]["p95_ms"], 25)
+
+    def test_command(self):
+        out = StringIO()
+        call_command("chat_metrics", stdout=out)
+        self.assertIn("general", out.getvalue())
+
+        call_command("chat_metrics", "general", "--reset", stdout=out)
+        self.assertEqual(
+            chat_metrics.snapshot(["general"])["general"]["messages"], 0
+        )
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command(
+            "benchmark_chat_broadcast",
+            "--sizes",
+            "1",
+            "5",
+            "--messages",
+            "2",
+            stdout=out,
+        )
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
@@ -1,9 +1,15 @@
 from django.urls import path
 
-from .views import RoomChat
+from .views import ChatMetricsView, RoomChat, RoomChatHistory
 
 app_name = "discuss"
 
 urlpatterns = [
+    path("metrics/", ChatMetricsView.as_view(), name="metrics"),
     path("<str:room_name>", RoomChat.as_view(), name="room"),
+    path(
+        "<str:room_name>/history/",
+        RoomChatHistory.as_view(),
+        name="room_history",
+    ),
 ]
@@ -1,17 +1,93 @@
-from django.contrib.auth.mixins import LoginRequiredMixin
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.db.models import Q
+from django.http import HttpResponseBadRequest, JsonResponse
 from django.shortcuts import get_object_or_404
-from django.views.generic import TemplateView
+from django.views.generic import TemplateView, View
 
+from .metrics import chat_metrics
 from .models import ChatMessage, Room
 
 
+def encode_cursor(message):
+    return f"{message.date_time.isoformat()}_{message.pk}"
+
+
+def decode_cursor(cursor):
+    """Return the (date_time, id) of a cursor, raise ValueError
+    when the cursor is not valid."""
+    date_time, pk = cursor.rsplit("_", 1)
+    return datetime.fromisoformat(date_time), int(pk)
+
+
+def history_page(room, before=None, page_size=None):
+    """Return the messages of the room sent before the (date_time, id)
+    cursor, oldest first, and the cursor of the previous page or None.
+
+    The messages are read from the (room, date_time, id) index so every
+    page costs the same whatever its position in the history."""
+    page_size = page_size or getattr(settings, "CHAT_HISTORY_PAGE_SIZE", 50)
+    messages = (
+        ChatMessage.objects.filter(room=room)
+        .select_related("author")
+        .order_by("-date_time", "-id")
+    )
+    if before is not None:
+        date_time, pk = before
+        messages = messages.filter(
+            Q(date_time__lt=date_time) | Q(date_time=date_time, id__lt=pk)
+        )
+    limit = page_size + 1
+    messages = list(messages[:limit])
+    cursor = None
+    if len(messages) > page_size:
+        messages = messages[:page_size]
+        cursor = encode_cursor(messages[-1])
+    messages.reverse()
+    return messages, cursor
+
+
 class RoomChat(LoginRequiredMixin, TemplateView):
     template_name = "discuss/room.html"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["room"] = get_object_or_404(Room, name=kwargs["room_name"])
-        context["chat_messages"] = ChatMessage.objects.filter(
-            room=context["room"]
-        )
+        (
+            context["chat_messages"],
+            context["history_cursor"],
+        ) = history_page(context["room"])
         return context
+
+
+class RoomChatHistory(LoginRequiredMixin, View):
+    """Return a page of older messages of a room as JSON"""
+
+    def get(self, request, *args, **kwargs):
+        room = get_object_or_404(Room, name=kwargs["room_name"])
+        before = None
+        if request.GET.get("before"):
+            try:
+                before = decode_cursor(request.GET["before"])
+            except ValueError:
+                return HttpResponseBadRequest("Invalid cursor")
+        messages, cursor = history_page(room, before)
+        return JsonResponse(
+            {
+                "messages": [message.to_json() for message in messages],
+                "next_cursor": cursor,
+            }
+        )
+
+
+class ChatMetricsView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """Return the metrics of every room as JSON, for the staff"""
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, *args, **kwargs):
+        room_names = Room.objects.values_list("name", flat=True)
+        return JsonResponse({"rooms": chat_metrics.snapshot(list(room_names))})
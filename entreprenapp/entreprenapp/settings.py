@@ -47,14 +47,17 @@ INSTALLED_APPS = [
     "core",
     "sales",
     "discuss",
+    "reporting",
 ]
 
 MIDDLEWARE = [
+    "core.profiling.QueryProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.profiling.CPUProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -171,3 +174,97 @@ CHANNEL_LAYERS = {
         },
     },
 }
+
+# Cache shared by the workers, the pdf, model, item catalog and list count
+# caches keep stale entries in the local memory cache of each process
+if os.getenv("REDIS_CACHE_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_CACHE_URL"),
+        }
+    }
+
+# Sales PDF rendering
+SALES_PDF_WORKERS = int(os.getenv("SALES_PDF_WORKERS", 2))
+
+# the cache must be shared by the workers (e.g. redis), a document saved by
+# a process would keep its previous pdf in the others
+SALES_PDF_CACHE = "default"
+
+SALES_PDF_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Sales document numbering strategy per database alias,
+# "update" (default) or "select_for_update"
+SALES_NUMBERING_STRATEGIES = {}
+
+# Chat messages write behind buffer
+CHAT_MESSAGE_BATCH_SIZE = 50
+
+CHAT_MESSAGE_FLUSH_INTERVAL = 1.0
+
+CHAT_MESSAGE_MAX_PENDING = 500
+
+# Number of chat messages rendered with a room and loaded per history page
+CHAT_HISTORY_PAGE_SIZE = 50
+
+# Chat metrics, the cache must be shared by the workers (e.g. redis)
+CHAT_METRICS_CACHE = "default"
+
+CHAT_METRICS_FLUSH_INTERVAL = 5.0
+
+# Versioned cache of the salers, customers and items, the cache must be
+# shared by the workers (e.g. redis), the instances of each process are read
+# again after CORE_MODEL_CACHE_LOCAL_TIMEOUT seconds
+CORE_MODEL_CACHE = "default"
+
+CORE_MODEL_CACHE_TIMEOUT = 60 * 60
+
+CORE_MODEL_CACHE_CHECK_INTERVAL = 1.0
+
+CORE_MODEL_CACHE_LOCAL_TIMEOUT = 60
+
+# Full text search backend per database alias, "fts5" (SQLite default),
+# "tsvector" (PostgreSQL default) or "database"
+SEARCH_BACKENDS = {}
+
+SEARCH_MAX_RESULTS = 500
+
+# Cache of the active items used by the order line forms, the cache must be
+# shared by the workers (e.g. redis) for an item change to show up before
+# the timeout in the other processes
+SALES_ITEM_CATALOG_CACHE = "default"
+
+SALES_ITEM_CATALOG_TIMEOUT = 60 * 5
+
+# Maximum number of salers or customers returned by the autocomplete
+SALES_AUTOCOMPLETE_LIMIT = 20
+
+# Cache of the counts of the lists with keyset pagination
+CORE_LIST_COUNT_CACHE = "default"
+CORE_LIST_COUNT_TIMEOUT = 60
+
+# SQL profiling of the requests (always on in DEBUG), a request over one of
+# the budgets (number of queries, seconds in the database, repetitions of a
+# similar query) is logged by the core.profiling logger
+CORE_QUERY_PROFILING = False
+CORE_QUERY_BUDGET = {"queries": 30, "time": 0.2, "similar": 5}
+
+# CPU profiles of the superuser requests with ?profile=1 or the X-Profile
+# header, the oldest ones are removed after CORE_PROFILE_MAX_FILES
+CORE_PROFILE_DIR = BASE_DIR / "profiles"
+CORE_PROFILE_MAX_FILES = 100
+
+# Number of rows read and written at a time by the CSV and XLSX exports
+CORE_EXPORT_CHUNK_SIZE = 2000
+
+# Processes validating the rows of the import_sales_data command (1 to
+# validate them in the command process, the import view always validates
+# them in the request) and rows per process task
+SALES_IMPORT_WORKERS = int(os.getenv("SALES_IMPORT_WORKERS", 2))
+SALES_IMPORT_CHUNK_SIZE = 500
+
+# Bounding box in pixels of the reduced copies of the saler logos used by
+# the pdf and HTML templates, built with the build_logo_derivatives command
+# for the logos uploaded before
+SALES_LOGO_SIZES = {"pdf": (480, 192), "thumbnail": (240, 96)}
@@ -23,6 +23,7 @@ urlpatterns = [
     path("accounts/", include("users.urls")),
     path("sales/", include("sales.urls")),
     path("discuss/", include("discuss.urls")),
+    path("reporting/", include("reporting.urls")),
 ]
 
 handler404 = "core.views.custom_404"
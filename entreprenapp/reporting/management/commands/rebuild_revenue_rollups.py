@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ...models import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the revenue rollups from the invoices."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = rebuild_rollups(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"{count} rollups rebuilt"))
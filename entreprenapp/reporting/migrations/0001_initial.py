@@ -0,0 +1,123 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+TOTAL_FIELDS = ("total_duty_free", "total_tax", "total_including_tax")
+
+
+def fill_rollups(apps, schema_editor):
+    Invoice = apps.get_model("sales", "Invoice")
+    RevenueRollup = apps.get_model("reporting", "RevenueRollup")
+    rows = (
+        Invoice.objects.filter(is_active=True)
+        .annotate(month=TruncMonth("date"))
+        .values("saler_id", "customer_id", "month", "is_paid")
+        .annotate(
+            invoice_count=Count("pk"),
+            **{name: Sum(name) for name in TOTAL_FIELDS},
+        )
+        .order_by()
+    )
+    RevenueRollup.objects.bulk_create(
+        (RevenueRollup(**row) for row in rows), batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("sales", "0005_invoice_rollup_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RevenueRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField(verbose_name="month")),
+                ("is_paid", models.BooleanField(verbose_name="is paid")),
+                (
+                    "invoice_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="invoice count"
+                    ),
+                ),
+                (
+                    "total_duty_free",
+                    models.DecimalField(
+                        decimal_places=6,
+                        default=0,
+                        max_digits=20,
+                        verbose_name="total duty free",
+                    ),
+                ),
+                (
+                    "total_tax",
+                    models.DecimalField(
+                        decimal_places=6,
+                        default=0,
+                        max_digits=20,
+                        verbose_name="total tax",
+                    ),
+                ),
+                (
+                    "total_including_tax",
+                    models.DecimalField(
+                        decimal_places=6,
+                        default=0,
+                        max_digits=20,
+                        verbose_name="total including tax",
+                    ),
+                ),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="sales.customer",
+                        verbose_name="customer",
+                    ),
+                ),
+                (
+                    "saler",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="sales.saler",
+                        verbose_name="saler",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Revenue rollup",
+                "verbose_name_plural": "Revenue rollups",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="revenuerollup",
+            index=models.Index(
+                fields=["month", "saler"], name="reporting_rollup_month_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="revenuerollup",
+            constraint=models.UniqueConstraint(
+                fields=("saler", "customer", "month", "is_paid"),
+                name="reporting_revenue_rollup_unique",
+            ),
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,299 @@
+"""Revenue rollups of the invoices.
+
+A RevenueRollup row holds the number and the totals of the active invoices
+of a saler, a customer, a month and a payment status. The rows of the
+changed invoices are recomputed once after the commit of the transaction,
+so the reports only read the rollups and never the invoices."""
+import threading
+from datetime import datetime, timedelta
+
+from django.db import models, router, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from sales.models import TOTAL_FIELDS, Invoice, totals_updated
+
+KEY_FIELDS = ("saler_id", "customer_id", "date", "is_paid")
+# fields of the invoices changing their rollups
+ROLLUP_FIELDS = KEY_FIELDS + ("is_active",) + TOTAL_FIELDS
+
+
+class RevenueRollup(models.Model):
+    saler = models.ForeignKey(
+        "sales.Saler",
+        verbose_name=_("saler"),
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+    customer = models.ForeignKey(
+        "sales.Customer",
+        verbose_name=_("customer"),
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+    month = models.DateField(_("month"))
+    is_paid = models.BooleanField(_("is paid"))
+    invoice_count = models.PositiveIntegerField(_("invoice count"), default=0)
+    total_duty_free = models.DecimalField(
+        _("total duty free"), max_digits=20, decimal_places=6, default=0
+    )
+    total_tax = models.DecimalField(
+        _("total tax"), max_digits=20, decimal_places=6, default=0
+    )
+    total_including_tax = models.DecimalField(
+        _("total including tax"), max_digits=20, decimal_places=6, default=0
+    )
+
+    def __str__(self):
+        return f"{self.saler_id} - {self.customer_id} - {self.month:%Y-%m}"
+
+    class Meta:
+        verbose_name = _("Revenue rollup")
+        verbose_name_plural = _("Revenue rollups")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["saler", "customer", "month", "is_paid"],
+                name="reporting_revenue_rollup_unique",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["month", "saler"], name="reporting_rollup_month_idx"
+            )
+        ]
+
+
+def month_start(day):
+    if isinstance(day, datetime):
+        day = day.date()
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def rollup_key(saler_id, customer_id, day, is_paid):
+    return saler_id, customer_id, month_start(day), is_paid
+
+
+def _aggregate(queryset):
+    return (
+        queryset.filter(is_active=True)
+        .annotate(month=TruncMonth("date"))
+        .values("saler_id", "customer_id", "month", "is_paid")
+        .annotate(
+            invoice_count=Count("pk"),
+            **{name: Sum(name) for name in TOTAL_FIELDS},
+        )
+        .order_by()
+    )
+
+
+def _key_filter(keys):
+    """Return the lookups of the smallest range of rows containing keys."""
+    months = [key[2] for key in keys]
+    return {
+        "saler_id__in": {key[0] for key in keys},
+        "customer_id__in": {key[1] for key in keys},
+        "date__gte": min(months),
+        "date__lt": next_month(max(months)),
+    }
+
+
+def refresh_rollups(keys):
+    """Recompute the rollups of the (saler, customer, month, is_paid) keys
+    from the invoices, with a constant number of queries.
+
+    The rollups of the keys are created when missing and locked before the
+    invoices are read, a concurrent refresh of the same keys waits for the
+    commit of this one and then reads the invoices it wrote."""
+    keys = set(keys)
+    if not keys:
+        return
+    lookups = _key_filter(keys)
+    rollup_lookups = {
+        "saler_id__in": lookups["saler_id__in"],
+        "customer_id__in": lookups["customer_id__in"],
+        "month__gte": lookups["date__gte"],
+        "month__lt": lookups["date__lt"],
+    }
+    with transaction.atomic():
+        RevenueRollup.objects.bulk_create(
+            [
+                RevenueRollup(
+                    saler_id=key[0],
+                    customer_id=key[1],
+                    month=key[2],
+                    is_paid=key[3],
+                )
+                for key in keys
+            ],
+            ignore_conflicts=True,
+        )
+        rollups = {
+            (obj.saler_id, obj.customer_id, obj.month, obj.is_paid): obj
+            for obj in RevenueRollup.objects.select_for_update()
+            .filter(**rollup_lookups)
+            .order_by("pk")
+        }
+        totals = {}
+        for row in _aggregate(Invoice.objects.filter(**lookups)):
+            key = rollup_key(
+                row["saler_id"],
+                row["customer_id"],
+                row["month"],
+                row["is_paid"],
+            )
+            if key in keys:
+                totals[key] = row
+        to_update, to_delete = [], []
+        for key in keys:
+            rollup = rollups[key]
+            if key not in totals:
+                to_delete.append(rollup.pk)
+                continue
+            for name in ("invoice_count",) + TOTAL_FIELDS:
+                setattr(rollup, name, totals[key][name])
+            to_update.append(rollup)
+        RevenueRollup.objects.filter(pk__in=to_delete).delete()
+        RevenueRollup.objects.bulk_update(
+            to_update, ("invoice_count",) + TOTAL_FIELDS
+        )
+
+
+def rebuild_rollups(batch_size=1000):
+    """Replace every rollup by the aggregates of the invoices.
+    Return the number of rollups."""
+    count = 0
+    with transaction.atomic():
+        RevenueRollup.objects.all().delete()
+        batch = []
+        for row in _aggregate(Invoice.objects.all()).iterator(
+            chunk_size=batch_size
+        ):
+            batch.append(RevenueRollup(**row))
+            if len(batch) == batch_size:
+                RevenueRollup.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        RevenueRollup.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+class PendingRefresh:
+    """Keys of the rollups to refresh after the commit of a transaction."""
+
+    def __init__(self, using):
+        self.using = using
+        self.keys = set()
+
+    def __call__(self):
+        if _pending.refreshes.get(self.using) is self:
+            del _pending.refreshes[self.using]
+        refresh_rollups(self.keys)
+
+
+_pending = threading.local()
+
+
+def schedule_refresh(keys, using):
+    """Refresh the rollups of the keys after the commit of the current
+    transaction, with the other keys scheduled until then."""
+    keys = set(keys)
+    if not keys:
+        return
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        refresh_rollups(keys)
+        return
+    if not hasattr(_pending, "refreshes"):
+        _pending.refreshes = {}
+    refresh = _pending.refreshes.get(using)
+    # the callbacks of a rolled back transaction are discarded
+    if refresh is None or all(
+        entry[1] is not refresh for entry in connection.run_on_commit
+    ):
+        refresh = _pending.refreshes[using] = PendingRefresh(using)
+        transaction.on_commit(refresh, using=using)
+    refresh.keys.update(keys)
+
+
+def rollup_values(instance):
+    return {name: getattr(instance, name) for name in ROLLUP_FIELDS}
+
+
+def loaded_rollup_values(instance):
+    """Return the rollup values of the invoice in the database,
+    or None when they weren't loaded."""
+    loaded = instance._loaded_values or {}
+    if any(name not in loaded for name in ROLLUP_FIELDS):
+        return None
+    return {name: loaded[name] for name in ROLLUP_FIELDS}
+
+
+def loaded_rollup_key(values):
+    return rollup_key(*(values[name] for name in KEY_FIELDS))
+
+
+@receiver(pre_save, sender=Invoice)
+def collect_loaded_rollup(sender, instance, **kwargs):
+    # the invoices loaded without the rollup fields read them again
+    if instance.pk and loaded_rollup_values(instance) is None:
+        loaded = (
+            Invoice.objects.filter(pk=instance.pk)
+            .values(*ROLLUP_FIELDS)
+            .first()
+        )
+        if loaded is not None:
+            instance._loaded_values = {
+                **(instance._loaded_values or {}),
+                **loaded,
+            }
+
+
+@receiver(post_save, sender=Invoice)
+def update_invoice_rollups(sender, instance, using, **kwargs):
+    values = rollup_values(instance)
+    loaded = loaded_rollup_values(instance)
+    if values != loaded:
+        keys = {loaded_rollup_key(values)}
+        if loaded is not None:
+            keys.add(loaded_rollup_key(loaded))
+        schedule_refresh(keys, using)
+    instance._loaded_values = {**(instance._loaded_values or {}), **values}
+
+
+@receiver(post_delete, sender=Invoice)
+def update_rollups_on_invoice_deleted(sender, instance, using, **kwargs):
+    keys = {loaded_rollup_key(rollup_values(instance))}
+    loaded = loaded_rollup_values(instance)
+    if loaded is not None:
+        keys.add(loaded_rollup_key(loaded))
+    schedule_refresh(keys, using)
+
+
+@receiver(totals_updated, sender=Invoice)
+def update_rollups_on_totals_updated(sender, pks, instances=(), **kwargs):
+    keys, pks = set(), set(pks)
+    for instance in instances:
+        loaded = loaded_rollup_values(instance)
+        if loaded is None:
+            continue
+        pks.discard(instance.pk)
+        totals = {name: getattr(instance, name) for name in TOTAL_FIELDS}
+        if any(loaded[name] != value for name, value in totals.items()):
+            # the unsaved changes of the key are found by the next save
+            keys.add(loaded_rollup_key(loaded))
+            instance._loaded_values.update(totals)
+    if pks:
+        keys.update(
+            rollup_key(*row)
+            for row in Invoice.objects.filter(pk__in=pks).values_list(
+                *KEY_FIELDS
+            )
+        )
+    schedule_refresh(keys, router.db_for_write(Invoice))
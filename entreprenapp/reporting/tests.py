@@ -0,0 +1,198 @@
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from sales.bulk import bulk_create_invoices
+from sales.models import Customer, Invoice, Item, OrderLine, Saler
+
+from .models import RevenueRollup
+
+
+class RevenueRollupTests(TransactionTestCase):
+    # the rollups are refreshed after the commit
+
+    def setUp(self):
+        self.saler = Saler.objects.create(
+            name="computer corporation", adress="15 Maltings", city="London"
+        )
+        self.customer = Customer.objects.create(
+            name="riot", adress="44 Maltings", city="London"
+        )
+        self.item = Item.objects.create(
+            label="Ulysse", price_duty_free=100, tax=10
+        )
+
+    def create_invoice(self, quantity=1, **kwargs):
+        data = {
+            "saler": self.saler,
+            "customer": self.customer,
+            "date": date(2022, 10, 15),
+            "is_paid": False,
+            **kwargs,
+        }
+        invoice = Invoice.objects.create(**data)
+        invoice.order_lines.set(
+            [OrderLine.objects.create(item=self.item, quantity=quantity)]
+        )
+        return invoice
+
+    def rollups(self):
+        return {
+            (rollup.month, rollup.is_paid): (
+                rollup.invoice_count,
+                rollup.total_including_tax,
+            )
+            for rollup in RevenueRollup.objects.all()
+        }
+
+    def test_incremental_updates(self):
+        october = date(2022, 10, 1)
+        invoice = self.create_invoice()
+        self.create_invoice(quantity=2)
+        self.assertEqual(
+            self.rollups(), {(october, False): (2, Decimal("330"))}
+        )
+        # paid
+        invoice.is_paid = True
+        invoice.save()
+        self.assertEqual(
+            self.rollups(),
+            {
+                (october, False): (1, Decimal("220")),
+                (october, True): (1, Decimal("110")),
+            },
+        )
+        # order line changes, the invoices keep their item prices
+        order_line = invoice.order_lines.get()
+        order_line.quantity = 3
+        order_line.save()
+        self.item.price_duty_free = 10
+        self.item.save()
+        self.assertEqual(
+            self.rollups(),
+            {
+                (october, False): (1, Decimal("220")),
+                (october, True): (1, Decimal("330")),
+            },
+        )
+        # moved to another month then soft deleted
+        invoice.date = date(2022, 11, 2)
+        invoice.save()
+        self.assertIn((date(2022, 11, 1), True), self.rollups())
+        invoice.is_active = False
+        invoice.save()
+        self.assertEqual(
+            self.rollups(), {(october, False): (1, Decimal("220"))}
+        )
+        Invoice.objects.all().delete()
+        self.assertEqual(self.rollups(), {})
+
+    def test_bulk_created_invoices(self):
+        bulk_create_invoices(
+            {
+                "saler": self.saler.pk,
+                "customer": self.customer.pk,
+                "date": date(2022, 10, day),
+                "order_lines": [{"item": self.item.pk, "quantity": 1}],
+            }
+            for day in range(1, 11)
+        )
+        self.assertEqual(
+            self.rollups(), {(date(2022, 10, 1), False): (10, Decimal("1100"))}
+        )
+
+    def test_rebuild_command(self):
+        self.create_invoice()
+        self.create_invoice(date=date(2022, 9, 30), is_paid=True)
+        expected = self.rollups()
+        RevenueRollup.objects.all().delete()
+        out = StringIO()
+        call_command("rebuild_revenue_rollups", stdout=out)
+        self.assertIn("2 rollups rebuilt", out.getvalue())
+        self.assertEqual(self.rollups(), expected)
+
+    def test_revenue_view(self):
+        user = get_user_model().objects.create_user(
+            email="user@test.com", password="password123"
+        )
+        url = reverse("reporting:revenue")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(user)
+        for month in range(1, 13):
+            self.create_invoice(date=date(2022, month, 1), is_paid=month > 6)
+        # session, user, years, total, months, salers, customers
+        with self.assertNumQueries(7):
+            response = self.client.get(url, {"year": 2022})
+        self.assertEqual(response.context["years"], [2022])
+        self.assertEqual(len(response.context["months"]), 12)
+        total = response.context["total"]
+        self.assertEqual(total["invoice_count"], 12)
+        self.assertEqual(total["paid"], Decimal("660"))
+        self.assertEqual(total["unpaid"], Decimal("660"))
+        self.assertContains(response, self.saler.name)
+        for year in ("0", "99999", "-1", "year"):
+            response = self.client.get(url, {"year": year})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context["year"], date.today().year)
+
+
+class RevenueRollupQueryCountTests(TestCase):
+    """The rollups of an invoice are refreshed once per transaction"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            email="user@test.com", password="password123"
+        )
+        self.client.force_login(user)
+        self.saler = Saler.objects.create(
+            name="computer corporation", adress="15 Maltings", city="London"
+        )
+        self.customer = Customer.objects.create(
+            name="riot", adress="44 Maltings", city="London"
+        )
+        self.item = Item.objects.create(
+            label="Ulysse", price_duty_free=100, tax=10
+        )
+
+    def post(self, url, quantity, **kwargs):
+        data = {
+            "saler": self.saler.pk,
+            "customer": self.customer.pk,
+            "date": date(2022, 10, 15),
+            "is_paid": "",
+            "form-TOTAL_FORMS": "1",
+            "form-INITIAL_FORMS": "0",
+            "form-0-item": self.item.pk,
+            "form-0-quantity": quantity,
+            **kwargs,
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+
+    def test_create_and_update_queries(self):
+        # the rollup is refreshed with 6 queries after the commit
+        with self.assertNumQueries(38):
+            self.post(reverse("sales:invoice_create"), 1)
+        invoice = Invoice.objects.get()
+        order_line = invoice.order_lines.get()
+        with self.assertNumQueries(32):
+            self.post(
+                reverse("sales:invoice_update", args=[invoice.pk]),
+                2,
+                **{"form-INITIAL_FORMS": "1", "form-0-id": order_line.pk},
+            )
+        self.assertEqual(
+            list(
+                RevenueRollup.objects.values_list(
+                    "invoice_count", "total_including_tax"
+                )
+            ),
+            [(1, Decimal("220"))],
+        )
@@ -0,0 +1,9 @@
+from django.urls import path
+
+from .views import RevenueDashboardView
+
+app_name = "reporting"
+
+urlpatterns = [
+    path("revenue/", RevenueDashboardView.as_view(), name="revenue"),
+]
@@ -0,0 +1,61 @@
+from datetime import MAXYEAR, MINYEAR, date
+
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models import Q, Sum
+from django.views.generic import TemplateView
+
+from .models import RevenueRollup
+
+
+def revenue_aggregates():
+    """Return the invoice count and the paid, unpaid and total revenue
+    aggregates of the rollups."""
+    return {
+        "invoice_count": Sum("invoice_count", default=0),
+        "paid": Sum("total_including_tax", filter=Q(is_paid=True), default=0),
+        "unpaid": Sum(
+            "total_including_tax", filter=Q(is_paid=False), default=0
+        ),
+        "total": Sum("total_including_tax", default=0),
+    }
+
+
+def revenue(queryset):
+    return queryset.annotate(**revenue_aggregates())
+
+
+class RevenueDashboardView(LoginRequiredMixin, TemplateView):
+    """Revenue of a year by month, saler and customer,
+    only read from the revenue rollups"""
+
+    template_name = "reporting/revenue.html"
+    top_customers = 10
+
+    def get_year(self):
+        try:
+            year = int(self.request.GET.get("year", ""))
+        except ValueError:
+            return date.today().year
+        # a date lookup can't be built out of the date range
+        if not MINYEAR <= year <= MAXYEAR:
+            return date.today().year
+        return year
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        year = self.get_year()
+        rollups = RevenueRollup.objects.filter(month__year=year).order_by()
+        context["year"] = year
+        context["years"] = [
+            month.year
+            for month in RevenueRollup.objects.dates("month", "year", "DESC")
+        ]
+        context["months"] = revenue(rollups.values("month")).order_by("month")
+        context["salers"] = revenue(rollups.values("saler__name")).order_by(
+            "-total"
+        )
+        context["customers"] = revenue(
+            rollups.values("customer__name")
+        ).order_by("-total")[: self.top_customers]
+        context["total"] = rollups.aggregate(**revenue_aggregates())
+        return context
@@ -1,10 +1,23 @@
 from django.contrib import admin
+from django.utils.translation import gettext_lazy as _
 
+from .bulk import convert_estimates
 from .models import Customer, Estimate, Invoice, Item, OrderLine, Saler
 
 admin.site.register(Saler)
 admin.site.register(Customer)
 admin.site.register(Item)
 admin.site.register(OrderLine)
-admin.site.register(Estimate)
 admin.site.register(Invoice)
+
+
+@admin.register(Estimate)
+class EstimateAdmin(admin.ModelAdmin):
+    actions = ["turn_into_invoices"]
+
+    @admin.action(description=_("Turn the selected estimates into invoices"))
+    def turn_into_invoices(self, request, queryset):
+        invoices = convert_estimates(queryset, user=request.user)
+        self.message_user(
+            request, _(f"{len(invoices)} invoice(s) were created successfully")
+        )
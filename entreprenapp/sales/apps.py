@@ -4,3 +4,16 @@ from django.apps import AppConfig
 class SalesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "sales"
+
+    def ready(self):
+        from core import pagination
+        from core.cache import model_cache
+
+        # connect the pdf, item catalog, logo and search index signals and
+        # register the checks
+        from . import catalog, checks, images, pdf, search  # noqa: F401
+        from .models import Customer, Estimate, Invoice, Item, Saler
+
+        model_cache.register(Saler, Customer, Item)
+        # the lists with keyset pagination
+        pagination.register(Estimate, Invoice)
@@ -0,0 +1,277 @@
+"""Bulk creation of invoices for the recurring billing runs and of the
+invoices of accepted estimates.
+
+An invoice is described by a dict::
+
+    {
+        "saler": 1,
+        "customer": 2,
+        "date": date(2022, 10, 1),
+        "is_paid": False,
+        "order_lines": [{"item": 3, "quantity": 2}],
+    }
+
+An estimate is described the same way, with an optional "validity_date"
+(30 days after the date by default) instead of "is_paid".
+
+Each batch is created in a single transaction with one bulk insert for the
+order lines, one for the invoices and one for the through rows. The invoice
+numbers are reserved in a block per saler and the totals are computed
+in memory. Instead of the per instance signals, totals_updated is sent,
+the search index is written and the list counts are dropped once for the
+whole batch.
+
+convert_estimates creates the invoices of estimates the same way. The
+order lines are copied with the prices of the estimate, an invoice never
+shares an order line with its estimate, so changing one doesn't change
+the other."""
+from collections import defaultdict
+from datetime import date
+
+from core import pagination, search
+from dateutil.relativedelta import relativedelta
+from django.db import transaction
+from django.utils import timezone
+
+from . import numbering
+from .models import (
+    TOTAL_FIELDS,
+    Customer,
+    Estimate,
+    Invoice,
+    Item,
+    OrderLine,
+    Saler,
+    compute_totals,
+    totals_updated,
+)
+
+# the saler counter and the document field of the numbers
+NUMBER_FIELDS = {
+    Invoice: ("invoice_number", "invoice_saler_number"),
+    Estimate: ("estimate_number", "estimate_saler_number"),
+}
+
+
+class BulkInvoiceError(Exception):
+    """An invoice (or estimate) of the batch is not valid."""
+
+    def __init__(self, index, message, document="invoice"):
+        super().__init__(f"{document} {index}: {message}")
+        self.index = index
+
+
+def _document_fields(model, data):
+    if model is Invoice:
+        return {"is_paid": data.get("is_paid", False)}
+    return {
+        "validity_date": data.get("validity_date")
+        or data["date"] + relativedelta(days=30)
+    }
+
+
+def _validate(model, index, data, salers, customers, items):
+    document = model._meta.model_name
+
+    def error(message):
+        return BulkInvoiceError(index, message, document)
+
+    if data.get("saler") not in salers:
+        raise error(f"unknown saler {data.get('saler')}")
+    if data.get("customer") not in customers:
+        raise error(f"unknown customer {data.get('customer')}")
+    if not isinstance(data.get("date"), date):
+        raise error("date must be a date")
+    if data.get("validity_date") and not isinstance(
+        data["validity_date"], date
+    ):
+        raise error("validity_date must be a date")
+    if not data.get("order_lines"):
+        raise error(f"an {document} needs order lines")
+    for order_line in data["order_lines"]:
+        if order_line.get("item") not in items:
+            raise error(f"unknown item {order_line.get('item')}")
+        quantity = order_line.get("quantity", 1)
+        if not isinstance(quantity, int) or quantity < 1:
+            raise error(f"invalid quantity {quantity}")
+
+
+def _create_batch(model, invoices_data, start, user):
+    salers = Saler.objects.in_bulk(
+        {data.get("saler") for data in invoices_data}
+    )
+    customers = Customer.objects.in_bulk(
+        {data.get("customer") for data in invoices_data}
+    )
+    items = Item.objects.filter(is_active=True).in_bulk(
+        {
+            order_line.get("item")
+            for data in invoices_data
+            for order_line in data.get("order_lines") or []
+        }
+    )
+    for index, data in enumerate(invoices_data, start):
+        _validate(model, index, data, salers, customers, items)
+    # the order lines get the current prices of their item
+    invoices_data = [
+        {
+            **data,
+            "order_lines": [
+                {
+                    "item": line["item"],
+                    "quantity": line.get("quantity", 1),
+                    "price_duty_free": items[line["item"]].price_duty_free,
+                    "tax": items[line["item"]].tax,
+                }
+                for line in data["order_lines"]
+            ],
+        }
+        for data in invoices_data
+    ]
+    return _insert(model, invoices_data, salers, customers, user)
+
+
+def _insert(model, invoices_data, salers, customers, user):
+    counter_field, number_field = NUMBER_FIELDS[model]
+
+    invoices_per_saler = defaultdict(int)
+    for data in invoices_data:
+        invoices_per_saler[data["saler"]] += 1
+    numbers = {
+        saler_pk: iter(
+            numbering.reserve_numbers(salers[saler_pk], counter_field, count)
+        )
+        for saler_pk, count in invoices_per_saler.items()
+    }
+
+    invoices = []
+    order_lines = []
+    for data in invoices_data:
+        lines = []
+        for line in data["order_lines"]:
+            order_line = OrderLine(
+                item_id=line["item"],
+                quantity=line["quantity"],
+                price_duty_free=line["price_duty_free"],
+                tax=line["tax"],
+                created_by=user,
+            )
+            order_line.set_totals()
+            lines.append(order_line)
+        totals = compute_totals(
+            (line.total_duty_free, line.total_tax) for line in lines
+        )
+        invoices.append(
+            model(
+                saler=salers[data["saler"]],
+                customer=customers[data["customer"]],
+                date=data["date"],
+                created_by=user,
+                **{number_field: next(numbers[data["saler"]])},
+                **_document_fields(model, data),
+                **dict(zip(TOTAL_FIELDS, totals)),
+            )
+        )
+        order_lines.append(lines)
+
+    OrderLine.objects.bulk_create(
+        [line for lines in order_lines for line in lines]
+    )
+    model.objects.bulk_create(invoices)
+    through = model.order_lines.through
+    document_field = f"{model._meta.model_name}_id"
+    through.objects.bulk_create(
+        [
+            through(**{document_field: invoice.pk}, orderline_id=line.pk)
+            for invoice, lines in zip(invoices, order_lines)
+            for line in lines
+        ]
+    )
+    totals_updated.send(sender=model, pks=[invoice.pk for invoice in invoices])
+    search.update_index(invoices)
+    # the bulk inserts don't send post_save
+    pagination.invalidate_counts(model)
+    return invoices
+
+
+def _bulk_create(model, documents_data, user, batch_size):
+    documents_data = list(documents_data)
+    documents = []
+    for start in range(0, len(documents_data), batch_size):
+        end = start + batch_size
+        with transaction.atomic():
+            documents += _create_batch(
+                model, documents_data[start:end], start, user
+            )
+    return documents
+
+
+def bulk_create_invoices(invoices_data, user=None, batch_size=500):
+    """Create the invoices described by invoices_data and return them.
+
+    Every batch is created in its own transaction, a BulkInvoiceError stops
+    the creation at the first invalid invoice of a batch and roll it back."""
+    return _bulk_create(Invoice, invoices_data, user, batch_size)
+
+
+def bulk_create_estimates(estimates_data, user=None, batch_size=500):
+    """Create the estimates described by estimates_data and return them,
+    like bulk_create_invoices."""
+    return _bulk_create(Estimate, estimates_data, user, batch_size)
+
+
+def _convert_batch(pks, user, today):
+    estimates = list(
+        Estimate.objects.filter(pk__in=pks)
+        .select_related("saler", "customer")
+        .order_by("pk")
+    )
+    through = Estimate.order_lines.through
+    lines = defaultdict(list)
+    # the invoice keeps the prices of the estimate
+    for estimate_pk, *line in (
+        through.objects.filter(estimate_id__in=pks)
+        .order_by("orderline_id")
+        .values_list(
+            "estimate_id",
+            "orderline__item_id",
+            "orderline__quantity",
+            "orderline__price_duty_free",
+            "orderline__tax",
+        )
+    ):
+        lines[estimate_pk].append(
+            dict(zip(("item", "quantity", "price_duty_free", "tax"), line))
+        )
+    salers = {estimate.saler_id: estimate.saler for estimate in estimates}
+    customers = {
+        estimate.customer_id: estimate.customer for estimate in estimates
+    }
+    invoices_data = [
+        {
+            "saler": estimate.saler_id,
+            "customer": estimate.customer_id,
+            "date": today,
+            "is_paid": False,
+            "order_lines": lines[estimate.pk],
+        }
+        for estimate in estimates
+    ]
+    return _insert(Invoice, invoices_data, salers, customers, user)
+
+
+def convert_estimates(estimates, user=None, batch_size=500):
+    """Create an invoice dated today for every estimate of the queryset,
+    with copies of its order lines, and return the invoices.
+
+    The conversion is a single transaction. The estimates are read and
+    the invoices written batch_size at a time, with a block of invoice
+    numbers per saler and batch."""
+    pks = list(estimates.order_by("pk").values_list("pk", flat=True))
+    today = timezone.localdate()
+    invoices = []
+    with transaction.atomic():
+        for start in range(0, len(pks), batch_size):
+            end = start + batch_size
+            invoices += _convert_batch(pks[start:end], user, today)
+    return invoices
@@ -0,0 +1,90 @@
+"""Catalog of the active items shared by the order line forms.
+
+The items and the HTML of their <option> are cached in
+SALES_ITEM_CATALOG_CACHE for SALES_ITEM_CATALOG_TIMEOUT seconds and dropped
+when an item is saved or deleted. A request loads the catalog once and
+every form of its formsets use it to render and validate the item field,
+so the size of the formset doesn't change the number of queries.
+
+The catalog dropped by a process is only dropped for the others through a
+shared cache, the prices of the order lines are always read from the
+database."""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.html import format_html, format_html_join
+
+from .models import Item
+
+CACHE_KEY = "sales-item-catalog"
+
+
+def get_cache():
+    return caches[getattr(settings, "SALES_ITEM_CATALOG_CACHE", "default")]
+
+
+def get_timeout():
+    return getattr(settings, "SALES_ITEM_CATALOG_TIMEOUT", 300)
+
+
+class ItemCatalog:
+    def __init__(self):
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = get_cache().get(CACHE_KEY)
+            if self._data is None:
+                self._data = self.build()
+                get_cache().set(CACHE_KEY, self._data, get_timeout())
+        return self._data
+
+    @property
+    def items(self):
+        """Active items by pk."""
+        return self.data["items"]
+
+    @property
+    def options_html(self):
+        """The <option> of every active item, none selected."""
+        return self.data["options_html"]
+
+    def build(self):
+        items = {
+            item.pk: item
+            for item in Item.objects.filter(is_active=True).order_by("label")
+        }
+        options_html = format_html_join(
+            "",
+            '<option value="{}" data-total="{}" data-index="{}">{}</option>',
+            (
+                (pk, item.including_tax, pk, str(item))
+                for pk, item in items.items()
+            ),
+        )
+        return {"items": items, "options_html": str(options_html)}
+
+    def render_options(self, selected=()):
+        """Return the options HTML with the selected values marked."""
+        html = self.options_html
+        for value in selected:
+            if value:
+                option = format_html('<option value="{}"', value)
+                html = html.replace(option, f"{option} selected", 1)
+        return html
+
+
+def invalidate():
+    get_cache().delete(CACHE_KEY)
+    # a request could cache the catalog again before the commit
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: get_cache().delete(CACHE_KEY))
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_item_catalog(sender, **kwargs):
+    invalidate()
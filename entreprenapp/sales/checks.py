@@ -0,0 +1,9 @@
+from core.checks import check_shared_caches
+from django.core.checks import Tags, register
+
+
+@register(Tags.caches, deploy=True)
+def check_sales_caches(app_configs, **kwargs):
+    return check_shared_caches(
+        ("SALES_PDF_CACHE", "default"), ("SALES_ITEM_CATALOG_CACHE", "default")
+    )
@@ -4,8 +4,23 @@ from crispy_bootstrap5.bootstrap5 import FloatingField
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import HTML, Column, Div, Field, Layout, Row, Submit
 from dateutil.relativedelta import relativedelta
-from django.forms import ModelChoiceField, ModelForm, Select
-
+from django.core.exceptions import ValidationError
+from django.forms import (
+    ChoiceField,
+    DateField,
+    FileField,
+    Form,
+    ModelChoiceField,
+    ModelForm,
+    ModelMultipleChoiceField,
+    Select,
+)
+from django.forms.utils import flatatt
+from django.urls import reverse_lazy
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from .catalog import ItemCatalog
 from .models import Customer, Estimate, Invoice, Item, OrderLine, Saler
 
 
@@ -38,21 +53,84 @@ class SelectWithOptionAttribute(Select):
         return option_dict
 
 
+class CatalogSelect(Select):
+    """Select rendered from the cached options of an item catalog"""
+
+    catalog = None
+
+    def render(self, name, value, attrs=None, renderer=None):
+        final_attrs = self.build_attrs(self.attrs, attrs)
+        final_attrs["name"] = name
+        selected = self.format_value(value)
+        empty_option = format_html(
+            '<option value=""{}>{}</option>',
+            "" if any(selected) else " selected",
+            self.empty_label,
+        )
+        return mark_safe(
+            f"<select{flatatt(final_attrs)}>{empty_option}"
+            f"{self.catalog.render_options(selected)}</select>"
+        )
+
+
+class AutocompleteSelect(Select):
+    """Select rendering only its selected option, the other options are
+    fetched from the url while the user types (see autocomplete.html)."""
+
+    def __init__(self, url, attrs=None):
+        super().__init__(attrs)
+        self.url = url
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context["widget"]["attrs"]["data-autocomplete-url"] = str(self.url)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        choices = self.choices
+        pks = [pk for pk in value if pk.isdigit()]
+        self.choices = [("", choices.field.empty_label or "")] + [
+            choices.choice(obj) for obj in choices.queryset.filter(pk__in=pks)
+        ]
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = choices
+
+
 class ItemChoiceField(ModelChoiceField):
-    """ChoiceField with puts data_total attribute on <options>"""
-
-    # Use our custom widget:
-    widget = SelectWithOptionAttribute
-
-    def label_from_instance(self, obj):
-        # 'obj' will be an Item
-        return {
-            # the usual label:
-            "label": super().label_from_instance(obj),
-            # the new data attribute:
-            "data-total": obj.including_tax,
-            "data-index": obj.pk,
-        }
+    """Choice of an active item, rendered and validated with an item
+    catalog shared by the forms of a formset. The options have the
+    data-total and data-index attributes used to compute the totals."""
+
+    widget = CatalogSelect
+
+    def __init__(self, *args, catalog=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_catalog(catalog)
+
+    def __deepcopy__(self, memo):
+        result = super().__deepcopy__(memo)
+        # the field of a form class never load the catalog
+        result.set_catalog(self.catalog or ItemCatalog())
+        return result
+
+    def set_catalog(self, catalog):
+        self.catalog = catalog
+        self.widget.catalog = catalog
+        self.widget.empty_label = self.empty_label or ""
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.catalog.items[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(
+                self.error_messages["invalid_choice"],
+                code="invalid_choice",
+                params={"value": value},
+            )
 
 
 class SalerForm(ModelForm):
@@ -142,10 +220,15 @@ class ItemForm(ModelForm):
 
 
 class OrderLineForm(ModelForm):
-    def __init__(self, *args, **kwargs):
+    """Order line form, the forms of a formset should share the item
+    catalog given by the catalog argument (see form_kwargs)."""
+
+    def __init__(self, *args, catalog=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields["quantity"].widget.attrs["min"] = 1
         self.fields["item"].queryset = Item.objects.filter(is_active=True)
+        if catalog is not None:
+            self.fields["item"].set_catalog(catalog)
         self.helper = FormHelper()
         self.helper.form_tag = False
         self.helper.layout = Layout(
@@ -243,6 +326,14 @@ class EstimateForm(ModelForm):
     class Meta:
         model = Estimate
         fields = ["saler", "customer", "date", "validity_date"]
+        widgets = {
+            "saler": AutocompleteSelect(
+                reverse_lazy("sales:autocomplete", args=["saler"])
+            ),
+            "customer": AutocompleteSelect(
+                reverse_lazy("sales:autocomplete", args=["customer"])
+            ),
+        }
 
 
 class InvoiceForm(ModelForm):
@@ -265,3 +356,71 @@ class InvoiceForm(ModelForm):
     class Meta:
         model = Invoice
         fields = ["saler", "customer", "date", "is_paid"]
+        widgets = {
+            "saler": AutocompleteSelect(
+                reverse_lazy("sales:autocomplete", args=["saler"])
+            ),
+            "customer": AutocompleteSelect(
+                reverse_lazy("sales:autocomplete", args=["customer"])
+            ),
+        }
+
+
+class SalesActionExportForm(Form):
+    """Select the estimates or invoices to export by month and saler"""
+
+    month = DateField(required=False, input_formats=["%Y-%m"])
+    saler = ModelChoiceField(queryset=Saler.objects.all(), required=False)
+
+    def filter(self, queryset):
+        month = self.cleaned_data.get("month")
+        saler = self.cleaned_data.get("saler")
+        if month:
+            queryset = queryset.filter(
+                date__gte=month, date__lt=month + relativedelta(months=1)
+            )
+        if saler:
+            queryset = queryset.filter(saler=saler)
+        return queryset
+
+    def archive_name(self, model):
+        name = model._meta.verbose_name_plural.lower()
+        if self.cleaned_data.get("saler"):
+            name += f"-{self.cleaned_data['saler'].pk}"
+        if self.cleaned_data.get("month"):
+            name += f"-{self.cleaned_data['month']:%Y-%m}"
+        return f"{name}.zip"
+
+
+class EstimateConvertForm(Form):
+    """Select the estimates to turn into invoices"""
+
+    estimates = ModelMultipleChoiceField(queryset=Estimate.objects.none())
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        queryset = Estimate.objects.all()
+        if user is None or not user.is_superuser:
+            queryset = queryset.filter(is_active=True)
+        self.fields["estimates"].queryset = queryset
+
+
+class ImportFileForm(Form):
+    """Upload a CSV file of customers or items"""
+
+    model = ChoiceField(choices=[("customer", "Customers"), ("item", "Items")])
+    file = FileField(
+        help_text="CSV file in UTF-8 with a header row, a row updates the "
+        "customer with the same name or the item with the same label."
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_method = "post"
+        self.helper.form_class = "col-11 col-md-8 mx-auto"
+        self.helper.layout = Layout(
+            Field("model"),
+            Field("file"),
+            Div(Submit("submit", "Import"), css_class="d-grid m-3"),
+        )
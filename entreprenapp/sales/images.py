@@ -0,0 +1,153 @@
+"""Size bounded derivatives of the saler logos.
+
+A saler logo is stored as uploaded, the pdf and HTML templates use its
+derivatives instead: a copy reduced to fit SALES_LOGO_SIZES and
+recompressed, in PNG when the logo is transparent and in JPEG otherwise.
+They are built when the logo changes and their dimensions are stored with
+the saler, build_logo_derivatives fills them for the existing logos."""
+import io
+import logging
+import os
+
+from core.cache import model_cache
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps
+
+from . import pdf
+from .models import Saler
+
+logger = logging.getLogger(__name__)
+
+# bounding box in pixels of each derivative, twice the size they are
+# displayed at so they stay sharp on high density screens and in print
+LOGO_SIZES = {"pdf": (480, 192), "thumbnail": (240, 96)}
+JPEG_QUALITY = 85
+
+
+def get_logo_sizes():
+    return {**LOGO_SIZES, **getattr(settings, "SALES_LOGO_SIZES", {})}
+
+
+def make_derivative(image, size):
+    """Return the content and extension of the image reduced to fit size,
+    and its dimensions."""
+    derivative = image.copy()
+    derivative.thumbnail(size, Image.LANCZOS)
+    output = io.BytesIO()
+    if derivative.mode in ("RGBA", "LA") or (
+        derivative.mode == "P" and "transparency" in derivative.info
+    ):
+        derivative.save(output, "PNG", optimize=True)
+        extension = "png"
+    else:
+        derivative.convert("RGB").save(
+            output, "JPEG", quality=JPEG_QUALITY, optimize=True
+        )
+        extension = "jpg"
+    return output.getvalue(), extension, derivative.size
+
+
+def open_logo(logo, size):
+    """Return the decoded image of the logo file, a JPEG is decoded at the
+    smallest scale still larger than size."""
+    committed = logo._committed
+    logo.open("rb")
+    try:
+        image = Image.open(logo)
+        image.draft("RGB", size)
+        image.load()
+    finally:
+        # an upload is written to the storage after the pre_save signal
+        if committed:
+            logo.close()
+        else:
+            logo.seek(0)
+    return ImageOps.exif_transpose(image)
+
+
+def delete_files(files):
+    """Delete the files from the storage after the commit, the saler still
+    has them if the transaction is rolled back."""
+    files = [file for file in files if file]
+    if files:
+        transaction.on_commit(
+            lambda: [file.delete(save=False) for file in files]
+        )
+
+
+def set_logo_derivatives(saler):
+    """Build the derivatives of the logo of the saler, they are cleared when
+    it has no logo or it can't be read, the previous files are deleted.
+    Return True when they were built."""
+    sizes = get_logo_sizes()
+    delete_files([getattr(saler, f"logo_{name}") for name in sizes])
+    for name in sizes:
+        setattr(saler, f"logo_{name}", None)
+        setattr(saler, f"logo_{name}_width", None)
+        setattr(saler, f"logo_{name}_height", None)
+    if not saler.logo:
+        return False
+    largest = tuple(map(max, zip(*sizes.values())))
+    try:
+        image = open_logo(saler.logo, largest)
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        logger.warning("Could not read the logo %s: %s", saler.logo, error)
+        return False
+    stem = os.path.splitext(os.path.basename(saler.logo.name))[0]
+    for name, size in sizes.items():
+        content, extension, (width, height) = make_derivative(image, size)
+        getattr(saler, f"logo_{name}").save(
+            f"{stem}.{extension}", ContentFile(content), save=False
+        )
+        setattr(saler, f"logo_{name}_width", width)
+        setattr(saler, f"logo_{name}_height", height)
+    return True
+
+
+def logo_changed(saler):
+    if "logo" not in saler.__dict__:
+        # deferred and not set
+        return False
+    return not saler.logo._committed or saler.logo.name != saler._loaded_logo
+
+
+@receiver(pre_save, sender=Saler)
+def update_logo_derivatives(sender, instance, raw=False, **kwargs):
+    if not raw and logo_changed(instance):
+        set_logo_derivatives(instance)
+
+
+@receiver(post_save, sender=Saler)
+def set_loaded_logo(sender, instance, **kwargs):
+    if "logo" in instance.__dict__:
+        instance._loaded_logo = instance.logo.name
+
+
+def build_logo_derivatives(queryset, force=False):
+    """Build the missing derivatives of the logos of the salers, all of
+    them when force is True. Return the number of salers updated."""
+    queryset = queryset.exclude(logo="").exclude(logo=None)
+    if not force:
+        queryset = queryset.filter(Q(logo_pdf="") | Q(logo_pdf=None))
+    fields = [
+        f"logo_{name}{suffix}"
+        for name in get_logo_sizes()
+        for suffix in ("", "_width", "_height")
+    ]
+    updated = []
+    for saler in queryset.order_by("pk").only("pk", "logo", *fields):
+        if set_logo_derivatives(saler):
+            # update doesn't send post_save, nor change the other fields
+            Saler.objects.filter(pk=saler.pk).update(
+                **{field: getattr(saler, field) for field in fields}
+            )
+            updated.append(saler.pk)
+    model_cache.invalidate(Saler, updated)
+    if updated:
+        pdf.invalidate(pdf._documents(saler__in=updated))
+    return len(updated)
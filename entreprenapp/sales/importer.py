@@ -0,0 +1,335 @@
+"""Import of customers and items from CSV files.
+
+The columns of the file are the fields of the model (name, adress, city,
+postal_code, country, email, phone_number for the customers, label,
+description, price_duty_free and tax for the items). The rows are
+validated with a ModelForm in chunks, spread across SALES_IMPORT_WORKERS
+processes, while the valid rows of the previous chunks are written.
+
+A row updates the instance with the same natural key (the name of a
+customer, the label of an item), reactivating it when it was deleted, or
+creates a new one, batch_size rows at a time with one bulk_create and one
+upsert on the primary key. The invalid rows are reported with their line
+number and not written."""
+import csv
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import django
+from core import pagination, search
+from core.cache import model_cache
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.forms import CharField, ModelForm
+from django_countries import countries
+
+from . import catalog, pdf
+from .models import Customer, Item
+
+
+class ImportFileError(ValueError):
+    """The file can't be imported at all."""
+
+
+class ImportForm(ModelForm):
+    """Validate the rows of a file, the duplicates are found by the import.
+    A form validates all the rows of a chunk, copying its fields for each
+    row would take as long as validating it."""
+
+    # the field identifying the instance updated by a row
+    natural_key = None
+
+    def __init__(self):
+        super().__init__({})
+
+    def clean_row(self, row):
+        """Validate the row and return its errors, its values are in
+        cleaned_data when there are none."""
+        self.data = row
+        self.instance = self._meta.model()
+        self._errors = None
+        return self.errors
+
+    def validate_unique(self):
+        pass
+
+
+@lru_cache
+def country_codes():
+    """Map the lowercase alpha2 and alpha3 codes and names of the countries
+    to their alpha2 code. A CountryField sorts the translated names of the
+    countries whenever its choices are read, once per row."""
+    codes = {}
+    for code, name in countries:
+        codes[code.lower()] = code
+        codes[countries.alpha3(code).lower()] = code
+        codes[str(name).lower()] = code
+    return codes
+
+
+class CountryCodeField(CharField):
+    """Country given by its code or its name"""
+
+    def to_python(self, value):
+        value = super().to_python(value)
+        if value and value.lower() not in country_codes():
+            raise ValidationError(
+                f"Unknown country {value}.", code="invalid_choice"
+            )
+        return country_codes().get(value.lower(), "")
+
+
+class CustomerImportForm(ImportForm):
+    natural_key = "name"
+    country = CountryCodeField(required=False)
+
+    def __init__(self):
+        super().__init__()
+        self.default_region = self.fields["phone_number"].region
+
+    def clean_row(self, row):
+        # the phone numbers are parsed as numbers of the country, the
+        # widget parses them before the field
+        country = (row.get("country") or "").strip().lower()
+        field = self.fields["phone_number"]
+        field.region = field.widget.region = (
+            country_codes().get(country) or self.default_region
+        )
+        return super().clean_row(row)
+
+    def _get_validation_exclusions(self):
+        # the form fields already validated them, the model validation of
+        # the country reads the choices again and the phone number is
+        # parsed again without the region of the country
+        exclusions = super()._get_validation_exclusions()
+        return exclusions | {"country", "phone_number"}
+
+    class Meta:
+        model = Customer
+        fields = [
+            "name",
+            "adress",
+            "city",
+            "postal_code",
+            "country",
+            "email",
+            "phone_number",
+        ]
+
+
+class ItemImportForm(ImportForm):
+    natural_key = "label"
+
+    class Meta:
+        model = Item
+        fields = ["label", "description", "price_duty_free", "tax"]
+
+
+FORMS = {"customer": CustomerImportForm, "item": ItemImportForm}
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        # deleted instances updated by a row
+        self.reactivated = 0
+        # (line, {field: [messages]}) of the invalid rows
+        self.errors = []
+
+    @property
+    def written(self):
+        return self.created + self.updated + self.reactivated
+
+
+def _init_worker():
+    if not settings.configured:
+        django.setup()
+
+
+def validate_rows(model_name, start, rows):
+    """Validate the rows, the first one being at line start of the file.
+    Return the (line, cleaned data) of the valid rows and the
+    (line, errors) of the invalid ones."""
+    form = FORMS[model_name]()
+    valid = []
+    errors = []
+    for line, row in enumerate(rows, start):
+        row_errors = form.clean_row(row)
+        if row_errors:
+            errors.append(
+                (
+                    line,
+                    {
+                        field: list(messages)
+                        for field, messages in row_errors.items()
+                    },
+                )
+            )
+        else:
+            valid.append((line, form.cleaned_data))
+    return valid, errors
+
+
+def _chunks(rows, chunk_size):
+    """Yield the (line, rows) of chunks of rows, after the header line"""
+    chunk = []
+    start = 2
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield start, chunk
+            start += chunk_size
+            chunk = []
+    if chunk:
+        yield start, chunk
+
+
+def _validated_chunks(model_name, rows, chunk_size, workers):
+    """Yield the validated chunks in order, with at most 2 * workers
+    chunks validated at the same time."""
+    if workers < 2:
+        for start, chunk in _chunks(rows, chunk_size):
+            yield validate_rows(model_name, start, chunk)
+        return
+    pending = deque()
+    with ProcessPoolExecutor(workers, initializer=_init_worker) as executor:
+        for start, chunk in _chunks(rows, chunk_size):
+            pending.append(
+                executor.submit(validate_rows, model_name, start, chunk)
+            )
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _write(form_class, rows, user):
+    """Create or update the instances of the cleaned rows, return the
+    number of created, updated and reactivated instances."""
+    model = form_class._meta.model
+    key = form_class.natural_key
+    fields = form_class._meta.fields
+    existing = {}
+    # the oldest active instance is updated when several have the same
+    # key, the oldest deleted one when none is active
+    for value, pk, is_active in (
+        model.objects.filter(**{f"{key}__in": [row[key] for row in rows]})
+        .order_by("is_active", "-pk")
+        .values_list(key, "pk", "is_active")
+    ):
+        existing[value] = pk, is_active
+    created = []
+    updated = []
+    reactivated = 0
+    for row in rows:
+        if row[key] in existing:
+            pk, is_active = existing[row[key]]
+            reactivated += not is_active
+            updated.append(
+                model(
+                    pk=pk,
+                    is_active=True,
+                    deleted_date=None,
+                    deleted_by=None,
+                    modified_by=user,
+                    **row,
+                )
+            )
+        else:
+            created.append(model(created_by=user, **row))
+    with transaction.atomic():
+        model.objects.bulk_create(created)
+        # an INSERT ... ON CONFLICT on the primary key is several times
+        # faster than the CASE WHEN of bulk_update
+        model.objects.bulk_create(
+            updated,
+            update_conflicts=True,
+            unique_fields=[model._meta.pk.name],
+            update_fields=[
+                *fields,
+                "is_active",
+                "deleted_date",
+                "deleted_by",
+                "modified_by",
+                "modified_date",
+            ],
+        )
+        search.update_index(created + updated)
+    # the bulk changes don't send post_save
+    updated_pks = [obj.pk for obj in updated]
+    model_cache.invalidate(model, updated_pks)
+    if model is Item:
+        catalog.invalidate()
+        lookup = "order_lines__item__in"
+    else:
+        lookup = "customer__in"
+    if updated_pks:
+        pdf.invalidate(pdf._documents(**{lookup: updated_pks}))
+    return len(created), len(updated) - reactivated, reactivated
+
+
+def _add_written(result, written):
+    created, updated, reactivated = written
+    result.created += created
+    result.updated += updated
+    result.reactivated += reactivated
+
+
+def import_rows(
+    model_name, rows, user=None, batch_size=1000, chunk_size=None, workers=None
+):
+    """Import the rows (dicts of the columns) of a customer or item file
+    and return an ImportResult. A row with the same natural key as a
+    previous row of the file is an error."""
+    form_class = FORMS[model_name]
+    chunk_size = chunk_size or getattr(
+        settings, "SALES_IMPORT_CHUNK_SIZE", 500
+    )
+    if workers is None:
+        workers = getattr(settings, "SALES_IMPORT_WORKERS", 2)
+    key = form_class.natural_key
+    result = ImportResult()
+    lines = {}
+    batch = []
+    for valid, errors in _validated_chunks(
+        model_name, rows, chunk_size, workers
+    ):
+        result.errors += errors
+        for line, data in valid:
+            if data[key] in lines:
+                result.errors.append(
+                    (line, {key: [f"Duplicate of line {lines[data[key]]}"]})
+                )
+                continue
+            lines[data[key]] = line
+            batch.append(data)
+            if len(batch) == batch_size:
+                _add_written(result, _write(form_class, batch, user))
+                batch = []
+    if batch:
+        _add_written(result, _write(form_class, batch, user))
+    result.errors.sort(key=lambda error: error[0])
+    if result.created or result.reactivated:
+        pagination.invalidate_counts(form_class._meta.model)
+    return result
+
+
+def read_csv(model_name, csv_file):
+    """Return the rows of a CSV file of customers or items, raise
+    ImportFileError when a column of a required field is missing."""
+    reader = csv.DictReader(csv_file)
+    form_class = FORMS[model_name]
+    required = [
+        name
+        for name, field in form_class.base_fields.items()
+        if field.required
+    ]
+    missing = [
+        name for name in required if name not in (reader.fieldnames or [])
+    ]
+    if missing:
+        raise ImportFileError(f"Missing column(s): {', '.join(missing)}")
+    return reader
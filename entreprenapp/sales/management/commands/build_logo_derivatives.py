@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from ...images import build_logo_derivatives
+from ...models import Saler
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the reduced copies of the saler logos used by the pdf and "
+        "HTML templates for the logos without them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Build them again for every logo, e.g. after a change of "
+            "SALES_LOGO_SIZES.",
+        )
+
+    def handle(self, *args, **options):
+        count = build_logo_derivatives(
+            Saler.objects.all(), force=options["force"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"{count} logo derivatives built")
+        )
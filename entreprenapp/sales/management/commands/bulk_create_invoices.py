@@ -0,0 +1,87 @@
+import csv
+import json
+import os
+import time
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from ...bulk import BulkInvoiceError, bulk_create_invoices
+
+TRUE_VALUES = {"1", "true", "yes", "y"}
+
+
+def read_json(path):
+    with open(path) as json_file:
+        invoices = json.load(json_file)
+    for invoice in invoices:
+        invoice["date"] = date.fromisoformat(invoice["date"])
+    return invoices
+
+
+def read_csv(path):
+    """One row per order line, the rows with the same invoice column
+    are the order lines of the same invoice."""
+    invoices = {}
+    with open(path, newline="") as csv_file:
+        for row in csv.DictReader(csv_file):
+            invoice = invoices.setdefault(
+                row["invoice"],
+                {
+                    "saler": int(row["saler"]),
+                    "customer": int(row["customer"]),
+                    "date": date.fromisoformat(row["date"]),
+                    "is_paid": row.get("is_paid", "").lower() in TRUE_VALUES,
+                    "order_lines": [],
+                },
+            )
+            invoice["order_lines"].append(
+                {"item": int(row["item"]), "quantity": int(row["quantity"])}
+            )
+    return list(invoices.values())
+
+
+class Command(BaseCommand):
+    help = "Create the invoices of a CSV or JSON file in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSON file of the invoices.")
+        parser.add_argument("--format", choices=["csv", "json"])
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--user", help="Email of the creator.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or os.path.splitext(path)[1][1:]
+        if file_format not in ("csv", "json"):
+            raise CommandError("Use --format to set the file format.")
+        user = None
+        if options["user"]:
+            try:
+                user = get_user_model().objects.get(email=options["user"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Unknown user {options['user']}")
+        try:
+            invoices_data = (
+                read_csv(path) if file_format == "csv" else read_json(path)
+            )
+        except (KeyError, ValueError) as error:
+            raise CommandError(f"Invalid {file_format} file: {error!r}")
+
+        start = time.perf_counter()
+        try:
+            invoices = bulk_create_invoices(
+                invoices_data, user=user, batch_size=options["batch_size"]
+            )
+        except BulkInvoiceError as error:
+            raise CommandError(str(error))
+        duration = time.perf_counter() - start
+        order_lines = sum(len(data["order_lines"]) for data in invoices_data)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(invoices)} invoices and {order_lines} order lines "
+                f"created in {duration:.2f}s "
+                f"({len(invoices) / max(duration, 1e-6):.0f} invoices/s)"
+            )
+        )
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import pdf
+from ...forms import SalesActionExportForm
+from ...models import Estimate, Invoice
+
+MODELS = {"estimate": Estimate, "invoice": Invoice}
+
+
+class Command(BaseCommand):
+    help = "Export the pdf of the estimates or invoices in a zip archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", choices=MODELS)
+        parser.add_argument("output", help="Path of the zip archive.")
+        parser.add_argument(
+            "--month", help="Month of the documents (YYYY-MM)."
+        )
+        parser.add_argument("--saler", help="Primary key of the saler.")
+        parser.add_argument(
+            "--inactive",
+            action="store_true",
+            help="Include the deleted documents.",
+        )
+
+    def handle(self, *args, **options):
+        form = SalesActionExportForm(
+            {"month": options["month"], "saler": options["saler"]}
+        )
+        if not form.is_valid():
+            raise CommandError(form.errors.as_text())
+        model = MODELS[options["model"]]
+        queryset = form.filter(model.objects.order_by("date", "id"))
+        if not options["inactive"]:
+            queryset = queryset.filter(is_active=True)
+        with open(options["output"], "wb") as archive:
+            for chunk in pdf.stream_zip(queryset):
+                archive.write(chunk)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{queryset.count()} {model._meta.verbose_name_plural} "
+                f"exported to {options['output']}"
+            )
+        )
@@ -0,0 +1,77 @@
+import csv
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from ...importer import FORMS, ImportFileError, import_rows, read_csv
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update the customers or items of a CSV file, a row "
+        "updates (or reactivates) the customer with the same name or the "
+        "item with the same label."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", choices=list(FORMS))
+        parser.add_argument("path", help="CSV file with a header row.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Number of validation processes (default: "
+            "SALES_IMPORT_WORKERS).",
+        )
+        parser.add_argument("--user", help="Email of the creator.")
+        parser.add_argument(
+            "--report", help="Write the invalid rows to a CSV file."
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            try:
+                user = get_user_model().objects.get(email=options["user"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Unknown user {options['user']}")
+
+        start = time.perf_counter()
+        with open(options["path"], newline="", encoding="utf-8-sig") as file:
+            try:
+                rows = read_csv(options["model"], file)
+            except ImportFileError as error:
+                raise CommandError(str(error))
+            result = import_rows(
+                options["model"],
+                rows,
+                user=user,
+                batch_size=options["batch_size"],
+                workers=options["workers"],
+            )
+        duration = time.perf_counter() - start
+
+        if options["report"]:
+            with open(options["report"], "w", newline="") as report:
+                writer = csv.writer(report)
+                writer.writerow(["line", "field", "error"])
+                for line, errors in result.errors:
+                    for field, messages in errors.items():
+                        for message in messages:
+                            writer.writerow([line, field, message])
+        else:
+            for line, errors in result.errors:
+                for field, messages in errors.items():
+                    self.stderr.write(
+                        f"Line {line}: {field}: {' '.join(messages)}"
+                    )
+        rows_count = result.written + len(result.errors)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{result.created} created, {result.updated} updated, "
+                f"{result.reactivated} reactivated, "
+                f"{len(result.errors)} invalid rows in {duration:.2f}s "
+                f"({rows_count / max(duration, 1e-6):.0f} rows/s)"
+            )
+        )
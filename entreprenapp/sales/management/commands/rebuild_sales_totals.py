@@ -0,0 +1,99 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import (
+    TOTAL_FIELDS,
+    Estimate,
+    Invoice,
+    OrderLine,
+    compute_sales_action_totals,
+    line_totals,
+    refresh_order_line_totals,
+    refresh_totals,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild or verify the stored totals of order lines, estimates "
+        "and invoices."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help=(
+                "Only report the order lines and documents with "
+                "inconsistent totals."
+            ),
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if options["check"]:
+            line_errors = self.check_order_lines(batch_size)
+            errors = sum(
+                self.check_totals(model, batch_size)
+                for model in (Estimate, Invoice)
+            )
+            if line_errors or errors:
+                raise CommandError(
+                    f"{line_errors} order line(s) and {errors} document(s) "
+                    "with wrong totals"
+                )
+            self.stdout.write(self.style.SUCCESS("All totals are valid"))
+            return
+        # the totals of the documents are the sums of the order lines
+        count = refresh_order_line_totals(OrderLine.objects.all(), batch_size)
+        self.stdout.write(self.style.SUCCESS(f"{count} order lines rebuilt"))
+        for model in (Estimate, Invoice):
+            count = refresh_totals(model.objects.all(), batch_size)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{count} {model._meta.verbose_name_plural} rebuilt"
+                )
+            )
+
+    def check_order_lines(self, batch_size):
+        errors = 0
+        rows = OrderLine.objects.order_by("pk").values_list(
+            "pk", "quantity", "price_duty_free", "tax", *TOTAL_FIELDS
+        )
+        for pk, quantity, price_duty_free, tax, *stored in rows.iterator(
+            chunk_size=batch_size
+        ):
+            totals = line_totals(quantity, price_duty_free, tax)
+            if tuple(stored) != totals:
+                errors += 1
+                self.stderr.write(
+                    f"OrderLine {pk}: stored {stored}, expected {list(totals)}"
+                )
+        return errors
+
+    def check_totals(self, model, batch_size):
+        errors = 0
+        stored_totals = model.objects.order_by("pk").values_list(
+            "pk", *TOTAL_FIELDS
+        )
+        batch = []
+        for row in stored_totals.iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) == batch_size:
+                errors += self.check_batch(model, batch)
+                batch = []
+        if batch:
+            errors += self.check_batch(model, batch)
+        return errors
+
+    def check_batch(self, model, batch):
+        errors = 0
+        totals = compute_sales_action_totals(model, [row[0] for row in batch])
+        for pk, *stored in batch:
+            if tuple(stored) != totals[pk]:
+                errors += 1
+                self.stderr.write(
+                    f"{model.__name__} {pk}: stored {stored}, "
+                    f"expected {list(totals[pk])}"
+                )
+        return errors
@@ -0,0 +1,106 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:29
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def fill_totals(apps, schema_editor):
+    for model_name in ("Estimate", "Invoice"):
+        model = apps.get_model("sales", model_name)
+        for instance in model.objects.all():
+            total_duty_free = Decimal(0)
+            total_tax = Decimal(0)
+            for (
+                quantity,
+                price_duty_free,
+                tax,
+            ) in instance.order_lines.values_list(
+                "quantity", "item__price_duty_free", "item__tax"
+            ):
+                total_duty_free += price_duty_free * quantity
+                total_tax += price_duty_free * (tax / 100) * quantity
+            model.objects.filter(pk=instance.pk).update(
+                total_duty_free=total_duty_free,
+                total_tax=total_tax,
+                total_including_tax=total_duty_free + total_tax,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0003_alter_orderline_quantity_alter_saler_logo"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="estimate",
+            name="total_duty_free",
+            field=models.DecimalField(
+                decimal_places=6,
+                default=0,
+                editable=False,
+                max_digits=20,
+                verbose_name="total duty free",
+            ),
+        ),
+        migrations.AddField(
+            model_name="estimate",
+            name="total_including_tax",
+            field=models.DecimalField(
+                db_index=True,
+                decimal_places=6,
+                default=0,
+                editable=False,
+                max_digits=20,
+                verbose_name="total including tax",
+            ),
+        ),
+        migrations.AddField(
+            model_name="estimate",
+            name="total_tax",
+            field=models.DecimalField(
+                decimal_places=6,
+                default=0,
+                editable=False,
+                max_digits=20,
+                verbose_name="total tax",
+            ),
+        ),
+        migrations.AddField(
+            model_name="invoice",
+            name="total_duty_free",
+            field=models.DecimalField(
+                decimal_places=6,
+                default=0,
+                editable=False,
+                max_digits=20,
+                verbose_name="total duty free",
+            ),
+        ),
+        migrations.AddField(
+            model_name="invoice",
+            name="total_including_tax",
+            field=models.DecimalField(
+                db_index=True,
+                decimal_places=6,
+                default=0,
+                editable=False,
+                max_digits=20,
+                verbose_name="total including tax",
+            ),
+        ),
+        migrations.AddField(
+            model_name="invoice",
+            name="total_tax",
+            field=models.DecimalField(
+                decimal_places=6,
+                default=0,
+                editable=False,
+                max_digits=20,
+                verbose_name="total tax",
+            ),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0004_sales_action_totals"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                fields=["saler", "customer", "date"],
+                name="sales_invoice_rollup_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.13 on 2026-10-18 13:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0005_invoice_rollup_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(
+                fields=["name"], name="sales_customer_name_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="saler",
+            index=models.Index(fields=["name"], name="sales_saler_name_idx"),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.1.13 on 2026-10-18 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0006_actor_name_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="estimate",
+            index=models.Index(
+                fields=["modified_date", "id"],
+                name="sales_estimate_keyset_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                fields=["modified_date", "id"], name="sales_invoice_keyset_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.13 on 2026-10-18 15:02
+
+from collections import defaultdict
+
+from django.db import migrations
+
+
+def unshare_order_lines(apps, schema_editor):
+    """Give a copy of its order lines to every estimate or invoice after
+    the first one using them, the invoices created from an estimate used
+    to share its order lines."""
+    OrderLine = apps.get_model("sales", "OrderLine")
+    links = defaultdict(list)
+    for model_name in ("Estimate", "Invoice"):
+        through = apps.get_model("sales", model_name).order_lines.through
+        for pk, order_line_pk in through.objects.order_by("pk").values_list(
+            "pk", "orderline_id"
+        ):
+            links[order_line_pk].append((through, pk))
+    shared = {pk: rows[1:] for pk, rows in links.items() if len(rows) > 1}
+    for order_line in OrderLine.objects.in_bulk(list(shared)).values():
+        for through, pk in shared[order_line.pk]:
+            copy = OrderLine.objects.create(
+                item_id=order_line.item_id,
+                quantity=order_line.quantity,
+                is_active=order_line.is_active,
+                created_by_id=order_line.created_by_id,
+            )
+            through.objects.filter(pk=pk).update(orderline_id=copy.pk)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0007_sales_action_keyset_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(unshare_order_lines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,124 @@
+# Generated by Django 4.1.13 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+def fill_prices(apps, schema_editor):
+    """Copy the current prices of the items to the order lines and compute
+    their totals, the totals of the documents don't change."""
+    OrderLine = apps.get_model("sales", "OrderLine")
+    fields = [
+        "price_duty_free",
+        "tax",
+        "total_duty_free",
+        "total_tax",
+        "total_including_tax",
+    ]
+    batch = []
+    for order_line in (
+        OrderLine.objects.select_related("item").order_by("pk").iterator()
+    ):
+        order_line.price_duty_free = order_line.item.price_duty_free
+        order_line.tax = order_line.item.tax
+        order_line.total_duty_free = (
+            order_line.price_duty_free * order_line.quantity
+        )
+        order_line.total_tax = (
+            order_line.price_duty_free
+            * (order_line.tax / 100)
+            * order_line.quantity
+        )
+        order_line.total_including_tax = (
+            order_line.total_duty_free + order_line.total_tax
+        )
+        batch.append(order_line)
+        if len(batch) == 500:
+            OrderLine.objects.bulk_update(batch, fields)
+            batch = []
+    OrderLine.objects.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0008_unshare_order_lines"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="orderline",
+            name="price_duty_free",
+            field=models.DecimalField(
+                decimal_places=2,
+                editable=False,
+                max_digits=10,
+                null=True,
+                verbose_name="price",
+            ),
+        ),
+        migrations.AddField(
+            model_name="orderline",
+            name="tax",
+            field=models.DecimalField(
+                decimal_places=2,
+                editable=False,
+                max_digits=5,
+                null=True,
+                verbose_name="tax",
+            ),
+        ),
+        migrations.AddField(
+            model_name="orderline",
+            name="total_duty_free",
+            field=models.DecimalField(
+                decimal_places=6,
+                default=0,
+                editable=False,
+                max_digits=20,
+                verbose_name="total duty free",
+            ),
+        ),
+        migrations.AddField(
+            model_name="orderline",
+            name="total_including_tax",
+            field=models.DecimalField(
+                decimal_places=6,
+                default=0,
+                editable=False,
+                max_digits=20,
+                verbose_name="total including tax",
+            ),
+        ),
+        migrations.AddField(
+            model_name="orderline",
+            name="total_tax",
+            field=models.DecimalField(
+                decimal_places=6,
+                default=0,
+                editable=False,
+                max_digits=20,
+                verbose_name="total tax",
+            ),
+        ),
+        migrations.RunPython(fill_prices, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="orderline",
+            name="price_duty_free",
+            field=models.DecimalField(
+                decimal_places=2,
+                editable=False,
+                max_digits=10,
+                verbose_name="price",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="orderline",
+            name="tax",
+            field=models.DecimalField(
+                decimal_places=2,
+                editable=False,
+                max_digits=5,
+                verbose_name="tax",
+            ),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.1.13 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0009_order_line_prices"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="saler",
+            name="logo_pdf",
+            field=models.ImageField(
+                blank=True,
+                editable=False,
+                null=True,
+                upload_to="saler/logo/pdf/",
+                verbose_name="pdf logo",
+            ),
+        ),
+        migrations.AddField(
+            model_name="saler",
+            name="logo_pdf_height",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="saler",
+            name="logo_pdf_width",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="saler",
+            name="logo_thumbnail",
+            field=models.ImageField(
+                blank=True,
+                editable=False,
+                null=True,
+                upload_to="saler/logo/thumbnail/",
+                verbose_name="logo thumbnail",
+            ),
+        ),
+        migrations.AddField(
+            model_name="saler",
+            name="logo_thumbnail_height",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="saler",
+            name="logo_thumbnail_width",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True
+            ),
+        ),
+    ]
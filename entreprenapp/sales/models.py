@@ -1,15 +1,30 @@
+from collections import defaultdict
 from decimal import Decimal
 
 from core.models import Core
 from django.core.validators import MinValueValidator
 from django.db import models
-from django.db.models.signals import pre_save
-from django.dispatch import receiver
-from django.utils import timezone
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import Signal, receiver
 from django.utils.translation import gettext_lazy as _
 from django_countries.fields import CountryField
 from phonenumber_field.modelfields import PhoneNumberField
 
+from . import numbering
+
+TOTAL_FIELDS = ("total_duty_free", "total_tax", "total_including_tax")
+
+# sent with the pks of the estimates or invoices whose stored totals were
+# written without a save (order lines changes, bulk creation), and the
+# instances when they are known
+totals_updated = Signal()
+
 
 class SalesActorBase(Core):
     name = models.CharField(_("name"), max_length=200)
@@ -20,6 +35,15 @@ class SalesActorBase(Core):
     email = models.EmailField(_("email address"), max_length=254, blank=True)
     phone_number = PhoneNumberField(blank=True)
 
+    # name in the database, the documents are indexed with it
+    _loaded_name = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_name = instance.__dict__.get("name")
+        return instance
+
     def __str__(self):
         return self.name
 
@@ -32,6 +56,11 @@ class SalesActorBase(Core):
     class Meta:
         abstract = True
         ordering = ["name"]
+        indexes = [
+            models.Index(
+                fields=["name"], name="%(app_label)s_%(class)s_name_idx"
+            )
+        ]
 
 
 class Saler(SalesActorBase):
@@ -44,6 +73,33 @@ class Saler(SalesActorBase):
         blank=True,
         null=True,
     )
+    # reduced copies of the logo used by the templates, see sales.images
+    logo_pdf = models.ImageField(
+        _("pdf logo"),
+        upload_to="saler/logo/pdf/",
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    logo_pdf_width = models.PositiveIntegerField(
+        blank=True, null=True, editable=False
+    )
+    logo_pdf_height = models.PositiveIntegerField(
+        blank=True, null=True, editable=False
+    )
+    logo_thumbnail = models.ImageField(
+        _("logo thumbnail"),
+        upload_to="saler/logo/thumbnail/",
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    logo_thumbnail_width = models.PositiveIntegerField(
+        blank=True, null=True, editable=False
+    )
+    logo_thumbnail_height = models.PositiveIntegerField(
+        blank=True, null=True, editable=False
+    )
     estimate_number = models.IntegerField(
         ("estimate number"), default=0, editable=False
     )
@@ -51,6 +107,15 @@ class Saler(SalesActorBase):
         ("invoice number"), default=0, editable=False
     )
 
+    # logo of the saler in the database
+    _loaded_logo = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_logo = instance.__dict__.get("logo")
+        return instance
+
     class Meta(SalesActorBase.Meta):
         verbose_name = _("Saler")
         verbose_name_plural = _("Salers")
@@ -96,21 +161,91 @@ class OrderLine(Core):
     quantity = models.PositiveIntegerField(
         _("quantity"), default=1, validators=[MinValueValidator(1)]
     )
+    # the prices of the item when the order line was created (or given
+    # another item), a new item price doesn't change the past documents
+    price_duty_free = models.DecimalField(
+        _("price"), max_digits=10, decimal_places=2, editable=False
+    )
+    tax = models.DecimalField(
+        _("tax"), max_digits=5, decimal_places=2, editable=False
+    )
+    total_duty_free = models.DecimalField(
+        _("total duty free"),
+        max_digits=20,
+        decimal_places=6,
+        default=0,
+        editable=False,
+    )
+    total_tax = models.DecimalField(
+        _("total tax"),
+        max_digits=20,
+        decimal_places=6,
+        default=0,
+        editable=False,
+    )
+    total_including_tax = models.DecimalField(
+        _("total including tax"),
+        max_digits=20,
+        decimal_places=6,
+        default=0,
+        editable=False,
+    )
+
+    # item of the order line in the database
+    _loaded_item_id = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_item_id = instance.__dict__.get("item_id")
+        return instance
 
     @property
     def subtotal_duty_free(self) -> Decimal:
         "Return the price (duty free) of the oderline."
-        return Decimal(self.item.price_duty_free * self.quantity)
+        return Decimal(self.total_duty_free)
 
     @property
     def subtotal_tax_price(self) -> Decimal:
         "Return tax price of the oderline."
-        return Decimal(self.item.tax_price * self.quantity)
+        return Decimal(self.total_tax)
 
     @property
     def subtotal_including_tax(self) -> Decimal:
         "Return price (including tax) of the oderline."
-        return Decimal(self.item.including_tax * self.quantity)
+        return Decimal(self.total_including_tax)
+
+    def set_prices(self):
+        """Copy the prices of the item and compute the totals."""
+        # read from the database, the item of a form comes from the cached
+        # item catalog
+        self.price_duty_free, self.tax = Item.objects.values_list(
+            "price_duty_free", "tax"
+        ).get(pk=self.item_id)
+        self.set_totals()
+
+    @staticmethod
+    def copy_prices(order_lines):
+        """Copy the prices of the items of the new order lines from the
+        database with one query, saving them then only compute the totals."""
+        prices = {
+            pk: (price_duty_free, tax)
+            for pk, price_duty_free, tax in Item.objects.filter(
+                pk__in={order_line.item_id for order_line in order_lines}
+            ).values_list("pk", "price_duty_free", "tax")
+        }
+        for order_line in order_lines:
+            order_line.price_duty_free, order_line.tax = prices[
+                order_line.item_id
+            ]
+
+    def set_totals(self):
+        """Compute the totals from the quantity and the prices."""
+        for field_name, value in zip(
+            TOTAL_FIELDS,
+            line_totals(self.quantity, self.price_duty_free, self.tax),
+        ):
+            setattr(self, field_name, value)
 
     def __str__(self):
         return f"{self.item} - {self.quantity}"
@@ -131,36 +266,68 @@ class SalesActionBase(Core):
         "sales.OrderLine", verbose_name=_("order line")
     )
     date = models.DateField(_("date"))
+    total_duty_free = models.DecimalField(
+        _("total duty free"),
+        max_digits=20,
+        decimal_places=6,
+        default=0,
+        editable=False,
+    )
+    total_tax = models.DecimalField(
+        _("total tax"),
+        max_digits=20,
+        decimal_places=6,
+        default=0,
+        editable=False,
+    )
+    total_including_tax = models.DecimalField(
+        _("total including tax"),
+        max_digits=20,
+        decimal_places=6,
+        default=0,
+        editable=False,
+        db_index=True,
+    )
+
+    # values of the loaded fields in the database, see reporting.models
+    _loaded_values = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
 
     @property
     def total_price_duty_free(self) -> Decimal:
         "Return the total price (duty free) of the oderline."
-        return Decimal(
-            sum(
-                order_line.subtotal_duty_free
-                for order_line in self.order_lines.all()
-            )
-        )
+        return Decimal(self.total_duty_free)
 
     @property
     def total_tax_price(self) -> Decimal:
         "Return the total price (including tax) of the oderline."
-        return Decimal(
-            sum(
-                order_line.subtotal_tax_price
-                for order_line in self.order_lines.all()
-            )
-        )
+        return Decimal(self.total_tax)
 
     @property
     def total_price_including_tax(self) -> Decimal:
         "Return the total price (including tax) of the oderline."
-        return Decimal(
-            sum(
-                order_line.subtotal_including_tax
-                for order_line in self.order_lines.all()
-            )
+        return Decimal(self.total_including_tax)
+
+    def update_totals(self, commit=True):
+        """Recompute the stored totals from the order lines,
+        with a single query, and save them when commit is True."""
+        totals = compute_totals(
+            self.order_lines.values_list("total_duty_free", "total_tax")
         )
+        for field_name, value in zip(TOTAL_FIELDS, totals):
+            setattr(self, field_name, value)
+        if commit and self.pk:
+            type(self).objects.filter(pk=self.pk).update(
+                **dict(zip(TOTAL_FIELDS, totals))
+            )
+            totals_updated.send(
+                sender=type(self), pks=[self.pk], instances=[self]
+            )
 
     def __str__(self):
         return f"{self.saler} - {self.customer} - {self.date}"
@@ -168,6 +335,13 @@ class SalesActionBase(Core):
     class Meta:
         abstract = True
         ordering = ["modified_date", "id"]
+        indexes = [
+            # keyset pagination of the lists
+            models.Index(
+                fields=["modified_date", "id"],
+                name="%(app_label)s_%(class)s_keyset_idx",
+            )
+        ]
 
 
 class Estimate(SalesActionBase):
@@ -177,16 +351,11 @@ class Estimate(SalesActionBase):
     validity_date = models.DateField(_("validity date"))
 
     def turn_into_an_invoice(self):
-        # coppy the data to create an invoice
-        order_lines_to_copy = self.order_lines.all()
-        new_invoice = Invoice.objects.create(
-            saler=self.saler,
-            customer=self.customer,
-            date=timezone.now(),
-            is_paid=False,
-        )
-        new_invoice.order_lines.set(order_lines_to_copy)
-        new_invoice.save()
+        """Create an invoice with copies of the order lines, see
+        sales.bulk.convert_estimates"""
+        from .bulk import convert_estimates
+
+        convert_estimates(Estimate.objects.filter(pk=self.pk))
         return True
 
     class Meta(SalesActionBase.Meta):
@@ -200,22 +369,167 @@ class Invoice(SalesActionBase):
     is_paid = models.BooleanField(_("is paid"))
 
     class Meta(SalesActionBase.Meta):
-        pass
+        indexes = SalesActionBase.Meta.indexes + [
+            # revenue rollups of a saler and customer month
+            models.Index(
+                fields=["saler", "customer", "date"],
+                name="sales_invoice_rollup_idx",
+            )
+        ]
 
 
 @receiver(pre_save, sender=Estimate)
 def set_estiamte_saler_id(sender, instance, **kwargs):
     if not instance.estimate_saler_number:
-        saler = instance.saler
-        instance.estimate_saler_number = saler.estimate_number + 1
-        saler.estimate_number += 1
-        saler.save()
+        instance.estimate_saler_number = numbering.next_number(
+            instance.saler, "estimate_number"
+        )
 
 
 @receiver(pre_save, sender=Invoice)
 def set_invoice_saler_id(sender, instance, **kwargs):
     if not instance.invoice_saler_number:
-        saler = instance.saler
-        instance.invoice_saler_number = saler.invoice_number + 1
-        saler.invoice_number += 1
-        saler.save()
+        instance.invoice_saler_number = numbering.next_number(
+            instance.saler, "invoice_number"
+        )
+
+
+def line_totals(quantity, price_duty_free, tax):
+    """Return the (duty free, tax, including tax) totals of an order line."""
+    total_duty_free = price_duty_free * quantity
+    total_tax = price_duty_free * (tax / 100) * quantity
+    return total_duty_free, total_tax, total_duty_free + total_tax
+
+
+def compute_totals(order_lines):
+    """Return the (duty free, tax, including tax) totals of an iterable of
+    (duty free, tax) order line totals."""
+    total_duty_free = Decimal(0)
+    total_tax = Decimal(0)
+    for line_duty_free, line_tax in order_lines:
+        total_duty_free += line_duty_free
+        total_tax += line_tax
+    return total_duty_free, total_tax, total_duty_free + total_tax
+
+
+def compute_sales_action_totals(model, pks):
+    """Return a dict of the totals of the given Estimate or Invoice pks,
+    computed with a single query on the order lines through table."""
+    through = model.order_lines.through
+    sales_action_field = model.order_lines.field.m2m_field_name()
+    order_line_field = model.order_lines.field.m2m_reverse_field_name()
+    order_lines = defaultdict(list)
+    rows = through.objects.filter(
+        **{f"{sales_action_field}_id__in": pks}
+    ).values_list(
+        f"{sales_action_field}_id",
+        f"{order_line_field}__total_duty_free",
+        f"{order_line_field}__total_tax",
+    )
+    for pk, *order_line in rows:
+        order_lines[pk].append(order_line)
+    return {pk: compute_totals(order_lines[pk]) for pk in pks}
+
+
+def refresh_totals(queryset, batch_size=500):
+    """Recompute and store the totals of every instance of the queryset.
+    Return the number of updated instances."""
+    model = queryset.model
+    pks = list(queryset.order_by().values_list("pk", flat=True))
+    for start in range(0, len(pks), batch_size):
+        end = start + batch_size
+        totals = compute_sales_action_totals(model, pks[start:end])
+        model.objects.bulk_update(
+            [
+                model(pk=pk, **dict(zip(TOTAL_FIELDS, values)))
+                for pk, values in totals.items()
+            ],
+            TOTAL_FIELDS,
+        )
+        totals_updated.send(sender=model, pks=list(totals))
+    return len(pks)
+
+
+def refresh_order_line_totals(queryset, batch_size=500):
+    """Recompute and store the totals of the order lines of the queryset
+    from their prices. Return the number of updated order lines."""
+    updated = []
+    count = 0
+    for order_line in queryset.only(
+        "quantity", "price_duty_free", "tax", *TOTAL_FIELDS
+    ).iterator(chunk_size=batch_size):
+        stored = [getattr(order_line, name) for name in TOTAL_FIELDS]
+        order_line.set_totals()
+        if stored != [getattr(order_line, name) for name in TOTAL_FIELDS]:
+            updated.append(order_line)
+        if len(updated) == batch_size:
+            count += OrderLine.objects.bulk_update(updated, TOTAL_FIELDS)
+            updated = []
+    return count + OrderLine.objects.bulk_update(updated, TOTAL_FIELDS)
+
+
+@receiver(pre_save, sender=OrderLine)
+def set_order_line_totals(sender, instance, **kwargs):
+    if instance.price_duty_free is None or (
+        not instance._state.adding
+        and instance.item_id != instance._loaded_item_id
+    ):
+        instance.set_prices()
+    else:
+        instance.set_totals()
+    instance._loaded_item_id = instance.item_id
+
+
+@receiver(pre_save, sender=Estimate)
+@receiver(pre_save, sender=Invoice)
+def set_sales_action_totals(sender, instance, **kwargs):
+    # never write back totals that were loaded before an order line change
+    if instance.pk:
+        instance.update_totals(commit=False)
+
+
+@receiver(m2m_changed, sender=Estimate.order_lines.through)
+@receiver(m2m_changed, sender=Invoice.order_lines.through)
+def update_totals_on_order_lines_changed(
+    sender, instance, action, reverse, model, pk_set, **kwargs
+):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            instance.update_totals()
+        return
+    # instance is an order line and model the sales action class
+    if action == "pre_clear":
+        instance._cleared_sales_actions = set(
+            model.objects.filter(order_lines=instance).values_list(
+                "pk", flat=True
+            )
+        )
+    elif action == "post_clear":
+        pk_set = getattr(instance, "_cleared_sales_actions", set())
+    if action in ("post_add", "post_remove", "post_clear"):
+        refresh_totals(model.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=OrderLine)
+def update_totals_on_order_line_saved(sender, instance, created, **kwargs):
+    if not created:
+        for model in (Estimate, Invoice):
+            refresh_totals(model.objects.filter(order_lines=instance))
+
+
+@receiver(pre_delete, sender=OrderLine)
+def collect_totals_on_order_line_delete(sender, instance, **kwargs):
+    instance._sales_actions_to_refresh = {
+        model: list(
+            model.objects.filter(order_lines=instance).values_list(
+                "pk", flat=True
+            )
+        )
+        for model in (Estimate, Invoice)
+    }
+
+
+@receiver(post_delete, sender=OrderLine)
+def update_totals_on_order_line_deleted(sender, instance, **kwargs):
+    for model, pks in instance._sales_actions_to_refresh.items():
+        refresh_totals(model.objects.filter(pk__in=pks))
@@ -0,0 +1,58 @@
+"""Allocation of the per saler estimate and invoice numbers.
+
+The counters live on the Saler row and are incremented in the database,
+so concurrent documents never get the same number. The strategy used for
+a database can be chosen with the SALES_NUMBERING_STRATEGIES setting:
+
+* ``"update"``: a single ``UPDATE ... SET n = n + count`` (F expression)
+  then a read of the new value in the same transaction.
+* ``"select_for_update"``: lock the saler row, then write the new value.
+"""
+from core.cache import model_cache
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import F
+
+
+def _update(queryset, field, count):
+    queryset.update(**{field: F(field) + count})
+    return queryset.values_list(field, flat=True).get()
+
+
+def _select_for_update(queryset, field, count):
+    last = queryset.select_for_update().values_list(field, flat=True).get()
+    last += count
+    queryset.update(**{field: last})
+    return last
+
+
+STRATEGIES = {
+    "update": _update,
+    "select_for_update": _select_for_update,
+}
+
+
+def get_strategy(using):
+    strategies = getattr(settings, "SALES_NUMBERING_STRATEGIES", {})
+    return STRATEGIES[strategies.get(using, "update")]
+
+
+def reserve_numbers(saler, field, count=1):
+    """Reserve count consecutive numbers of the saler counter field and
+    return them as a range. The in memory saler is updated too."""
+    if count < 1:
+        raise ValueError("count must be a positive integer")
+    model = type(saler)
+    using = router.db_for_write(model, instance=saler)
+    queryset = model._base_manager.using(using).filter(pk=saler.pk)
+    with transaction.atomic(using=using):
+        last = get_strategy(using)(queryset, field, count)
+    # the counters are updated without post_save
+    model_cache.invalidate(model, [saler.pk])
+    setattr(saler, field, last)
+    return range(last - count + 1, last + 1)
+
+
+def next_number(saler, field):
+    """Return the next number of the saler counter field."""
+    return reserve_numbers(saler, field)[0]
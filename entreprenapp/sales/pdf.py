@@ -0,0 +1,303 @@
+"""PDF rendering of estimates and invoices.
+
+The HTML is rendered in the caller (it needs the database) and xhtml2pdf
+runs in a process pool when the PDF is requested. The PDF is cached by
+document id and by the hash of its HTML, and invalidated when the document
+or its data change. The invalidations of a process are only seen by the
+others through SALES_PDF_CACHE, it must be shared by the processes."""
+import hashlib
+import threading
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+import django
+from core.cache import resolve_related
+from core.export import ZipBuffer
+from core.utils import asset_cache, link_callback
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+from django.template.loader import get_template
+from django.templatetags.static import static
+from django.utils import timezone
+from django.utils.text import slugify
+from xhtml2pdf import pisa
+
+from .models import Customer, Estimate, Invoice, Item, OrderLine, Saler
+
+TEMPLATES = {
+    Estimate: "sales/estimate/pdf.html",
+    Invoice: "sales/invoice/pdf.html",
+}
+
+# shared by every pdf, loaded when a worker starts
+PRELOADED_STATIC = ("css/pdf.css",)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class PDFRenderError(Exception):
+    """xhtml2pdf could not render the document."""
+
+    def __init__(self, html):
+        super().__init__("xhtml2pdf could not render the document")
+        self.html = html
+
+
+def _init_worker():
+    if not settings.configured:
+        django.setup()
+    asset_cache.preload(*(static(path) for path in PRELOADED_STATIC))
+
+
+def get_executor():
+    """Return the process pool used to run xhtml2pdf."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, "SALES_PDF_WORKERS", 2),
+                initializer=_init_worker,
+            )
+        return _executor
+
+
+def html_to_pdf(html):
+    """Convert the html into PDF bytes, return None on error."""
+    dest = BytesIO()
+    pisa_status = pisa.CreatePDF(html, dest=dest, link_callback=link_callback)
+    if pisa_status.err:
+        return None
+    return dest.getvalue()
+
+
+def render_html(instance):
+    resolve_related([instance], "saler", "customer", "order_lines__item")
+    return get_template(TEMPLATES[type(instance)]).render({"object": instance})
+
+
+def get_cache():
+    return caches[getattr(settings, "SALES_PDF_CACHE", "default")]
+
+
+def document_key(instance):
+    return f"sales-pdf:{instance._meta.model_name}:{instance.pk}"
+
+
+def generation_key(instance):
+    return f"{document_key(instance)}:generation"
+
+
+def content_key(instance, content_hash):
+    return f"{document_key(instance)}:{content_hash}"
+
+
+def get_cached_pdf(instance):
+    """Return the cached (content hash, last modified, pdf) of the
+    document, or None."""
+    cache = get_cache()
+    entry = cache.get(document_key(instance))
+    if entry is None:
+        return None
+    content_hash, last_modified = entry
+    content = cache.get(content_key(instance, content_hash))
+    if content is None:
+        return None
+    return content_hash, last_modified, content
+
+
+def render_pdf(instance, wait=True, in_process=False):
+    """Render the document in the process pool and cache the result.
+
+    Return the (content hash, last modified, pdf) of the document, or a
+    future of it when wait is False. With in_process the pdf is always
+    rendered, in the current process (e.g. to profile it)."""
+    cache = get_cache()
+    timeout = getattr(settings, "SALES_PDF_CACHE_TIMEOUT", None)
+    generation = cache.get(generation_key(instance))
+    html = render_html(instance)
+    content_hash = hashlib.sha256(html.encode()).hexdigest()
+    last_modified = timezone.now()
+
+    def store(content):
+        if content is None:
+            raise PDFRenderError(html)
+        cache.set(content_key(instance, content_hash), content, timeout)
+        # the document changed while it was rendered
+        if cache.get(generation_key(instance)) == generation:
+            cache.set(
+                document_key(instance), (content_hash, last_modified), timeout
+            )
+        return content_hash, last_modified, content
+
+    # the html didn't change, only the cache entry has been invalidated
+    content = cache.get(content_key(instance, content_hash))
+    if in_process:
+        future = Future()
+        future.set_result(html_to_pdf(html))
+    elif content is not None:
+        future = Future()
+        future.set_result(content)
+    else:
+        try:
+            future = get_executor().submit(html_to_pdf, html)
+        except BrokenProcessPool:
+            reset_executor()
+            future = get_executor().submit(html_to_pdf, html)
+    if wait:
+        return store(future.result())
+
+    result = Future()
+
+    def store_result(future):
+        try:
+            result.set_result(store(future.result()))
+        except Exception as error:
+            result.set_exception(error)
+
+    future.add_done_callback(store_result)
+    return result
+
+
+def iter_pdfs(queryset, window=None):
+    """Yield the (instance, pdf) of the documents of the queryset, in
+    order, with at most window documents rendering at the same time.
+    The pdf is None when the document could not be rendered."""
+    if window is None:
+        window = 2 * getattr(settings, "SALES_PDF_WORKERS", 2)
+    documents = (
+        queryset.select_related("saler", "customer")
+        .prefetch_related("order_lines__item")
+        .iterator(chunk_size=100)
+    )
+    pending = deque()
+
+    def pop():
+        instance, future = pending.popleft()
+        try:
+            return instance, future.result()[2]
+        except PDFRenderError:
+            return instance, None
+
+    for instance in documents:
+        cached_pdf = get_cached_pdf(instance)
+        if cached_pdf is None:
+            future = render_pdf(instance, wait=False)
+        else:
+            future = Future()
+            future.set_result(cached_pdf)
+        pending.append((instance, future))
+        if len(pending) >= window:
+            yield pop()
+    while pending:
+        yield pop()
+
+
+def file_name(instance):
+    if isinstance(instance, Estimate):
+        return f"Estimate n° {instance.estimate_saler_number:08}"
+    return f"Invoice n° {instance.invoice_saler_number:08}"
+
+
+def stream_zip(queryset):
+    """Yield a zip archive of the pdf of the documents chunk by chunk.
+    The documents that could not be rendered are listed in errors.txt."""
+    buffer = ZipBuffer()
+    errors = []
+    # pdf are already compressed
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        for instance, content in iter_pdfs(queryset):
+            if content is None:
+                errors.append(f"{file_name(instance)} ({instance})")
+                continue
+            saler = instance.saler
+            archive.writestr(
+                f"{saler.pk}-{slugify(saler.name)}/{file_name(instance)}.pdf",
+                content,
+            )
+            yield buffer.read()
+        if errors:
+            archive.writestr("errors.txt", "\n".join(errors))
+    yield buffer.read()
+
+
+def reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def invalidate(instances):
+    """Drop the cached pdf of the documents, they are rendered again when
+    they are requested."""
+    instances = list(instances)
+    cache = get_cache()
+    cache.delete_many([document_key(obj) for obj in instances])
+    cache.set_many(
+        {generation_key(obj): uuid.uuid4().hex for obj in instances}, None
+    )
+
+
+def _documents(**lookups):
+    for model in TEMPLATES:
+        yield from model.objects.filter(**lookups).only("pk").distinct()
+
+
+@receiver(post_save, sender=Estimate)
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Estimate)
+@receiver(post_delete, sender=Invoice)
+def invalidate_document(sender, instance, **kwargs):
+    invalidate([instance])
+
+
+@receiver(m2m_changed, sender=Estimate.order_lines.through)
+@receiver(m2m_changed, sender=Invoice.order_lines.through)
+def invalidate_document_order_lines(
+    sender, instance, action, reverse, model, pk_set, **kwargs
+):
+    if not reverse:
+        if action.startswith("post_"):
+            invalidate([instance])
+    elif action == "pre_clear":
+        invalidate(model.objects.filter(order_lines=instance).only("pk"))
+    elif action in ("post_add", "post_remove"):
+        invalidate(model(pk=pk) for pk in pk_set)
+
+
+@receiver(post_save, sender=OrderLine)
+@receiver(pre_delete, sender=OrderLine)
+def invalidate_order_line_documents(sender, instance, **kwargs):
+    if not kwargs.get("created"):
+        invalidate(_documents(order_lines=instance))
+
+
+@receiver(post_save, sender=Item)
+def invalidate_item_documents(sender, instance, created, **kwargs):
+    if not created:
+        invalidate(_documents(order_lines__item=instance))
+
+
+@receiver(post_save, sender=Saler)
+def invalidate_saler_documents(sender, instance, created, **kwargs):
+    if not created:
+        invalidate(_documents(saler=instance))
+
+
+@receiver(post_save, sender=Customer)
+def invalidate_customer_documents(sender, instance, created, **kwargs):
+    if not created:
+        invalidate(_documents(customer=instance))
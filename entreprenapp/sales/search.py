@@ -0,0 +1,56 @@
+"""Search index of the salers, customers, items, estimates and invoices."""
+from core import search
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Customer, Estimate, Invoice, Item, Saler
+
+search.register(
+    Saler, ["name", "adress", "city", "postal_code", "email", "phone_number"]
+)
+search.register(
+    Customer,
+    ["name", "adress", "city", "postal_code", "email", "phone_number"],
+)
+search.register(Item, ["label", "description"])
+search.register(
+    Estimate,
+    [
+        "estimate_saler_number",
+        lambda estimate: f"{estimate.estimate_saler_number:08}",
+        "saler__name",
+        "customer__name",
+    ],
+    related=("saler", "customer"),
+)
+search.register(
+    Invoice,
+    [
+        "invoice_saler_number",
+        lambda invoice: f"{invoice.invoice_saler_number:08}",
+        "saler__name",
+        "customer__name",
+    ],
+    related=("saler", "customer"),
+)
+
+
+def reindex_documents(lookup, pk):
+    for model in (Estimate, Invoice):
+        search.reindex(model.objects.filter(**{lookup: pk}))
+
+
+@receiver(post_save, sender=Saler)
+@receiver(post_save, sender=Customer)
+def update_documents_index(sender, instance, created, **kwargs):
+    # the documents are indexed with the saler and customer names, they are
+    # indexed again in batches after the commit when the name changed
+    if "name" not in instance.__dict__:
+        return
+    if not created and instance.name != instance._loaded_name:
+        lookup = "saler_id" if sender is Saler else "customer_id"
+        transaction.on_commit(
+            lambda pk=instance.pk: reindex_documents(lookup, pk)
+        )
+    instance._loaded_name = instance.name
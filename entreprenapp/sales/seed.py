@@ -0,0 +1,130 @@
+"""Synthetic salers, customers, items, estimates and invoices.
+
+Used by the seed_data command to get production like volumes locally.
+Every row is written with bulk inserts, the documents with the bulk
+creation of sales.bulk so their numbers, totals, revenue rollups and
+search entries are right."""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from core import pagination, search
+
+from . import catalog
+from .bulk import bulk_create_estimates, bulk_create_invoices
+from .models import Customer, Estimate, Invoice, Item, OrderLine, Saler
+
+WORDS = (
+    "alpha bravo cobalt delta echo falcon garnet harbor indigo juniper "
+    "kepler lumen marble nimbus onyx pioneer quartz raven summit tundra "
+    "umbra vertex willow xenon yonder zephyr"
+).split()
+
+CITIES = ("London", "Paris", "Berlin", "Madrid", "Rome", "Lisbon", "Dublin")
+
+
+def _name(rng, words=2):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).title()
+
+
+def _bulk_create(model, objects, batch_size):
+    objects = model.objects.bulk_create(objects, batch_size=batch_size)
+    if search.is_registered(model):
+        for start in range(0, len(objects), batch_size):
+            end = start + batch_size
+            search.update_index(objects[start:end])
+    pagination.invalidate_counts(model)
+    return objects
+
+
+def _actors(model, count, rng, batch_size):
+    return _bulk_create(
+        model,
+        (
+            model(
+                name=f"{_name(rng)} {index}",
+                adress=f"{rng.randint(1, 200)} {_name(rng, 1)} Street",
+                city=rng.choice(CITIES),
+                postal_code=f"{rng.randint(10000, 99999)}",
+                email=f"contact{index}@{rng.choice(WORDS)}.example.com",
+            )
+            for index in range(count)
+        ),
+        batch_size,
+    )
+
+
+def _documents_data(count, order_lines, salers, customers, items, rng):
+    today = date.today()
+    for _ in range(count):
+        yield {
+            "saler": rng.choice(salers),
+            "customer": rng.choice(customers),
+            "date": today - timedelta(days=rng.randint(0, 730)),
+            "is_paid": rng.random() < 0.7,
+            "order_lines": [
+                {"item": rng.choice(items), "quantity": rng.randint(1, 5)}
+                for _ in range(order_lines)
+            ],
+        }
+
+
+def seed_sales(
+    salers=10,
+    customers=1000,
+    items=200,
+    estimates=1000,
+    invoices=1000,
+    order_lines=5,
+    batch_size=1000,
+    rng=None,
+):
+    """Create the salers, customers and items then the estimates and
+    invoices with order_lines order lines each. Return the number of
+    rows created by model."""
+    rng = rng or random.Random()
+    saler_pks = [obj.pk for obj in _actors(Saler, salers, rng, batch_size)]
+    customer_pks = [
+        obj.pk for obj in _actors(Customer, customers, rng, batch_size)
+    ]
+    item_pks = [
+        obj.pk
+        for obj in _bulk_create(
+            Item,
+            (
+                Item(
+                    label=f"{_name(rng)} {index}",
+                    description=_name(rng, 8),
+                    price_duty_free=Decimal(rng.randint(100, 100000)) / 100,
+                    tax=Decimal(rng.choice(("0", "5.5", "10", "20"))),
+                )
+                for index in range(items)
+            ),
+            batch_size,
+        )
+    ]
+    catalog.invalidate()
+    created = {Saler: salers, Customer: customers, Item: items}
+    if not (saler_pks and customer_pks and item_pks):
+        return created
+    for model, bulk_create, count in (
+        (Estimate, bulk_create_estimates, estimates),
+        (Invoice, bulk_create_invoices, invoices),
+    ):
+        # one batch of documents in memory at a time
+        for start in range(0, count, batch_size):
+            bulk_create(
+                _documents_data(
+                    min(batch_size, count - start),
+                    order_lines,
+                    saler_pks,
+                    customer_pks,
+                    item_pks,
+                    rng,
+                ),
+                batch_size=batch_size,
+            )
+        pagination.invalidate_counts(model)
+        created[model] = count
+    created[OrderLine] = (estimates + invoices) * order_lines
+    return created
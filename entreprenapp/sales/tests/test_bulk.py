@@ -0,0 +1,158 @@
+from datetime import date, timedelta
+
+from core import pagination
+from core.profiling import QueryBudgetMixin
+from django.test import TestCase
+
+from ..bulk import (
+    BulkInvoiceError,
+    bulk_create_estimates,
+    bulk_create_invoices,
+    convert_estimates,
+)
+from ..models import Customer, Estimate, Invoice, Item, OrderLine, Saler
+
+
+class BulkCreateInvoicesTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.salers = [
+            Saler.objects.create(
+                name=name, adress="25 Park Street", city="London"
+            )
+            for name in ("Book Shop", "Tech Shop")
+        ]
+        self.customer = Customer.objects.create(
+            name="Brand Zac", adress="44 Roberto Street", city="London"
+        )
+        self.items = [
+            Item.objects.create(label="Ulysse", price_duty_free=25, tax=10),
+            Item.objects.create(label="Verity", price_duty_free=10, tax=20),
+        ]
+        Invoice.objects.create(
+            saler=self.salers[0],
+            customer=self.customer,
+            date=date.today(),
+            is_paid=True,
+        )
+
+    def invoice_data(self, saler, quantity=1):
+        return {
+            "saler": saler.pk,
+            "customer": self.customer.pk,
+            "date": date.today(),
+            "order_lines": [
+                {"item": self.items[0].pk, "quantity": quantity},
+                {"item": self.items[1].pk, "quantity": 2},
+            ],
+        }
+
+    def test_bulk_create_invoices(self):
+        """Invoices, order lines and numbers are created in batches"""
+        invoices_data = [
+            self.invoice_data(self.salers[index % 2], quantity=index + 1)
+            for index in range(5)
+        ]
+        self.assertEqual(pagination.cached_count(Invoice.objects.all()), 1)
+        invoices = bulk_create_invoices(invoices_data, batch_size=2)
+        self.assertEqual(len(invoices), 5)
+        # the list count is dropped
+        self.assertEqual(pagination.cached_count(Invoice.objects.all()), 6)
+        self.assertEqual(
+            [invoice.invoice_saler_number for invoice in invoices],
+            [2, 1, 3, 2, 4],
+        )
+        for saler in self.salers:
+            saler.refresh_from_db()
+        self.assertEqual(self.salers[0].invoice_number, 4)
+        self.assertEqual(self.salers[1].invoice_number, 2)
+        for quantity, invoice in enumerate(invoices, 1):
+            invoice = Invoice.objects.get(pk=invoice.pk)
+            self.assertEqual(invoice.order_lines.count(), 2)
+            self.assertFalse(invoice.is_paid)
+            self.assertEqual(invoice.total_price_duty_free, 25 * quantity + 20)
+            self.assertEqual(invoice.total_tax_price, 2.5 * quantity + 4)
+
+    def test_invalid_invoice(self):
+        """An invalid invoice rolls back its batch"""
+        invoices_data = [
+            self.invoice_data(self.salers[0]),
+            self.invoice_data(self.salers[0]),
+            self.invoice_data(self.salers[0], quantity=0),
+        ]
+        with self.assertRaisesMessage(BulkInvoiceError, "invoice 2"):
+            bulk_create_invoices(invoices_data, batch_size=2)
+        self.assertEqual(Invoice.objects.count(), 3)
+        self.salers[0].refresh_from_db()
+        self.assertEqual(self.salers[0].invoice_number, 3)
+
+        invoices_data[2]["order_lines"][0]["quantity"] = 1
+        invoices_data[2]["customer"] = 0
+        with self.assertRaisesMessage(BulkInvoiceError, "unknown customer"):
+            bulk_create_invoices(invoices_data[2:])
+
+    def test_bulk_create_estimates(self):
+        """Estimates get their own numbers and a validity date"""
+        estimates_data = [self.invoice_data(saler) for saler in self.salers]
+        estimates_data[1]["validity_date"] = date.today() + timedelta(days=5)
+        estimates = bulk_create_estimates(estimates_data)
+        self.assertEqual(
+            [estimate.estimate_saler_number for estimate in estimates], [1, 1]
+        )
+        estimate = Estimate.objects.get(pk=estimates[0].pk)
+        self.assertEqual(estimate.validity_date, date.today() + timedelta(30))
+        self.assertEqual(estimate.order_lines.count(), 2)
+        self.assertEqual(estimate.total_price_duty_free, 45)
+        self.assertEqual(
+            Estimate.objects.get(pk=estimates[1].pk).validity_date,
+            date.today() + timedelta(days=5),
+        )
+        self.salers[0].refresh_from_db()
+        self.assertEqual(self.salers[0].invoice_number, 1)
+
+        estimates_data[0]["order_lines"] = []
+        with self.assertRaisesMessage(BulkInvoiceError, "estimate 0"):
+            bulk_create_estimates(estimates_data)
+
+    def test_convert_estimates(self):
+        """The invoices get copies of the order lines of the estimates"""
+        estimates = bulk_create_estimates(
+            [
+                self.invoice_data(self.salers[index % 2], quantity=index + 1)
+                for index in range(5)
+            ]
+        )
+        # an inactive item is still copied
+        self.items[1].is_active = False
+        self.items[1].save()
+        queryset = Estimate.objects.filter(pk__in=[e.pk for e in estimates])
+        # the number of queries depends on the number of salers only
+        with self.assertQueryBudget(queries=30):
+            invoices = convert_estimates(queryset)
+        self.assertEqual(
+            [invoice.invoice_saler_number for invoice in invoices],
+            [2, 1, 3, 2, 4],
+        )
+        self.assertEqual(OrderLine.objects.count(), 20)
+        for quantity, (estimate, invoice) in enumerate(
+            zip(estimates, invoices), 1
+        ):
+            invoice = Invoice.objects.get(pk=invoice.pk)
+            self.assertEqual(invoice.date, date.today())
+            self.assertFalse(invoice.is_paid)
+            self.assertEqual(invoice.customer, self.customer)
+            self.assertEqual(invoice.total_price_duty_free, 25 * quantity + 20)
+            self.assertEqual(
+                list(invoice.order_lines.values_list("item", "quantity")),
+                list(estimate.order_lines.values_list("item", "quantity")),
+            )
+            self.assertFalse(
+                set(invoice.order_lines.all())
+                & set(estimate.order_lines.all())
+            )
+
+        # changing an order line of the estimate keeps the invoice
+        order_line = estimates[0].order_lines.first()
+        order_line.quantity = 10
+        order_line.save()
+        invoice = Invoice.objects.get(pk=invoices[0].pk)
+        self.assertEqual(invoice.total_price_duty_free, 45)
@@ -0,0 +1,252 @@
+import csv
+import json
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..models import Customer, Invoice, Item, OrderLine, Saler
+
+
+class RebuildSalesTotalsTest(TestCase):
+    def setUp(self):
+        saler = Saler.objects.create(
+            name="BookShop", adress="25 Park Street", city="London"
+        )
+        customer = Customer.objects.create(
+            name="Brand Zac", adress="44 Roberto Street", city="London"
+        )
+        item = Item.objects.create(label="Ulysse", price_duty_free=25, tax=10)
+        self.invoices = []
+        for quantity in range(1, 4):
+            invoice = Invoice.objects.create(
+                saler=saler,
+                customer=customer,
+                date=date.today(),
+                is_paid=False,
+            )
+            invoice.order_lines.add(
+                OrderLine.objects.create(item=item, quantity=quantity)
+            )
+            self.invoices.append(invoice)
+
+    def test_check_and_rebuild(self):
+        """The command detects and fixes inconsistent totals"""
+        out = StringIO()
+        call_command("rebuild_sales_totals", "--check", stdout=out)
+        self.assertIn("All totals are valid", out.getvalue())
+
+        Invoice.objects.update(total_duty_free=0, total_including_tax=0)
+        with self.assertRaisesMessage(
+            CommandError, "0 order line(s) and 3 document(s)"
+        ):
+            call_command(
+                "rebuild_sales_totals", "--check", "--batch-size=2", stderr=out
+            )
+
+        OrderLine.objects.filter(quantity=1).update(total_duty_free=0)
+        with self.assertRaisesMessage(
+            CommandError, "1 order line(s) and 3 document(s)"
+        ):
+            call_command("rebuild_sales_totals", "--check", stderr=out)
+
+        call_command("rebuild_sales_totals", "--batch-size=2", stdout=out)
+        self.assertIn("1 order lines rebuilt", out.getvalue())
+        self.assertIn("3 invoices rebuilt", out.getvalue())
+        for quantity, invoice in enumerate(self.invoices, 1):
+            invoice.refresh_from_db()
+            self.assertEqual(invoice.total_price_duty_free, 25 * quantity)
+            self.assertEqual(
+                invoice.total_tax_price, Decimal("2.5") * quantity
+            )
+
+
+class BulkCreateInvoicesCommandTest(TestCase):
+    def setUp(self):
+        self.saler = Saler.objects.create(
+            name="BookShop", adress="25 Park Street", city="London"
+        )
+        self.customer = Customer.objects.create(
+            name="Brand Zac", adress="44 Roberto Street", city="London"
+        )
+        self.item = Item.objects.create(
+            label="Ulysse", price_duty_free=25, tax=10
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_csv(self):
+        """The rows of the same invoice are grouped"""
+        path = os.path.join(self.directory, "invoices.csv")
+        with open(path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(
+                ["invoice", "saler", "customer", "date", "is_paid"]
+                + ["item", "quantity"]
+            )
+            for invoice, quantity in (("a", 1), ("a", 2), ("b", 3)):
+                writer.writerow(
+                    [invoice, self.saler.pk, self.customer.pk, "2022-10-01"]
+                    + ["yes", self.item.pk, quantity]
+                )
+        out = StringIO()
+        call_command("bulk_create_invoices", path, stdout=out)
+        self.assertIn("2 invoices and 3 order lines created", out.getvalue())
+        invoices = Invoice.objects.order_by("invoice_saler_number")
+        self.assertEqual(
+            [invoice.total_price_duty_free for invoice in invoices], [75, 75]
+        )
+        self.assertTrue(all(invoice.is_paid for invoice in invoices))
+
+    def test_json(self):
+        path = os.path.join(self.directory, "invoices.data")
+        invoice = {
+            "saler": self.saler.pk,
+            "customer": self.customer.pk,
+            "date": "2022-10-01",
+            "order_lines": [{"item": self.item.pk, "quantity": 2}],
+        }
+        with open(path, "w") as json_file:
+            json.dump([invoice, invoice], json_file)
+        with self.assertRaisesMessage(CommandError, "--format"):
+            call_command("bulk_create_invoices", path)
+        call_command(
+            "bulk_create_invoices", path, "--format=json", stdout=StringIO()
+        )
+        self.assertEqual(Invoice.objects.count(), 2)
+
+        invoice["saler"] = 0
+        with open(path, "w") as json_file:
+            json.dump([invoice], json_file)
+        with self.assertRaisesMessage(CommandError, "unknown saler"):
+            call_command("bulk_create_invoices", path, "--format=json")
+
+
+class ImportSalesDataCommandTest(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            name="Brand Zac", adress="44 Roberto Street", city="London"
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write_csv(self, name, header, rows):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(header)
+            writer.writerows(rows)
+        return path
+
+    def test_customers(self):
+        """The customers are created or updated by name, the invalid rows
+        are reported with their line"""
+        path = self.write_csv(
+            "customers.csv",
+            ["name", "adress", "city", "postal_code", "country"]
+            + ["email", "phone_number"],
+            [
+                ["Brand Zac", "1 Main Street", "Leeds", "LS1", "GB"]
+                + ["zac@test.com", "+442079460958"],
+                ["Jean Dupont", "2 rue Royale", "Paris", "75008", "France"]
+                + ["", "01 23 45 67 89"],
+                ["Carl Sagan", "3 Avenue", "Ithaca", "14850", "Nowhere"]
+                + ["carl", "0123"],
+                ["Jean Dupont", "4 rue Royale", "Lyon", "69001", "FRA"]
+                + ["", ""],
+            ],
+        )
+        report = os.path.join(self.directory, "report.csv")
+        out = StringIO()
+        call_command(
+            "import_sales_data",
+            "customer",
+            path,
+            "--workers=1",
+            f"--report={report}",
+            stdout=out,
+        )
+        self.assertIn(
+            "1 created, 1 updated, 0 reactivated, 2 invalid rows",
+            out.getvalue(),
+        )
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.city, "Leeds")
+        self.assertEqual(self.customer.phone_number, "+442079460958")
+        customer = Customer.objects.get(name="Jean Dupont")
+        self.assertEqual(customer.city, "Paris")
+        self.assertEqual(customer.country.code, "FR")
+        self.assertEqual(customer.phone_number, "+33123456789")
+        with open(report, newline="") as report_file:
+            errors = list(csv.reader(report_file))
+        self.assertEqual(errors[0], ["line", "field", "error"])
+        self.assertEqual(
+            [(line, field) for line, field, error in errors[1:]],
+            [
+                ("4", "country"),
+                ("4", "email"),
+                ("4", "phone_number"),
+                ("5", "name"),
+            ],
+        )
+        self.assertEqual(errors[4][2], "Duplicate of line 3")
+
+    @override_settings(SALES_IMPORT_CHUNK_SIZE=2)
+    def test_items_with_workers(self):
+        """The chunks validated by the processes are written in order"""
+        Item.objects.create(label="Ulysse", price_duty_free=25, tax=10)
+        Item.objects.create(
+            label="Verity",
+            price_duty_free=10,
+            tax=20,
+            is_active=False,
+            deleted_date=timezone.now(),
+            deleted_by=get_user_model().objects.create_user(
+                email="user@test.com", password="password123"
+            ),
+        )
+        path = self.write_csv(
+            "items.csv",
+            ["label", "price_duty_free", "tax"],
+            [[f"Book {index}", index, "5.5"] for index in range(5)]
+            + [["Ulysse", "30", "20"], ["Dune", "cheap", "5.5"]]
+            + [["Verity", "12", "20"]],
+        )
+        out = StringIO()
+        err = StringIO()
+        call_command(
+            "import_sales_data",
+            "item",
+            path,
+            "--workers=2",
+            "--batch-size=3",
+            stdout=out,
+            stderr=err,
+        )
+        self.assertIn(
+            "5 created, 1 updated, 1 reactivated, 1 invalid rows",
+            out.getvalue(),
+        )
+        self.assertIn("Line 8: price_duty_free", err.getvalue())
+        self.assertEqual(Item.objects.get(label="Ulysse").price_duty_free, 30)
+        self.assertEqual(Item.objects.get(label="Book 4").tax, Decimal("5.5"))
+        # the deleted item is reactivated, not created again
+        verity = Item.objects.get(label="Verity")
+        self.assertTrue(verity.is_active)
+        self.assertIsNone(verity.deleted_date)
+        self.assertIsNone(verity.deleted_by)
+        self.assertEqual(verity.price_duty_free, 12)
+
+    def test_missing_column(self):
+        path = self.write_csv("items.csv", ["label", "tax"], [["Dune", 5]])
+        with self.assertRaisesMessage(CommandError, "price_duty_free"):
+            call_command("import_sales_data", "item", path)
@@ -3,7 +3,9 @@ from unittest import mock
 
 from dateutil.relativedelta import relativedelta
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from ..models import Customer, Estimate, Invoice, Item, OrderLine, Saler
 
@@ -328,3 +330,103 @@ class InvoiceTest(TestCase):
             f"{invoice_data['saler']} - {invoice_data['customer']} - "
             f"{invoice_data['date']}",
         )
+
+
+class SalesActionTotalsTest(TestCase):
+    def setUp(self):
+        self.saler = Saler.objects.create(
+            name="BookShop",
+            adress="25 Linking park Street",
+            city="London",
+            postal_code="10002",
+        )
+        self.customer = Customer.objects.create(
+            name="Brand Zac",
+            adress="44 Roberto Street",
+            city="London",
+            postal_code="10002",
+        )
+        self.item = Item.objects.create(
+            label="Don Quixote", price_duty_free=40, tax=2.5
+        )
+        self.order_line_0 = OrderLine.objects.create(
+            item=self.item, quantity=3
+        )
+        self.order_line_1 = OrderLine.objects.create(
+            item=self.item, quantity=2
+        )
+        self.estimate = Estimate.objects.create(
+            saler=self.saler,
+            customer=self.customer,
+            date=date.today(),
+            validity_date=date.today(),
+        )
+        self.estimate.order_lines.set([self.order_line_0, self.order_line_1])
+
+    def assertTotals(self, instance, total_duty_free, total_tax):
+        instance.refresh_from_db()
+        self.assertEqual(instance.total_price_duty_free, total_duty_free)
+        self.assertEqual(instance.total_tax_price, total_tax)
+        self.assertEqual(
+            instance.total_price_including_tax, total_duty_free + total_tax
+        )
+
+    def test_totals_follow_order_lines(self):
+        """The stored totals are updated when the order lines change"""
+        self.assertTotals(self.estimate, 200, 5)
+        self.order_line_0.quantity = 1
+        self.order_line_0.save()
+        self.assertTotals(self.estimate, 120, 3)
+        self.estimate.order_lines.remove(self.order_line_1)
+        self.assertTotals(self.estimate, 40, 1)
+        self.order_line_1.estimate_set.add(self.estimate)
+        self.assertTotals(self.estimate, 120, 3)
+        self.order_line_1.delete()
+        self.assertTotals(self.estimate, 40, 1)
+        self.order_line_0.estimate_set.clear()
+        self.assertTotals(self.estimate, 0, 0)
+
+    def test_totals_keep_order_line_prices(self):
+        """A new item price is only used by the new order lines"""
+        self.item.price_duty_free = 20
+        self.item.tax = 10
+        self.item.save()
+        self.assertTotals(self.estimate, 200, 5)
+        self.order_line_0.refresh_from_db()
+        self.assertEqual(self.order_line_0.price_duty_free, 40)
+        self.assertEqual(self.order_line_0.subtotal_tax_price, 3)
+        self.order_line_0.quantity = 1
+        self.order_line_0.save()
+        self.assertTotals(self.estimate, 120, 3)
+        self.estimate.order_lines.add(
+            OrderLine.objects.create(item=self.item, quantity=1)
+        )
+        self.assertTotals(self.estimate, 140, 5)
+
+        # another item brings its prices
+        order_line = OrderLine.objects.get(pk=self.order_line_1.pk)
+        order_line.item = Item.objects.create(
+            label="Ulysses", price_duty_free=10, tax=20
+        )
+        order_line.save()
+        self.assertTotals(self.estimate, 80, 7)
+
+    def test_totals_without_item_join(self):
+        """The totals are computed from the order lines table"""
+        with CaptureQueriesContext(connection) as queries:
+            self.estimate.update_totals()
+        self.assertNotIn("sales_item", queries[0]["sql"])
+
+    def test_stale_instance_does_not_overwrite_totals(self):
+        """Saving an instance loaded before a change keeps the right totals"""
+        stale_estimate = Estimate.objects.get(pk=self.estimate.pk)
+        self.order_line_0.quantity = 5
+        self.order_line_0.save()
+        stale_estimate.save()
+        self.assertTotals(self.estimate, 280, 7)
+
+    def test_invoice_totals_from_estimate(self):
+        """The invoice created from an estimate has the same totals"""
+        self.estimate.turn_into_an_invoice()
+        invoice = Invoice.objects.get()
+        self.assertTotals(invoice, 200, 5)
@@ -0,0 +1,124 @@
+import threading
+import time
+from datetime import date
+
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from .. import numbering
+from ..models import Customer, Invoice, Saler
+
+
+class ReserveNumbersTest(TestCase):
+    def setUp(self):
+        self.saler = Saler.objects.create(
+            name="BookShop", adress="25 Park Street", city="London"
+        )
+
+    def test_reserve_numbers(self):
+        """Numbers are reserved in consecutive blocks"""
+        for strategy in numbering.STRATEGIES:
+            saler = Saler.objects.create(
+                name=strategy, adress="25 Park Street", city="London"
+            )
+            with override_settings(
+                SALES_NUMBERING_STRATEGIES={"default": strategy}
+            ):
+                self.assertEqual(
+                    numbering.reserve_numbers(saler, "invoice_number", 3),
+                    range(1, 4),
+                )
+                self.assertEqual(saler.invoice_number, 3)
+                self.assertEqual(
+                    numbering.next_number(saler, "invoice_number"), 4
+                )
+            saler.refresh_from_db()
+            self.assertEqual(saler.invoice_number, 4)
+            self.assertEqual(saler.estimate_number, 0)
+        with self.assertRaises(ValueError):
+            numbering.reserve_numbers(self.saler, "invoice_number", 0)
+
+    def test_stale_saler(self):
+        """A saler loaded before another allocation gets the next number"""
+        stale_saler = Saler.objects.get(pk=self.saler.pk)
+        numbering.reserve_numbers(self.saler, "estimate_number", 5)
+        self.assertEqual(
+            numbering.next_number(stale_saler, "estimate_number"), 6
+        )
+        # the saler row isn't saved
+        self.assertEqual(stale_saler.name, "BookShop")
+
+
+class ConcurrentNumberingTest(TransactionTestCase):
+    threads = 8
+    invoices_per_thread = 15
+
+    def setUp(self):
+        self.saler = Saler.objects.create(
+            name="BookShop", adress="25 Park Street", city="London"
+        )
+        self.customer = Customer.objects.create(
+            name="Brand Zac", adress="44 Roberto Street", city="London"
+        )
+
+    def create_invoices(self, barrier, errors):
+        try:
+            saler = Saler.objects.get(pk=self.saler.pk)
+            barrier.wait()
+            for _ in range(self.invoices_per_thread):
+                # the in memory SQLite test database report lock conflicts
+                # instead of waiting, the whole transaction is retried
+                # unless it was committed and the conflict is in the
+                # callbacks, e.g. the refresh of the revenue rollups
+                committed = []
+                while not committed:
+                    try:
+                        with transaction.atomic():
+                            transaction.on_commit(
+                                lambda: committed.append(True)
+                            )
+                            Invoice.objects.create(
+                                saler=saler,
+                                customer=self.customer,
+                                date=date.today(),
+                                is_paid=False,
+                            )
+                    except OperationalError:
+                        time.sleep(0.001)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    def test_no_gaps_or_duplicates(self):
+        """Invoices created in parallel get every number exactly once"""
+        for strategy in numbering.STRATEGIES:
+            Invoice.objects.all().delete()
+            Saler.objects.filter(pk=self.saler.pk).update(invoice_number=0)
+            barrier = threading.Barrier(self.threads)
+            errors = []
+            with override_settings(
+                SALES_NUMBERING_STRATEGIES={"default": strategy}
+            ):
+                threads = [
+                    threading.Thread(
+                        target=self.create_invoices, args=(barrier, errors)
+                    )
+                    for _ in range(self.threads)
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            self.assertEqual(errors, [])
+            total = self.threads * self.invoices_per_thread
+            self.assertEqual(
+                sorted(
+                    Invoice.objects.values_list(
+                        "invoice_saler_number", flat=True
+                    )
+                ),
+                list(range(1, total + 1)),
+            )
+            self.saler.refresh_from_db()
+            self.assertEqual(self.saler.invoice_number, total)
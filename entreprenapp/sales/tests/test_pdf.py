@@ -0,0 +1,333 @@
+import os
+import tempfile
+import zipfile
+from datetime import date
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from core.profiling import load_stats
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from .. import checks, images, pdf
+from ..models import Customer, Invoice, Item, OrderLine, Saler
+
+
+class SalesActionPDFCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = get_user_model().objects.create_user(
+            email="user@test.com", password="password123"
+        )
+        self.client = Client()
+        self.client.force_login(user)
+        self.saler = Saler.objects.create(
+            name="BookShop", adress="25 Park Street", city="London"
+        )
+        self.customer = Customer.objects.create(
+            name="Brand Zac", adress="44 Roberto Street", city="London"
+        )
+        self.item = Item.objects.create(
+            label="Ulysse", price_duty_free=25, tax=10
+        )
+        self.order_line = OrderLine.objects.create(item=self.item, quantity=2)
+        self.invoice = Invoice.objects.create(
+            saler=self.saler,
+            customer=self.customer,
+            date=date.today(),
+            is_paid=False,
+        )
+        self.invoice.order_lines.add(self.order_line)
+        self.url = reverse("sales:invoice_pdf", kwargs={"pk": self.invoice.pk})
+
+    def test_cached_pdf(self):
+        """The pdf is rendered once and served with validators"""
+        self.assertIsNone(pdf.get_cached_pdf(self.invoice))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b"%PDF"))
+        etag = response["ETag"]
+        content_hash, _, content = pdf.get_cached_pdf(self.invoice)
+        self.assertEqual(etag, f'"{content_hash}"')
+        self.assertEqual(content, response.content)
+
+        # served from the cache without rendering the template
+        cached_response = self.client.get(self.url)
+        self.assertIsNone(cached_response.context)
+        self.assertEqual(cached_response.content, response.content)
+
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_invalidation(self):
+        """The cached pdf is dropped when the document data change"""
+        etag = self.client.get(self.url)["ETag"]
+
+        self.customer.name = "Brand Zac Junior"
+        self.customer.save()
+        self.assertIsNone(pdf.get_cached_pdf(self.invoice))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        for change in (
+            lambda: self.item.save(),
+            lambda: self.saler.save(),
+            lambda: self.invoice.save(),
+            lambda: self.invoice.order_lines.clear(),
+            lambda: self.order_line.invoice_set.add(self.invoice),
+            lambda: self.order_line.delete(),
+        ):
+            self.client.get(self.url)
+            self.assertIsNotNone(pdf.get_cached_pdf(self.invoice))
+            change()
+            self.assertIsNone(pdf.get_cached_pdf(self.invoice))
+
+    def test_unchanged_html_reuse_pdf(self):
+        """An invalidated document with the same html is not rendered again"""
+        etag = self.client.get(self.url)["ETag"]
+        self.invoice.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_rendered_when_requested(self):
+        """Saving a document doesn't render its pdf"""
+        with mock.patch.object(pdf, "get_executor") as get_executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.invoice.save()
+            get_executor.assert_not_called()
+
+    def test_shared_cache_check(self):
+        """The deploy checks warn when the pdf cache is per process"""
+        self.assertEqual(
+            [warning.id for warning in checks.check_sales_caches(None)],
+            ["core.W001", "core.W001"],
+        )
+        with override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.dummy.DummyCache"
+                }
+            }
+        ):
+            self.assertEqual(checks.check_sales_caches(None), [])
+
+    def test_profiled_request_renders_in_process(self):
+        """A profiled pdf is rendered without the cache and the pool"""
+        admin = get_user_model().objects.create_superuser(
+            email="admin@test.com", password="strongpass123"
+        )
+        self.client.force_login(admin)
+        self.client.get(self.url)
+        with tempfile.TemporaryDirectory() as profile_dir, override_settings(
+            CORE_PROFILE_DIR=Path(profile_dir)
+        ), mock.patch.object(pdf, "get_executor") as get_executor:
+            response = self.client.get(self.url, {"profile": "1"})
+            self.assertTrue(response.content.startswith(b"%PDF"))
+            self.assertIsNotNone(response.context)
+            get_executor.assert_not_called()
+            stats = load_stats(response["X-Profile-Id"])
+        self.assertTrue(
+            any(function == "html_to_pdf" for _, _, function in stats.stats)
+        )
+
+
+class SalesActionPDFExportTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = get_user_model().objects.create_user(
+            email="user@test.com", password="password123"
+        )
+        self.client = Client()
+        self.client.force_login(user)
+        self.salers = [
+            Saler.objects.create(
+                name=name, adress="25 Park Street", city="London"
+            )
+            for name in ("Book Shop", "Tech Shop")
+        ]
+        customer = Customer.objects.create(
+            name="Brand Zac", adress="44 Roberto Street", city="London"
+        )
+        item = Item.objects.create(label="Ulysse", price_duty_free=25, tax=10)
+        last_month = date.today() - relativedelta(months=1)
+        for saler in self.salers:
+            for invoice_date in (date.today(), date.today(), last_month):
+                invoice = Invoice.objects.create(
+                    saler=saler,
+                    customer=customer,
+                    date=invoice_date,
+                    is_paid=False,
+                )
+                invoice.order_lines.add(
+                    OrderLine.objects.create(item=item, quantity=1)
+                )
+        Invoice.objects.filter(pk=invoice.pk).update(is_active=False)
+
+    def test_export_view(self):
+        """The selected invoices are streamed in a zip archive"""
+        response = self.client.get(
+            reverse("sales:invoice_export"),
+            {
+                "month": f"{date.today():%Y-%m}",
+                "saler": self.salers[0].pk,
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["content-type"], "application/zip")
+        self.assertIn(
+            f"invoices-{self.salers[0].pk}-{date.today():%Y-%m}.zip",
+            response["content-disposition"],
+        )
+        archive = zipfile.ZipFile(BytesIO(b"".join(response)))
+        self.assertEqual(
+            archive.namelist(),
+            [
+                f"{self.salers[0].pk}-book-shop/Invoice n° 00000001.pdf",
+                f"{self.salers[0].pk}-book-shop/Invoice n° 00000002.pdf",
+            ],
+        )
+        for name in archive.namelist():
+            self.assertTrue(archive.read(name).startswith(b"%PDF"))
+
+        # inactive invoices are not exported for the users
+        response = self.client.get(reverse("sales:invoice_export"))
+        archive = zipfile.ZipFile(BytesIO(b"".join(response)))
+        self.assertEqual(len(archive.namelist()), 5)
+
+        response = self.client.get(
+            reverse("sales:invoice_export"), {"month": "2022-13"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_command(self):
+        """The command write the zip archive of the selected documents"""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "invoices.zip")
+            call_command(
+                "export_sales_pdf",
+                "invoice",
+                output,
+                f"--saler={self.salers[1].pk}",
+                "--inactive",
+                stdout=StringIO(),
+            )
+            with zipfile.ZipFile(output) as archive:
+                self.assertEqual(len(archive.namelist()), 3)
+
+
+class SalerLogoTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def upload(self, name, mode, size):
+        output = BytesIO()
+        Image.new(mode, size, "red").save(output, name.split(".")[1])
+        return SimpleUploadedFile(name, output.getvalue())
+
+    def create_saler(self, logo):
+        return Saler.objects.create(
+            name="BookShop", adress="25 Park Street", city="London", logo=logo
+        )
+
+    def test_derivatives(self):
+        """The uploaded logo is reduced and recompressed, the pdf uses its
+        reduced copy"""
+        saler = self.create_saler(self.upload("shop.png", "RGB", (2400, 600)))
+        self.assertEqual(
+            (saler.logo_pdf_width, saler.logo_pdf_height), (480, 120)
+        )
+        self.assertEqual(
+            (saler.logo_thumbnail_width, saler.logo_thumbnail_height),
+            (240, 60),
+        )
+        self.assertTrue(saler.logo_pdf.name.endswith(".jpg"))
+        with Image.open(saler.logo_pdf.path) as image:
+            self.assertEqual(image.size, (480, 120))
+        self.assertLess(saler.logo_pdf.size, saler.logo.size)
+
+        # the derivatives are only built when the logo changes
+        pdf_logo = saler.logo_pdf.name
+        saler = Saler.objects.get()
+        saler.name = "Book Shop"
+        saler.save()
+        self.assertEqual(saler.logo_pdf.name, pdf_logo)
+
+        # the previous derivatives are deleted after the commit
+        thumbnail = saler.logo_thumbnail.name
+        saler.logo = self.upload("new.png", "RGBA", (100, 100))
+        with self.captureOnCommitCallbacks(execute=True):
+            saler.save()
+        self.assertFalse(default_storage.exists(pdf_logo))
+        self.assertFalse(default_storage.exists(thumbnail))
+        saler.refresh_from_db()
+        self.assertTrue(saler.logo_pdf.name.endswith(".png"))
+        self.assertTrue(default_storage.exists(saler.logo_pdf.name))
+        self.assertEqual(saler.logo_thumbnail_width, 96)
+
+        customer = Customer.objects.create(
+            name="Brand Zac", adress="44 Roberto Street", city="London"
+        )
+        invoice = Invoice.objects.create(
+            saler=saler, customer=customer, date=date.today(), is_paid=False
+        )
+        invoice.order_lines.add(
+            OrderLine.objects.create(
+                item=Item.objects.create(
+                    label="Ulysse", price_duty_free=25, tax=10
+                ),
+                quantity=2,
+            )
+        )
+        html = pdf.render_html(invoice)
+        self.assertIn(saler.logo_pdf.url, html)
+        self.assertIn('width="50" height="50"', html)
+        self.assertNotIn(saler.logo_thumbnail.url, html)
+        self.assertTrue(pdf.html_to_pdf(html).startswith(b"%PDF"))
+
+        pdf_logo = saler.logo_pdf.name
+        saler.logo = None
+        with self.captureOnCommitCallbacks(execute=True):
+            saler.save()
+        self.assertFalse(saler.logo_pdf)
+        self.assertIsNone(saler.logo_pdf_width)
+        self.assertFalse(default_storage.exists(pdf_logo))
+
+    def test_unreadable_logo(self):
+        saler = self.create_saler(SimpleUploadedFile("shop.png", b"no image"))
+        self.assertTrue(saler.logo)
+        self.assertFalse(saler.logo_pdf)
+
+    def test_build_command(self):
+        """The command builds the missing derivatives"""
+        saler = self.create_saler(self.upload("shop.jpeg", "RGB", (800, 800)))
+        Saler.objects.update(logo_pdf=None, logo_thumbnail="")
+        self.create_saler(None)
+        out = StringIO()
+        call_command("build_logo_derivatives", stdout=out)
+        self.assertIn("1 logo derivatives built", out.getvalue())
+        saler.refresh_from_db()
+        self.assertEqual(saler.logo_pdf_height, 192)
+        self.assertEqual(saler.logo_thumbnail_height, 96)
+
+        self.assertEqual(images.build_logo_derivatives(Saler.objects.all()), 0)
+        pdf_logo = saler.logo_pdf.name
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(
+                images.build_logo_derivatives(Saler.objects.all(), force=True),
+                1,
+            )
+        self.assertFalse(default_storage.exists(pdf_logo))
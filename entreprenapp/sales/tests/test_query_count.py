@@ -0,0 +1,227 @@
+from datetime import date
+
+from core.profiling import QueryBudgetMixin
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Customer, Estimate, Invoice, Item, OrderLine, Saler
+
+
+class SalesListQueryCountTest(TestCase):
+    """The sales list pages are served with a constant number of queries"""
+
+    # session, user, count, page
+    LIST_QUERIES = 4
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            email="user@test.com", password="password123"
+        )
+        self.client = Client()
+        self.client.force_login(user)
+        self.item = Item.objects.create(
+            label="Ulysse", price_duty_free=25, tax=10
+        )
+
+    def create_sales_actions(self, model, number, order_lines=3, **kwargs):
+        for index in range(number):
+            saler = Saler.objects.create(
+                name=f"saler {index}", adress="25 Park Street", city="London"
+            )
+            customer = Customer.objects.create(
+                name=f"customer {index}", adress="44 Street", city="London"
+            )
+            instance = model.objects.create(
+                saler=saler, customer=customer, date=date.today(), **kwargs
+            )
+            instance.order_lines.set(
+                [
+                    OrderLine.objects.create(item=self.item, quantity=1)
+                    for _ in range(order_lines)
+                ]
+            )
+
+    def assertConstantQueries(self, model, url, **kwargs):
+        self.create_sales_actions(model, 1, **kwargs)
+        with self.assertNumQueries(self.LIST_QUERIES):
+            self.client.get(url)
+        self.create_sales_actions(model, 14, order_lines=10, **kwargs)
+        with self.assertNumQueries(self.LIST_QUERIES):
+            response = self.client.get(url)
+        self.assertEqual(len(response.context["object_list"]), 15)
+
+    def test_invoice_list_queries(self):
+        self.assertConstantQueries(
+            Invoice, reverse("sales:invoice_list"), is_paid=False
+        )
+
+    def test_estimate_list_queries(self):
+        self.assertConstantQueries(
+            Estimate,
+            reverse("sales:estimate_list"),
+            validity_date=date.today(),
+        )
+
+
+class SalesDetailQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """The sales detail pages don't repeat a query per order line"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            email="user@test.com", password="password123"
+        )
+        self.client.force_login(user)
+        self.saler = Saler.objects.create(
+            name="saler", adress="25 Park Street", city="London"
+        )
+        self.customer = Customer.objects.create(
+            name="customer", adress="44 Street", city="London"
+        )
+
+    def assertDetailBudget(self, model, url_name, **kwargs):
+        instance = model.objects.create(
+            saler=self.saler,
+            customer=self.customer,
+            date=date.today(),
+            **kwargs,
+        )
+        instance.order_lines.set(
+            [
+                OrderLine.objects.create(
+                    item=Item.objects.create(
+                        label=f"item {index}", price_duty_free=10, tax=20
+                    ),
+                    quantity=1,
+                )
+                for index in range(10)
+            ]
+        )
+        with self.assertQueryBudget(queries=10, similar=1):
+            self.client.get(reverse(url_name, args=[instance.pk]))
+
+    def test_invoice_detail_budget(self):
+        self.assertDetailBudget(Invoice, "sales:invoice_detail", is_paid=False)
+
+    def test_estimate_detail_budget(self):
+        self.assertDetailBudget(
+            Estimate,
+            "sales:estimate_detail",
+            validity_date=date.today(),
+        )
+
+
+class OrderLineFormsetQueryCountTest(TestCase):
+    """The order line forms share the cached item catalog"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            email="user@test.com", password="password123"
+        )
+        self.client = Client()
+        self.client.force_login(user)
+        self.items = [
+            Item.objects.create(
+                label=f"item {index}", price_duty_free=10, tax=20
+            )
+            for index in range(50)
+        ]
+        Item.objects.create(
+            label="inactive", price_duty_free=10, tax=20, is_active=False
+        )
+        saler = Saler.objects.create(
+            name="saler", adress="25 Park Street", city="London"
+        )
+        customer = Customer.objects.create(
+            name="customer", adress="44 Street", city="London"
+        )
+        self.estimate = Estimate.objects.create(
+            saler=saler,
+            customer=customer,
+            date=date.today(),
+            validity_date=date.today(),
+        )
+
+    def set_order_lines(self, number):
+        self.estimate.order_lines.set(
+            [
+                OrderLine.objects.create(item=self.items[index], quantity=1)
+                for index in range(number)
+            ]
+        )
+
+    def get_update_page(self):
+        return self.client.get(
+            reverse("sales:estimate_update", args=[self.estimate.pk])
+        )
+
+    def test_update_page_queries(self):
+        self.set_order_lines(1)
+        # load the catalog
+        response = self.get_update_page()
+        self.assertContains(response, 'data-total="12.0000"', count=50 * 3)
+        self.assertNotContains(response, "inactive")
+        with CaptureQueriesContext(connection) as one_line:
+            self.get_update_page()
+        self.set_order_lines(20)
+        with CaptureQueriesContext(connection) as twenty_lines:
+            response = self.get_update_page()
+        self.assertEqual(len(twenty_lines), len(one_line))
+        self.assertContains(
+            response, f'<option value="{self.items[19].pk}" selected'
+        )
+
+    def test_catalog_invalidation(self):
+        self.get_update_page()
+        self.items[0].label = "renamed item"
+        self.items[0].save()
+        self.assertContains(self.get_update_page(), "renamed item")
+
+    def test_create_queries(self):
+        data = {
+            "saler": self.estimate.saler_id,
+            "customer": self.estimate.customer_id,
+            "date": date.today(),
+            "validity_date": date.today(),
+            "form-TOTAL_FORMS": "20",
+            "form-INITIAL_FORMS": "0",
+        }
+        for index in range(20):
+            data[f"form-{index}-item"] = self.items[index].pk
+            data[f"form-{index}-quantity"] = 2
+        self.client.get(reverse("sales:estimate_create"))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse("sales:estimate_create"), data)
+        item_queries = [
+            query
+            for query in queries
+            if query["sql"].startswith('SELECT "sales_item"')
+        ]
+        # the prices of the items are read once, not from the catalog
+        self.assertEqual(len(item_queries), 1)
+        estimate = Estimate.objects.latest("pk")
+        self.assertEqual(estimate.order_lines.count(), 20)
+
+    def test_stale_catalog_prices(self):
+        """The order lines get the prices in the database"""
+        self.get_update_page()
+        # changed by another process, the catalog isn't dropped here
+        Item.objects.filter(pk=self.items[0].pk).update(price_duty_free=15)
+        self.client.post(
+            reverse("sales:estimate_create"),
+            {
+                "saler": self.estimate.saler_id,
+                "customer": self.estimate.customer_id,
+                "date": date.today(),
+                "validity_date": date.today(),
+                "form-TOTAL_FORMS": "1",
+                "form-INITIAL_FORMS": "0",
+                "form-0-item": self.items[0].pk,
+                "form-0-quantity": 2,
+            },
+        )
+        order_line = Estimate.objects.latest("pk").order_lines.get()
+        self.assertEqual(order_line.price_duty_free, 15)
+        self.assertEqual(order_line.total_duty_free, 30)
@@ -1,10 +1,14 @@
 from datetime import date
+from unittest import mock
 
 from dateutil.relativedelta import relativedelta
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
+from .. import importer
 from ..models import Customer, Estimate, Invoice, Item, OrderLine, Saler
 
 
@@ -416,6 +420,66 @@ class CustomerViewsTestCase(TestCase):
         self.assertIsNotNone(deleted_customer.deleted_date)
         self.assertEqual(deleted_customer.deleted_by, self.user)
 
+    def test_import_view(self):
+        """A CSV file of customers is imported, the invalid rows are
+        listed"""
+        url = reverse("sales:import")
+        response_anonymous = self.client.get(url, follow=False)
+        self.assertEqual(response_anonymous.status_code, 302)
+        self.assertIn(reverse("users:login"), response_anonymous.url)
+
+        content = (
+            "name,adress,city,postal_code,country,phone_number\n"
+            "Jhon Doe,1 Main Street,Leeds,LS1,GB,020 7946 0958\n"
+            "Ada Lovelace,2 Main Street,London,N1,United Kingdom,\n"
+        )
+        # the rows are validated in the request process
+        with mock.patch.object(importer, "ProcessPoolExecutor") as executor:
+            response_user = self.default_client.post(
+                url,
+                {
+                    "model": "customer",
+                    "file": SimpleUploadedFile(
+                        "customers.csv", content.encode()
+                    ),
+                },
+                follow=True,
+            )
+        executor.assert_not_called()
+        self.assertRedirects(response_user, reverse("sales:customer_list"))
+        self.customer_0.refresh_from_db()
+        self.assertEqual(self.customer_0.city, "Leeds")
+        self.assertEqual(self.customer_0.phone_number, "+442079460958")
+        self.assertEqual(self.customer_0.modified_by, self.user)
+        ada = Customer.objects.get(name="Ada Lovelace")
+        self.assertEqual(ada.created_by, self.user)
+        self.assertEqual(ada.country.code, "GB")
+
+        content = "name,adress,city,postal_code\nBob,,London,N1\n"
+        response_user = self.default_client.post(
+            url,
+            {
+                "model": "customer",
+                "file": SimpleUploadedFile("customers.csv", content.encode()),
+            },
+        )
+        self.assertEqual(response_user.status_code, 200)
+        self.assertContains(response_user, "This field is required.")
+        self.assertFalse(Customer.objects.filter(name="Bob").exists())
+
+        response_user = self.default_client.post(
+            url,
+            {
+                "model": "customer",
+                "file": SimpleUploadedFile("customers.csv", b"name\nBob\n"),
+            },
+        )
+        self.assertFormError(
+            response_user.context["form"],
+            "file",
+            "Missing column(s): adress, city, postal_code",
+        )
+
 
 class ItemViewsTestCase(TestCase):
     def setUp(self):
@@ -955,6 +1019,40 @@ class EstimateViewsTestCase(TestCase):
         self.assertIsNotNone(deleted_estimate.deleted_date)
         self.assertEqual(deleted_estimate.deleted_by, self.user)
 
+    def test_convert_view(self):
+        """The selected estimates are turned into invoices"""
+        url = reverse("sales:estimate_convert")
+        response_anonymous = self.client.post(url, follow=False)
+        self.assertEqual(response_anonymous.status_code, 302)
+        self.assertIn(reverse("users:login"), response_anonymous.url)
+
+        # an inactive estimate can only be converted by an admin
+        response_user = self.default_client.post(
+            url,
+            {"estimates": [self.estimate_0.id, self.estimate_1.id]},
+            follow=True,
+        )
+        self.assertRedirects(response_user, reverse("sales:estimate_list"))
+        self.assertFalse(Invoice.objects.exists())
+
+        response_user = self.default_client.post(
+            url, {"estimates": [self.estimate_0.id]}, follow=True
+        )
+        self.assertRedirects(response_user, reverse("sales:invoice_list"))
+        messages = list(response_user.context["messages"])
+        self.assertEqual(
+            str(messages[0]), "1 invoice(s) were created successfully"
+        )
+        invoice = Invoice.objects.get()
+        self.assertEqual(invoice.created_by, self.user)
+        self.assertEqual(invoice.total_price_including_tax, 240)
+        self.assertNotEqual(invoice.order_lines.get().pk, self.order_line_0.pk)
+
+        self.admin_client.post(
+            url, {"estimates": [self.estimate_0.id, self.estimate_1.id]}
+        )
+        self.assertEqual(Invoice.objects.count(), 3)
+
 
 class InvoiceViewsTestCase(TestCase):
     def setUp(self):
@@ -1292,3 +1390,112 @@ class InvoiceViewsTestCase(TestCase):
         self.assertFalse(deleted_invoice.is_active)
         self.assertIsNotNone(deleted_invoice.deleted_date)
         self.assertEqual(deleted_invoice.deleted_by, self.user)
+
+
+@override_settings(SALES_AUTOCOMPLETE_LIMIT=5)
+class AutocompleteViewsTestCase(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="user@test.com", password="password123"
+        )
+        self.customers = [
+            Customer.objects.create(
+                name=f"riot {index:02}", adress="44 Maltings", city="London"
+            )
+            for index in range(30)
+        ]
+        self.customers[0].is_active = False
+        self.customers[0].save()
+        self.saler = Saler.objects.create(
+            name="computer corporation", adress="15 Maltings", city="London"
+        )
+
+    def autocomplete(self, model_name, query=""):
+        return self.client.get(
+            reverse("sales:autocomplete", args=[model_name]), {"q": query}
+        )
+
+    def test_autocomplete_view(self):
+        self.assertEqual(self.autocomplete("customer").status_code, 302)
+        self.client.force_login(self.user)
+        self.assertEqual(self.autocomplete("item").status_code, 404)
+
+        data = self.autocomplete("customer").json()
+        self.assertEqual(
+            [result["text"] for result in data["results"]],
+            [f"riot {index:02}" for index in range(1, 6)],
+        )
+        self.assertTrue(data["more"])
+        data = self.autocomplete("customer", "rio 17").json()
+        self.assertEqual(
+            data["results"],
+            [{"id": self.customers[17].pk, "text": "riot 17"}],
+        )
+        self.assertFalse(data["more"])
+        data = self.autocomplete("customer", "riot 00").json()
+        self.assertEqual(data["results"], [])
+        data = self.autocomplete("saler", "comp").json()
+        self.assertEqual(data["results"][0]["id"], self.saler.pk)
+
+    @override_settings(SALES_AUTOCOMPLETE_LIMIT=2)
+    def test_soft_deleted_matches(self):
+        self.client.force_login(self.user)
+        for index in range(3):
+            Customer.objects.create(
+                name=f"Zyxwq dead {index}",
+                adress="44 Maltings",
+                city="London",
+                is_active=False,
+                deleted_date=timezone.now(),
+            )
+        alive = Customer.objects.create(
+            name="Zyxwq alive", adress="44 Maltings", city="London"
+        )
+        data = self.autocomplete("customer", "zyxwq").json()
+        self.assertEqual(
+            data,
+            {"results": [{"id": alive.pk, "text": alive.name}], "more": False},
+        )
+        for index in range(2):
+            Customer.objects.create(
+                name=f"Zyxwq alive {index}",
+                adress="44 Maltings",
+                city="London",
+            )
+        data = self.autocomplete("customer", "zyxwq").json()
+        self.assertEqual(len(data["results"]), 2)
+        self.assertTrue(data["more"])
+
+    def test_only_selected_option_rendered(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("sales:estimate_create"))
+        self.assertNotContains(response, "riot")
+        estimate = Estimate.objects.create(
+            saler=self.saler,
+            customer=self.customers[3],
+            date=date.today(),
+            validity_date=date.today(),
+        )
+        estimate.order_lines.set(
+            [
+                OrderLine.objects.create(
+                    item=Item.objects.create(
+                        label="Ulysse", price_duty_free=10, tax=20
+                    ),
+                    quantity=1,
+                )
+            ]
+        )
+        response = self.client.get(
+            reverse("sales:estimate_update", args=[estimate.pk])
+        )
+        self.assertContains(
+            response,
+            f'<option value="{self.customers[3].pk}" selected>riot 03',
+        )
+        self.assertNotContains(response, "riot 04")
+        self.assertContains(
+            response,
+            'data-autocomplete-url="'
+            + reverse("sales:autocomplete", args=["customer"]),
+        )
@@ -1,19 +1,24 @@
 from django.urls import path
 
 from .views import (
+    AutocompleteView,
     CustomerCreateView,
     CustomerDeleteView,
     CustomerListView,
     CustomerUpdateView,
+    EstimateConvertView,
     EstimateCreateView,
     EstimateDeleteView,
     EstimateDetailView,
+    EstimateExportView,
     EstimateListView,
     EstimatePDFView,
     EstimateUpdateView,
+    ImportView,
     InvoiceCreateView,
     InvoiceDeleteView,
     InvoiceDetailView,
+    InvoiceExportView,
     InvoiceListView,
     InvoicePDFView,
     InvoiceUpdateView,
@@ -74,6 +79,12 @@ urlpatterns = [
         ItemDeleteView.as_view(),
         name="item_delete",
     ),
+    path("import/", ImportView.as_view(), name="import"),
+    path(
+        "autocomplete/<str:model_name>/",
+        AutocompleteView.as_view(),
+        name="autocomplete",
+    ),
     path(
         "estimate/create/",
         EstimateCreateView.as_view(),
@@ -84,6 +95,16 @@ urlpatterns = [
         EstimatePDFView.as_view(),
         name="estimate_pdf",
     ),
+    path(
+        "estimate/export/",
+        EstimateExportView.as_view(),
+        name="estimate_export",
+    ),
+    path(
+        "estimate/convert/",
+        EstimateConvertView.as_view(),
+        name="estimate_convert",
+    ),
     path(
         "estimate/delete/<int:pk>",
         EstimateDeleteView.as_view(),
@@ -124,6 +145,11 @@ urlpatterns = [
         InvoicePDFView.as_view(),
         name="invoice_pdf",
     ),
+    path(
+        "invoice/export/",
+        InvoiceExportView.as_view(),
+        name="invoice_export",
+    ),
     path(
         "invoice/create/",
         InvoiceCreateView.as_view(),
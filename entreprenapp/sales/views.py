@@ -1,4 +1,8 @@
-from core.utils import link_callback
+import csv
+import io
+from decimal import Decimal
+
+from core import search
 from core.views import (
     CoreCreateView,
     CoreDeleteView,
@@ -6,34 +10,71 @@ from core.views import (
     CoreListView,
     CoreUpdateView,
 )
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.messages.views import SuccessMessageMixin
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Value
 from django.forms import formset_factory, modelformset_factory
-from django.http import Http404, HttpResponse
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect
-from django.template.loader import get_template
 from django.urls import reverse_lazy
+from django.utils.cache import get_conditional_response
+from django.utils.functional import cached_property
+from django.utils.http import http_date
 from django.utils.translation import gettext_lazy as _
 from django.views.generic import FormView, View
-from xhtml2pdf import pisa
 
+from . import pdf
+from .bulk import convert_estimates
+from .catalog import ItemCatalog
 from .forms import (
     CustomerForm,
+    EstimateConvertForm,
     EstimateForm,
+    ImportFileForm,
     InvoiceForm,
     ItemForm,
     OrderLineForm,
     OrderLineFormSetHelper,
     OrderLineFormUpdateSetHelper,
     SalerForm,
+    SalesActionExportForm,
 )
+from .importer import ImportFileError, import_rows, read_csv
 from .models import Customer, Estimate, Invoice, Item, OrderLine, Saler
 
+ACTOR_EXPORT_FIELDS = (
+    "id",
+    "name",
+    "adress",
+    "postal_code",
+    "city",
+    "country",
+    "email",
+    "phone_number",
+)
+SALES_ACTION_EXPORT_FIELDS = (
+    "saler__name",
+    "customer__name",
+    "date",
+    "total_duty_free",
+    "total_tax",
+    "total_including_tax",
+)
+
 
 class SalerListView(CoreListView):
     model = Saler
     template_name = "sales/saler/list.html"
+    export_fields = ACTOR_EXPORT_FIELDS
 
 
 class SalerCreateView(SuccessMessageMixin, CoreCreateView):
@@ -61,6 +102,7 @@ class SalerDeleteView(CoreDeleteView):
 class CustomerListView(CoreListView):
     model = Customer
     template_name = "sales/customer/list.html"
+    export_fields = ACTOR_EXPORT_FIELDS
 
 
 class CustomerCreateView(SuccessMessageMixin, CoreCreateView):
@@ -88,6 +130,27 @@ class CustomerDeleteView(CoreDeleteView):
 class ItemListView(CoreListView):
     model = Item
     template_name = "sales/item/list.html"
+    export_fields = (
+        "id",
+        "label",
+        "description",
+        "price_duty_free",
+        "tax",
+        "tax_amount",
+        "price_including_tax",
+    )
+    # computed by the database, like Item.tax_price and including_tax
+    export_annotations = {
+        "tax_amount": ExpressionWrapper(
+            F("price_duty_free") * F("tax") * Value(Decimal("0.01")),
+            output_field=DecimalField(max_digits=20, decimal_places=6),
+        ),
+        "price_including_tax": ExpressionWrapper(
+            F("price_duty_free")
+            + F("price_duty_free") * F("tax") * Value(Decimal("0.01")),
+            output_field=DecimalField(max_digits=20, decimal_places=6),
+        ),
+    }
 
 
 class ItemCreateView(SuccessMessageMixin, CoreCreateView):
@@ -112,6 +175,38 @@ class ItemDeleteView(CoreDeleteView):
     success_url = reverse_lazy("sales:item_list")
 
 
+class AutocompleteView(LoginRequiredMixin, View):
+    """Return the active salers or customers matching the q parameter as
+    JSON, at most SALES_AUTOCOMPLETE_LIMIT of them. The matches come from
+    the search index, so a term matches the start of a word of the name
+    or the adress without scanning the table."""
+
+    models = {"saler": Saler, "customer": Customer}
+
+    def get(self, request, *args, **kwargs):
+        model = self.models.get(kwargs["model_name"])
+        if model is None:
+            raise Http404()
+        limit = getattr(settings, "SALES_AUTOCOMPLETE_LIMIT", 20)
+        queryset = model.objects.filter(is_active=True)
+        query = request.GET.get("q", "").strip()
+        if query:
+            # one more match tells if there are more, the inactive matches
+            # don't count in the search limit
+            queryset = search.search(queryset, query, limit=limit + 1)
+        else:
+            queryset = queryset.order_by("name")
+        rows = list(queryset.values_list("pk", "name")[: limit + 1])
+        return JsonResponse(
+            {
+                "results": [
+                    {"id": pk, "text": name} for pk, name in rows[:limit]
+                ],
+                "more": len(rows) > limit,
+            }
+        )
+
+
 """Generic sales action views"""
 
 
@@ -119,31 +214,45 @@ class GenericSalesActionCreateView(LoginRequiredMixin, FormView):
 
     success_url = None
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+    @cached_property
+    def item_catalog(self):
+        # shared by every order line form of the request
+        return ItemCatalog()
+
+    def get_formset(self, data=None):
         default_formset = formset_factory(
             OrderLineForm, min_num=1, validate_min=True
         )
-        context.setdefault("formset", default_formset)
+        return default_formset(
+            data, form_kwargs={"catalog": self.item_catalog}
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.setdefault("formset", self.get_formset())
         context["order_lines_helper"] = OrderLineFormSetHelper
         return context
 
     def post(self, request, *args, **kwargs):
         form = self.form_class(request.POST)
-        context = self.get_context_data()
-        formset = context["formset"](request.POST)
+        formset = self.get_formset(request.POST)
         if formset.is_valid() and form.is_valid():
-            order_line_instances = []
-            for order_line_data in formset.cleaned_data:
-                if order_line_data:
-                    order_line = OrderLine.objects.create(**order_line_data)
-                order_line_instances.append(order_line)
-            instance = self.model.objects.create(
-                **form.cleaned_data,
-                created_by=self.request.user,
-            )
-            instance.order_lines.set(order_line_instances)
-            instance.save()
+            # the saler number is only used when the document is saved
+            with transaction.atomic():
+                order_line_instances = [
+                    OrderLine(**order_line_data)
+                    for order_line_data in formset.cleaned_data
+                    if order_line_data
+                ]
+                OrderLine.copy_prices(order_line_instances)
+                for order_line in order_line_instances:
+                    order_line.save()
+                instance = self.model.objects.create(
+                    **form.cleaned_data,
+                    created_by=self.request.user,
+                )
+                instance.order_lines.set(order_line_instances)
+                instance.save()
             messages.add_message(
                 request,
                 messages.SUCCESS,
@@ -163,6 +272,11 @@ class GenericSalesActionUpdateView(LoginRequiredMixin, FormView):
 
     success_url = None
 
+    @cached_property
+    def item_catalog(self):
+        # shared by every order line form of the request
+        return ItemCatalog()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         object_to_update = get_object_or_404(
@@ -176,7 +290,10 @@ class GenericSalesActionUpdateView(LoginRequiredMixin, FormView):
             can_delete=True,
         )
         context["default_formset"] = default_formset
-        formset = default_formset(queryset=object_to_update.order_lines.all())
+        formset = default_formset(
+            queryset=object_to_update.order_lines.all(),
+            form_kwargs={"catalog": self.item_catalog},
+        )
         context["object"] = object_to_update
         context["form"] = self.form_class(instance=object_to_update)
         context.setdefault("formset", formset)
@@ -186,13 +303,26 @@ class GenericSalesActionUpdateView(LoginRequiredMixin, FormView):
     def post(self, request, *args, **kwargs):
         context = self.get_context_data()
         form = self.form_class(request.POST, instance=context["object"])
-        formset = context["default_formset"](request.POST)
+        # only the order lines of the document can be changed, without
+        # the queryset every order line would be read
+        formset = context["default_formset"](
+            request.POST,
+            queryset=context["object"].order_lines.all(),
+            form_kwargs={"catalog": self.item_catalog},
+        )
         if formset.is_valid() and form.is_valid():
-            estimate = form.save(commit=False)
-            formset.save()
-            for new_oder_line in formset.new_objects:
-                estimate.order_lines.add(new_oder_line)
-            estimate.save()
+            # the revenue rollups are refreshed once after the commit
+            with transaction.atomic():
+                estimate = form.save(commit=False)
+                order_lines = formset.save(commit=False)
+                OrderLine.copy_prices(formset.new_objects)
+                for order_line in order_lines:
+                    order_line.save()
+                for order_line in formset.deleted_objects:
+                    order_line.delete()
+                for new_oder_line in formset.new_objects:
+                    estimate.order_lines.add(new_oder_line)
+                estimate.save()
             messages.add_message(
                 request,
                 messages.SUCCESS,
@@ -216,42 +346,73 @@ class GenericSalesActionPDFView(LoginRequiredMixin, View):
             instance = get_object_or_404(self.model, pk=kwargs.get("pk"))
             if not self.request.user.is_superuser and not instance.is_active:
                 return Http404("This page doesn't exist")
-        context = {"object": instance}
         # set the file name
-        if isinstance(instance, Estimate):
-            file_name = (
-                f"filename=Estimate n° {instance.estimate_saler_number:08}"
-            )
-            template_path = "sales/estimate/pdf.html"
-        else:
-            file_name = (
-                f"filename=Invoice n° {instance.invoice_saler_number:08}"
-            )
-            template_path = "sales/invoice/pdf.html"
+        file_name = f"filename={pdf.file_name(instance)}"
+        # serve the cached pdf or render it in the pdf worker pool, a
+        # profiled request always renders it in its own process
+        profiled = hasattr(request, "cpu_profile")
+        cached_pdf = None if profiled else pdf.get_cached_pdf(instance)
+        if cached_pdf is None:
+            try:
+                cached_pdf = pdf.render_pdf(instance, in_process=profiled)
+            except pdf.PDFRenderError as error:
+                # if error then show some funny view
+                return HttpResponse(
+                    "We had some errors <pre>" + error.html + "</pre>"
+                )
+        content_hash, last_modified, content = cached_pdf
+        etag = f'"{content_hash}"'
+        last_modified = int(last_modified.timestamp())
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if not_modified is not None:
+            return not_modified
         # Create a Django response object, and specify content_type as pdf
-        response = HttpResponse(content_type="application/pdf")
+        response = HttpResponse(content, content_type="application/pdf")
         response["Content-Disposition"] = f"as_attachment=False; {file_name}"
-        # find the template and render it.
-        template = get_template(template_path)
-        html = template.render(context)
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        return response
+
 
-        # create a pdf
-        pisa_status = pisa.CreatePDF(
-            html, dest=response, link_callback=link_callback
+class GenericSalesActionExportView(LoginRequiredMixin, View):
+    """Stream a zip of the pdf of the documents of a month and/or a saler"""
+
+    model = None
+
+    def get(self, request, *args, **kwargs):
+        form = SalesActionExportForm(request.GET)
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text())
+        queryset = form.filter(self.model.objects.order_by("date", "id"))
+        if not request.user.is_superuser:
+            queryset = queryset.filter(is_active=True)
+        response = StreamingHttpResponse(
+            pdf.stream_zip(queryset), content_type="application/zip"
         )
-        # if error then show some funny view
-        if pisa_status.err:
-            return HttpResponse("We had some errors <pre>" + html + "</pre>")
+        response[
+            "Content-Disposition"
+        ] = f"attachment; filename={form.archive_name(self.model)}"
         return response
 
 
 class EstimateListView(CoreListView):
     model = Estimate
+    select_related = ("saler", "customer")
     template_name = "sales/estimate/list.html"
+    keyset_pagination = True
+    export_fields = (
+        "id",
+        "estimate_saler_number",
+        *SALES_ACTION_EXPORT_FIELDS,
+        "validity_date",
+    )
 
 
 class EstimateDetailView(CoreDetailView):
     model = Estimate
+    cached_related = ("saler", "customer", "order_lines__item")
     template_name = "sales/estimate/detail.html"
 
 
@@ -279,13 +440,99 @@ class EstimatePDFView(GenericSalesActionPDFView):
     model = Estimate
 
 
+class EstimateExportView(GenericSalesActionExportView):
+    model = Estimate
+
+
+class EstimateConvertView(LoginRequiredMixin, View):
+    """Turn the estimates selected in the list into invoices"""
+
+    def post(self, request, *args, **kwargs):
+        form = EstimateConvertForm(request.POST, user=request.user)
+        if not form.is_valid():
+            messages.add_message(
+                request,
+                messages.WARNING,
+                _("Select the estimates to turn into invoices"),
+            )
+            return redirect("sales:estimate_list")
+        invoices = convert_estimates(
+            form.cleaned_data["estimates"], user=request.user
+        )
+        messages.add_message(
+            request,
+            messages.SUCCESS,
+            _(f"{len(invoices)} invoice(s) were created successfully"),
+        )
+        return redirect("sales:invoice_list")
+
+
+class ImportView(LoginRequiredMixin, FormView):
+    """Create or update the customers or items of a CSV file, the invalid
+    rows are listed with their line and errors"""
+
+    form_class = ImportFileForm
+    template_name = "sales/import.html"
+
+    def get_initial(self):
+        return {"model": self.request.GET.get("model", "customer")}
+
+    def form_valid(self, form):
+        model_name = form.cleaned_data["model"]
+        csv_file = io.TextIOWrapper(
+            form.cleaned_data["file"].file, encoding="utf-8-sig", newline=""
+        )
+        try:
+            # validated in the request, a process pool isn't forked from
+            # the server process
+            result = import_rows(
+                model_name,
+                read_csv(model_name, csv_file),
+                user=self.request.user,
+                workers=0,
+            )
+        except ImportFileError as error:
+            form.add_error("file", str(error))
+            return self.form_invalid(form)
+        except (UnicodeDecodeError, csv.Error):
+            form.add_error("file", _("The file isn't a UTF-8 CSV file"))
+            return self.form_invalid(form)
+        messages.add_message(
+            self.request,
+            messages.SUCCESS,
+            _(
+                f"{result.created} created, {result.updated} updated and "
+                f"{result.reactivated} reactivated"
+            ),
+        )
+        if not result.errors:
+            return redirect(f"sales:{model_name}_list")
+        messages.add_message(
+            self.request,
+            messages.WARNING,
+            _(f"{len(result.errors)} invalid row(s) weren't imported"),
+        )
+        return self.render_to_response(
+            self.get_context_data(form=form, result=result)
+        )
+
+
 class InvoiceListView(CoreListView):
     model = Invoice
+    select_related = ("saler", "customer")
     template_name = "sales/invoice/list.html"
+    keyset_pagination = True
+    export_fields = (
+        "id",
+        "invoice_saler_number",
+        *SALES_ACTION_EXPORT_FIELDS,
+        "is_paid",
+    )
 
 
 class InvoiceDetailView(CoreDetailView):
     model = Invoice
+    cached_related = ("saler", "customer", "order_lines__item")
     template_name = "sales/invoice/detail.html"
 
 
@@ -311,3 +558,7 @@ class InvoiceDeleteView(SuccessMessageMixin, CoreDeleteView):
 
 class InvoicePDFView(GenericSalesActionPDFView):
     model = Invoice
+
+
+class InvoiceExportView(GenericSalesActionExportView):
+    model = Invoice